@@ -0,0 +1,342 @@
+"""Copyright 2021, James S. Wang, All rights reserved."""
+
+from batchsim import BatchBattleSimulator
+from battletables import TABLES
+from cog import Cog, CogCombatant
+from gag import Gag
+from toon import Toon
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+import sys
+
+
+class SweepAxis:
+    """Namespace for the parameters that a sweep can vary.
+
+    Gag and attack axes are given per gag or attack name, and become one
+    column each, such as "gagDamage.Throw".
+    """
+
+    TOON_GAGS: str = "toonGags"
+    NUM_COGS: str = "numCogs"
+    TOON_LAFF: str = "toonLaff"
+    COG_HEALTH: str = "cogHealth"
+    GAG_DAMAGE: str = "gagDamage"
+    GAG_CHANCE_TO_HIT: str = "gagChanceToHit"
+    ATTACK_DAMAGE: str = "attackDamage"
+
+
+class ResultCache:
+    """Stores the result of every sweep point in its own file.
+
+    Args:
+        directory (str): The directory to keep results in.
+
+    Attributes:
+        directory (str): The directory to keep results in.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory: str = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        """Returns the file that the result of a key is kept in.
+
+        Args:
+            key (str): The hash of the point.
+        """
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key: str) -> Optional[dict]:
+        """Returns the cached result of a key, or None if there isn't one.
+
+        Args:
+            key (str): The hash of the point.
+        """
+        try:
+            with open(self.path(key)) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, result: dict) -> None:
+        """Caches the result of a key.
+
+        The result is written to a temporary file first so that an
+        interrupted sweep never leaves a truncated result behind.
+
+        Args:
+            key (str): The hash of the point.
+            result (dict): The result to cache.
+        """
+        path = self.path(key)
+        with open(path + ".tmp", "w") as file:
+            json.dump(result, file)
+        os.replace(path + ".tmp", path)
+
+
+class BalanceSweep:
+    """Runs batches of battles over a grid of balance parameters.
+
+    The grid is described by a spec, in which every axis lists the values to
+    try. Every combination of values is a point of the sweep:
+
+        {
+            "toonGags": [["Throw"], ["Squirt", "Throw"]],
+            "numCogs": [1, 2, 3],
+            "cogHealth": [10, 12],
+            "gagDamage": {"Throw": [5, 6, 7]},
+            "battles": 10000
+        }
+
+    Axes left out of the spec keep the values in the battle tables. The spec
+    may also set battles, maxRounds, seed and randomTargets for every point.
+
+    Each point is keyed by a hash of every parameter that affects it,
+    including the base tables and the simulator's version, and its result is
+    cached under that key. Rerunning a sweep after changing one value only
+    simulates the points that changed.
+
+    Args:
+        spec (dict): The axes and settings of the sweep.
+        cacheDirectory (str): Where to cache results, or None to not cache.
+
+    Attributes:
+        VERSION (int): Changes whenever results are computed differently.
+        spec (dict): The axes and settings of the sweep.
+        cache (ResultCache): The cached results, if caching.
+        battles (int): How many battles to run per point.
+        maxRounds (int): The most rounds to simulate per battle.
+        seed (int): Seed for every point's random number generator.
+        randomTargets (bool): Whether toons pick random living cogs.
+        computed (int): How many points were simulated in the last run.
+        cached (int): How many points came from the cache in the last run.
+    """
+
+    VERSION: int = 1
+
+    def __init__(
+        self, spec: Dict[str, Any], cacheDirectory: Optional[str] = None
+    ) -> None:
+        self.spec: Dict[str, Any] = spec
+        self.cache: Optional[ResultCache] = (
+            None if cacheDirectory is None else ResultCache(cacheDirectory)
+        )
+        self.battles: int = spec.get("battles", 10000)
+        self.maxRounds: int = spec.get("maxRounds", 100)
+        self.seed: int = spec.get("seed", 0)
+        self.randomTargets: bool = spec.get("randomTargets", False)
+        self.computed: int = 0
+        self.cached: int = 0
+
+    def axes(self) -> List[Tuple[str, list]]:
+        """Returns the column name and values of every axis in the spec."""
+        axes = []
+        for axis in (
+            SweepAxis.TOON_GAGS,
+            SweepAxis.NUM_COGS,
+            SweepAxis.TOON_LAFF,
+            SweepAxis.COG_HEALTH,
+        ):
+            if axis in self.spec:
+                axes.append((axis, list(self.spec[axis])))
+        for axis in (
+            SweepAxis.GAG_DAMAGE,
+            SweepAxis.GAG_CHANCE_TO_HIT,
+            SweepAxis.ATTACK_DAMAGE,
+        ):
+            for name, values in self.spec.get(axis, {}).items():
+                axes.append((f"{axis}.{name}", list(values)))
+        return axes
+
+    def points(self) -> List[Dict[str, Any]]:
+        """Returns every point of the grid, as a column name to value dict."""
+        axes = self.axes()
+        names = [name for name, _ in axes]
+        return [
+            dict(zip(names, values))
+            for values in itertools.product(*(values for _, values in axes))
+        ]
+
+    def parameters(self, point: Dict[str, Any]) -> Dict[str, Any]:
+        """Resolves a point into every parameter of its simulation.
+
+        Args:
+            point (dict): The point, as returned by points().
+
+        Returns:
+            dict: The keyword arguments of BatchBattleSimulator, with the
+                gags and attacks replaced by their IDs.
+        """
+        parameters = {
+            "toonGags": [
+                TABLES.gagId(gag)
+                for gag in point.get(SweepAxis.TOON_GAGS, ["Throw"])
+            ],
+            "numCogs": point.get(SweepAxis.NUM_COGS, 1),
+            "toonLaff": point.get(SweepAxis.TOON_LAFF, Toon().laff),
+            "cogHealth": point.get(SweepAxis.COG_HEALTH, Cog().health),
+            "randomTargets": self.randomTargets,
+            "seed": self.seed,
+            "gagDamage": {},
+            "gagChanceToHit": {},
+            "attackDamage": {},
+        }
+        cogType = TABLES.cogType(Cog.DEFAULT_SUIT, 1)
+        for column, value in point.items():
+            axis, _, name = column.partition(".")
+            if axis in (SweepAxis.GAG_DAMAGE, SweepAxis.GAG_CHANCE_TO_HIT):
+                parameters[axis][TABLES.gagId(name)] = value
+            elif axis == SweepAxis.ATTACK_DAMAGE:
+                parameters[axis][TABLES.cogAttackId(cogType, name)] = value
+        return parameters
+
+    def pointKey(self, parameters: Dict[str, Any]) -> str:
+        """Hashes everything that affects the result of a point.
+
+        Args:
+            parameters (dict): The resolved parameters of the point.
+        """
+        keyed = {
+            "version": (self.VERSION, BatchBattleSimulator.VERSION),
+            "battles": self.battles,
+            "maxRounds": self.maxRounds,
+            "gagTables": [list(Gag.DAMAGE), list(Gag.CHANCE_TO_HIT)],
+            "attackTables": [
+                [CogCombatant.DAMAGE[a] for a in CogCombatant.ATTACKS],
+                [CogCombatant.CHANCE_TO_HIT[a] for a in CogCombatant.ATTACKS],
+            ],
+            "parameters": parameters,
+        }
+        encoded = json.dumps(keyed, sort_keys=True).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def run(self, maxWorkers: Optional[int] = 1) -> List[Dict[str, Any]]:
+        """Runs every point that isn't cached yet.
+
+        Args:
+            maxWorkers (int): How many processes to simulate points in.
+                Defaults to 1, which simulates in this process; None uses the
+                number of CPUs.
+
+        Returns:
+            list of dict: A row for every point, holding its columns and the
+                toonWinRate, cogWinRate and meanRounds of its battles.
+        """
+        points = self.points()
+        rows: List[Optional[dict]] = [None] * len(points)
+        pending = []
+        for i, point in enumerate(points):
+            parameters = self.parameters(point)
+            key = self.pointKey(parameters)
+            result = None if self.cache is None else self.cache.get(key)
+            if result is None:
+                pending.append((i, key, parameters))
+            else:
+                rows[i] = dict(point, **result)
+        self.cached = len(points) - len(pending)
+        self.computed = len(pending)
+
+        work = [
+            (parameters, self.battles, self.maxRounds)
+            for _, _, parameters in pending
+        ]
+        if maxWorkers == 1:
+            results = map(runPoint, work)
+        else:
+            # Imported here so that serial runs don't pay for
+            # multiprocessing.
+            from concurrent.futures import ProcessPoolExecutor
+
+            executor = ProcessPoolExecutor(maxWorkers)
+            results = executor.map(runPoint, work)
+        try:
+            for (i, key, _), result in zip(pending, results):
+                if self.cache is not None:
+                    self.cache.put(key, result)
+                rows[i] = dict(points[i], **result)
+        finally:
+            if maxWorkers != 1:
+                executor.shutdown()
+        return rows
+
+
+def runPoint(work: Tuple[Dict[str, Any], int, int]) -> Dict[str, float]:
+    """Simulates the battles of a single point.
+
+    Args:
+        work (tuple): The resolved parameters of the point, how many battles
+            to run and the most rounds per battle.
+
+    Returns:
+        dict of str to float: The toonWinRate, cogWinRate and meanRounds.
+    """
+    parameters, battles, maxRounds = work
+    simulator = BatchBattleSimulator(
+        parameters["toonGags"],
+        parameters["numCogs"],
+        toonLaff=parameters["toonLaff"],
+        cogHealth=parameters["cogHealth"],
+        randomTargets=parameters["randomTargets"],
+        seed=parameters["seed"],
+        gagDamage=parameters["gagDamage"],
+        gagChanceToHit=parameters["gagChanceToHit"],
+        attackDamage=parameters["attackDamage"],
+    )
+    result = simulator.simulate(battles, maxRounds)
+    return {
+        "toonWinRate": result.toonWinRate(),
+        "cogWinRate": result.cogWinRate(),
+        "meanRounds": float(result.rounds.mean()),
+    }
+
+
+def writeTable(rows: List[Dict[str, Any]], file: TextIO) -> None:
+    """Writes the rows of a sweep as CSV.
+
+    Args:
+        rows (list of dict): The rows returned by BalanceSweep.run().
+        file (TextIO): The file to write to.
+    """
+    if not rows:
+        return
+    writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(
+            {
+                column: "+".join(value) if isinstance(value, list) else value
+                for column, value in row.items()
+            }
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Sweeps balance parameters over batches of battles."
+    )
+    parser.add_argument("spec", help="JSON file describing the grid.")
+    parser.add_argument("--output", help="Write the CSV table to this file.")
+    parser.add_argument("--cache", default=".sweepcache")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    with open(args.spec) as file:
+        spec = json.load(file)
+    sweep = BalanceSweep(spec, None if args.no_cache else args.cache)
+    rows = sweep.run(args.workers)
+    if args.output:
+        with open(args.output, "w", newline="") as file:
+            writeTable(rows, file)
+    else:
+        writeTable(rows, sys.stdout)
+    print(
+        f"{sweep.computed} points simulated, {sweep.cached} from cache",
+        file=sys.stderr,
+    )
@@ -0,0 +1,311 @@
+"""Copyright 2021, James S. Wang, All rights reserved."""
+
+from cog import Cog, CogCombatant
+from gag import Gag
+from toon import Toon
+from typing import Dict, List, Optional
+import numpy as np
+
+
+class BatchOutcome:
+    """Namespace for the outcomes stored in a BatchResult."""
+
+    ONGOING: int = 0
+    TOONS_WON: int = 1
+    COGS_WON: int = 2
+
+
+class BatchResult:
+    """The outcomes of a batch of simulated battles.
+
+    Args:
+        outcomes (ndarray of int8): One of the constants in BatchOutcome for
+            each battle.
+        rounds (ndarray of int32): How many rounds each battle lasted.
+
+    Attributes:
+        outcomes (ndarray of int8): One of the constants in BatchOutcome for
+            each battle.
+        rounds (ndarray of int32): How many rounds each battle lasted.
+    """
+
+    def __init__(self, outcomes: np.ndarray, rounds: np.ndarray) -> None:
+        self.outcomes: np.ndarray = outcomes
+        self.rounds: np.ndarray = rounds
+
+    def __len__(self) -> int:
+        return len(self.outcomes)
+
+    def toonWinRate(self) -> float:
+        """Returns the fraction of battles that the toons won."""
+        return float(np.mean(self.outcomes == BatchOutcome.TOONS_WON))
+
+    def cogWinRate(self) -> float:
+        """Returns the fraction of battles that the cogs won."""
+        return float(np.mean(self.outcomes == BatchOutcome.COGS_WON))
+
+    def roundsHistogram(self, outcome: Optional[int] = None) -> Dict[int, int]:
+        """Counts how many battles finished after each number of rounds.
+
+        Args:
+            outcome (int): If given, only count battles with this outcome.
+
+        Returns:
+            dict of int to int: Maps number of rounds to number of battles.
+        """
+        rounds = self.rounds
+        if outcome is not None:
+            rounds = rounds[self.outcomes == outcome]
+        counts = np.bincount(rounds)
+        return {i: int(c) for i, c in enumerate(counts) if c}
+
+
+class BatchBattleSimulator:
+    """Simulates many independent battles at once over NumPy arrays.
+
+    Every battle keeps its combatants in fixed slots, so health, selected gags,
+    targets, and alive masks are stored as (battles x slots) arrays that are
+    advanced together each round. The rules mirror BattleEngine: toons with
+    the same gag share a single hit roll, the hit chance is capped at 95%,
+    each cog rolls one attack that decides both its chance to hit and its
+    damage, and cogs pick their targets from the toons that were alive when
+    they started attacking. Joins are not simulated.
+
+    Args:
+        toonGags (list of int): The gag that each toon selects every round.
+        numCogs (int): How many cogs are in each battle.
+        toonLaff (int): Starting laff of each toon. Defaults to Toon's laff.
+        cogHealth (int): Starting health of each cog. Defaults to Cog's
+            health.
+        randomTargets (bool): Whether toons pick a random living cog as their
+            target instead of the first living cog.
+        seed (int): Seed for the random number generator.
+        gagDamage (dict of int to int): Replaces the damage of some gags.
+        gagChanceToHit (dict of int to float): Replaces the chance to hit of
+            some gags.
+        attackDamage (dict of int to int): Replaces the damage of some cog
+            attacks.
+
+    Attributes:
+        VERSION (int): Changes whenever the simulation's rules change, so
+            cached results can be thrown out.
+        toonGags (ndarray of int): The gag that each toon selects every round.
+        numCogs (int): How many cogs are in each battle.
+        toonLaff (int): Starting laff of each toon.
+        cogHealth (int): Starting health of each cog.
+        randomTargets (bool): Whether toons pick random living cogs.
+        rng (Generator): The random number generator used for all rolls.
+        gagDamage (dict of int to int): Replaced gag damage.
+        gagChanceToHit (dict of int to float): Replaced gag chances to hit.
+        attackDamage (dict of int to int): Replaced cog attack damage.
+    """
+
+    VERSION: int = 2
+
+    def __init__(
+        self,
+        toonGags: List[int],
+        numCogs: int,
+        toonLaff: Optional[int] = None,
+        cogHealth: Optional[int] = None,
+        randomTargets: bool = False,
+        seed: Optional[int] = None,
+        gagDamage: Optional[Dict[int, int]] = None,
+        gagChanceToHit: Optional[Dict[int, float]] = None,
+        attackDamage: Optional[Dict[int, int]] = None,
+    ) -> None:
+        self.toonGags: np.ndarray = np.asarray(toonGags, dtype=np.int8)
+        self.numCogs: int = numCogs
+        self.toonLaff: int = Toon().laff if toonLaff is None else toonLaff
+        self.cogHealth: int = Cog().health if cogHealth is None else cogHealth
+        self.randomTargets: bool = randomTargets
+        self.rng: np.random.Generator = np.random.default_rng(seed)
+        self.gagDamage: Dict[int, int] = dict(gagDamage or {})
+        self.gagChanceToHit: Dict[int, float] = dict(gagChanceToHit or {})
+        self.attackDamage: Dict[int, int] = dict(attackDamage or {})
+
+    def simulate(
+        self, numBattles: int, maxRounds: int = 100, chunkSize: int = 100000
+    ) -> BatchResult:
+        """Simulates a number of battles to completion.
+
+        Battles that haven't finished after maxRounds are left as ongoing.
+
+        Args:
+            numBattles (int): How many battles to simulate.
+            maxRounds (int): The most rounds to simulate per battle.
+            chunkSize (int): How many battles to keep in memory at once.
+
+        Returns:
+            BatchResult: The outcome and length of every battle.
+        """
+        outcomes = np.empty(numBattles, dtype=np.int8)
+        rounds = np.empty(numBattles, dtype=np.int32)
+        for start in range(0, numBattles, chunkSize):
+            end = min(start + chunkSize, numBattles)
+            outcomes[start:end], rounds[start:end] = self.simulateChunk(
+                end - start, maxRounds
+            )
+        return BatchResult(outcomes, rounds)
+
+    def simulateChunk(self, numBattles: int, maxRounds: int) -> tuple:
+        """Simulates a chunk of battles that fit in memory together.
+
+        Args:
+            numBattles (int): How many battles to simulate.
+            maxRounds (int): The most rounds to simulate per battle.
+
+        Returns:
+            tuple of ndarray: The outcomes and rounds of the battles.
+        """
+        numToons = len(self.toonGags)
+        toonHealth = np.full((numBattles, numToons), self.toonLaff, np.int32)
+        cogHealth = np.full(
+            (numBattles, self.numCogs), self.cogHealth, np.int32
+        )
+        outcomes = np.zeros(numBattles, dtype=np.int8)
+        rounds = np.zeros(numBattles, dtype=np.int32)
+        active = np.arange(numBattles)
+
+        gagDamage, gagChance = self.gagTables()
+        attackDamage, attackChance = self.attackTables()
+
+        for _ in range(maxRounds):
+            if len(active) == 0:
+                break
+            toons = toonHealth[active]
+            cogs = cogHealth[active]
+            rounds[active] += 1
+
+            cogs = self.executeGags(toons > 0, cogs, gagDamage, gagChance)
+            toonsWon = ~(cogs > 0).any(axis=1)
+            toons = self.attackToons(
+                toons, cogs > 0, attackDamage, attackChance
+            )
+            cogsWon = ~toonsWon & ~(toons > 0).any(axis=1)
+
+            toonHealth[active] = toons
+            cogHealth[active] = cogs
+            outcomes[active[toonsWon]] = BatchOutcome.TOONS_WON
+            outcomes[active[cogsWon]] = BatchOutcome.COGS_WON
+            active = active[~(toonsWon | cogsWon)]
+        return outcomes, rounds
+
+    def executeGags(
+        self,
+        toonAlive: np.ndarray,
+        cogHealth: np.ndarray,
+        gagDamage: np.ndarray,
+        gagChance: np.ndarray,
+    ) -> np.ndarray:
+        """Executes every toon's gag in every battle.
+
+        Args:
+            toonAlive (ndarray of bool): Which toons are alive.
+            cogHealth (ndarray of int): Health of every cog.
+            gagDamage (ndarray of int): Damage of each gag.
+            gagChance (ndarray of float): Capped chance to hit of each gag.
+
+        Returns:
+            ndarray of int: Health of every cog after the gags are executed.
+        """
+        numBattles = len(cogHealth)
+        targets = self.selectTargets(cogHealth > 0)
+        rows = np.arange(numBattles)
+        for gag in Gag.EXECUTE_ORDER:
+            attacking = toonAlive & (self.toonGags == gag)
+            if not attacking.any():
+                continue
+            isHit = self.rng.random(numBattles) < gagChance[gag]
+            cogAlive = cogHealth > 0
+            for slot in np.flatnonzero(self.toonGags == gag):
+                target = targets[:, slot]
+                hits = attacking[:, slot] & isHit & cogAlive[rows, target]
+                cogHealth[rows[hits], target[hits]] -= gagDamage[gag]
+        return cogHealth
+
+    def selectTargets(self, cogAlive: np.ndarray) -> np.ndarray:
+        """Selects a living cog for every toon in every battle.
+
+        Args:
+            cogAlive (ndarray of bool): Which cogs are alive.
+
+        Returns:
+            ndarray of int: The cog slot that each toon targets.
+        """
+        numToons = len(self.toonGags)
+        if not self.randomTargets:
+            target = np.argmax(cogAlive, axis=1)
+            return np.repeat(target[:, None], numToons, axis=1)
+        keys = self.rng.random((len(cogAlive), numToons, self.numCogs))
+        keys[~np.broadcast_to(cogAlive[:, None, :], keys.shape)] = -1
+        return np.argmax(keys, axis=2)
+
+    def attackToons(
+        self,
+        toonHealth: np.ndarray,
+        cogAlive: np.ndarray,
+        attackDamage: np.ndarray,
+        attackChance: np.ndarray,
+    ) -> np.ndarray:
+        """Lets every living cog attack a random living toon.
+
+        Args:
+            toonHealth (ndarray of int): Laff of every toon.
+            cogAlive (ndarray of bool): Which cogs are alive.
+            attackDamage (ndarray of int): Damage of each cog attack.
+            attackChance (ndarray of float): Chance to hit of each cog attack.
+
+        Returns:
+            ndarray of int: Laff of every toon after the cogs attack.
+        """
+        numBattles, numToons = toonHealth.shape
+        shape = (numBattles, self.numCogs)
+        numAttacks = len(attackDamage)
+        attack = self.rng.integers(0, numAttacks, shape)
+        isHit = cogAlive & (self.rng.random(shape) < attackChance[attack])
+
+        keys = self.rng.random((numBattles, self.numCogs, numToons))
+        toonAlive = np.broadcast_to((toonHealth > 0)[:, None, :], keys.shape)
+        keys[~toonAlive] = -1
+        targets = np.argmax(keys, axis=2)
+
+        damage = np.where(isHit, attackDamage[attack], 0)
+        rows = np.repeat(np.arange(numBattles), self.numCogs)
+        np.subtract.at(toonHealth, (rows, targets.ravel()), damage.ravel())
+        return toonHealth
+
+    def gagTables(self) -> tuple:
+        """Builds gag lookup arrays indexed by gag from the Gag class and any
+        replaced values.
+
+        Returns:
+            tuple of ndarray: The damage and capped chance to hit of each gag.
+        """
+        damage = np.array(Gag.DAMAGE, dtype=np.int32)
+        chance = np.array(Gag.CHANCE_TO_HIT)
+        for gag, value in self.gagDamage.items():
+            damage[gag] = value
+        for gag, value in self.gagChanceToHit.items():
+            chance[gag] = value
+        return damage, np.minimum(0.95, chance)
+
+    def attackTables(self) -> tuple:
+        """Builds cog attack lookup arrays from the CogCombatant class and
+        any replaced values.
+
+        Returns:
+            tuple of ndarray: The damage and chance to hit of each attack.
+        """
+        damage = np.array(
+            [
+                self.attackDamage.get(a, CogCombatant.DAMAGE[a])
+                for a in CogCombatant.ATTACKS
+            ],
+            dtype=np.int32,
+        )
+        chance = np.array(
+            [CogCombatant.CHANCE_TO_HIT[a] for a in CogCombatant.ATTACKS],
+            dtype=np.float64,
+        )
+        return damage, chance
@@ -0,0 +1,581 @@
+"""Copyright 2021, James S. Wang, All rights reserved."""
+
+from battleengine import CogBattleState
+from battlefarm import BattleFarm, BattleShard, runShard
+from battlelog import (
+    BattleEvent,
+    BattleEventSink,
+    BattleEventSubject,
+    BattleEventType,
+)
+from battletables import TABLES
+from cog import CogCombatant
+from gag import Gag
+from replay import (
+    EVENT_RECORD_TYPES,
+    STATES,
+    SUBJECTS,
+    ReplayReader,
+    ReplayRecordType,
+)
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import argparse
+import json
+import math
+
+
+class RunningStats:
+    """The count, mean, variance and range of a stream of values, kept with
+    Welford's algorithm so the values themselves are never stored.
+
+    Attributes:
+        count (int): How many values were added.
+        mean (float): The mean of the values.
+        m2 (float): The sum of squared differences from the mean.
+        min (float): The smallest value, or inf if there are none.
+        max (float): The largest value, or -inf if there are none.
+    """
+
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self) -> None:
+        self.count: int = 0
+        self.mean: float = 0.0
+        self.m2: float = 0.0
+        self.min: float = math.inf
+        self.max: float = -math.inf
+
+    def add(self, value: float) -> None:
+        """Adds a value.
+
+        Args:
+            value (float): The value.
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "RunningStats") -> None:
+        """Adds the values of another stream, as if they had been added here.
+
+        Args:
+            other (RunningStats): The statistics to add.
+        """
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def variance(self) -> float:
+        """Returns the sample variance of the values."""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def stddev(self) -> float:
+        """Returns the sample standard deviation of the values."""
+        return math.sqrt(self.variance())
+
+
+class QuantileDigest:
+    """Estimates the quantiles of a stream of values in constant memory.
+
+    This is a merging t-digest: values are buffered, then merged into a
+    sorted list of weighted centroids. The arcsine scale keeps centroids
+    near the tails small, so extreme quantiles stay accurate, while the
+    middle of the distribution is summarized by a few large centroids.
+    Digests of separate streams merge the same way.
+
+    Args:
+        compression (int): Bounds the number of centroids. Higher is more
+            accurate and uses more memory.
+
+    Attributes:
+        BUFFER_FACTOR (int): How many values, per unit of compression, to
+            buffer before merging.
+        compression (int): Bounds the number of centroids.
+        centroids (list of tuple): The (mean, weight) of every centroid,
+            sorted by mean.
+        buffer (list of tuple): The (mean, weight) of values and centroids
+            that haven't been merged yet.
+        count (float): The total weight of every value added.
+        min (float): The smallest value, or inf if there are none.
+        max (float): The largest value, or -inf if there are none.
+    """
+
+    BUFFER_FACTOR: int = 5
+
+    def __init__(self, compression: int = 100) -> None:
+        self.compression: int = compression
+        self.centroids: List[Tuple[float, float]] = []
+        self.buffer: List[Tuple[float, float]] = []
+        self.count: float = 0.0
+        self.min: float = math.inf
+        self.max: float = -math.inf
+
+    def add(self, value: float, weight: float = 1.0) -> None:
+        """Adds a value.
+
+        Args:
+            value (float): The value.
+            weight (float): How many times to count the value.
+        """
+        self.buffer.append((value, weight))
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self.buffer) >= self.BUFFER_FACTOR * self.compression:
+            self.compress()
+
+    def merge(self, other: "QuantileDigest") -> None:
+        """Adds the values of another digest.
+
+        Args:
+            other (QuantileDigest): The digest to add.
+        """
+        self.buffer.extend(other.centroids)
+        self.buffer.extend(other.buffer)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.compress()
+
+    def nextLimit(self, q: float) -> float:
+        """Returns the highest quantile that a centroid starting at quantile
+        q can reach, so that it spans one unit of the arcsine scale.
+
+        Args:
+            q (float): Where the centroid starts, from 0 to 1.
+        """
+        k = math.asin(2 * q - 1) + 2 * math.pi / self.compression
+        return (math.sin(min(k, math.pi / 2)) + 1) / 2
+
+    def compress(self) -> None:
+        """Merges the buffer into the centroids."""
+        if not self.buffer:
+            return
+        points = sorted(self.centroids + self.buffer)
+        self.buffer = []
+        centroids = []
+        mean, weight = points[0]
+        before = 0.0
+        limit = self.count * self.nextLimit(0.0)
+        for pointMean, pointWeight in points[1:]:
+            if before + weight + pointWeight <= limit:
+                weight += pointWeight
+                mean += (pointMean - mean) * pointWeight / weight
+            else:
+                centroids.append((mean, weight))
+                before += weight
+                limit = self.count * self.nextLimit(before / self.count)
+                mean, weight = pointMean, pointWeight
+        centroids.append((mean, weight))
+        self.centroids = centroids
+
+    def quantile(self, q: float) -> float:
+        """Estimates a quantile of the values.
+
+        Args:
+            q (float): The quantile, from 0 to 1.
+
+        Returns:
+            float: The estimate, or nan if there are no values.
+        """
+        self.compress()
+        if not self.centroids:
+            return math.nan
+        target = q * self.count
+        before = 0.0
+        previousCenter, previousMean = 0.0, self.min
+        for mean, weight in self.centroids:
+            center = before + weight / 2
+            if target < center:
+                if center == previousCenter:
+                    return mean
+                fraction = (target - previousCenter) / (
+                    center - previousCenter
+                )
+                return previousMean + fraction * (mean - previousMean)
+            before += weight
+            previousCenter, previousMean = center, mean
+        if self.count == previousCenter:
+            return self.max
+        fraction = (target - previousCenter) / (self.count - previousCenter)
+        return previousMean + fraction * (self.max - previousMean)
+
+
+class CountHistogram:
+    """Counts how often each small non-negative integer comes up, in a fixed
+    number of buckets.
+
+    Args:
+        maxValue (int): The largest value with its own bucket. Larger values
+            are counted in one overflow bucket.
+
+    Attributes:
+        counts (list of int): The count of each value from 0 to maxValue,
+            followed by the overflow bucket.
+    """
+
+    def __init__(self, maxValue: int = 64) -> None:
+        self.counts: List[int] = [0] * (maxValue + 2)
+
+    def add(self, value: int) -> None:
+        """Counts a value.
+
+        Args:
+            value (int): The value.
+        """
+        self.counts[min(value, len(self.counts) - 1)] += 1
+
+    def merge(self, other: "CountHistogram") -> None:
+        """Adds the counts of another histogram with the same buckets.
+
+        Args:
+            other (CountHistogram): The histogram to add.
+        """
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+
+    def toDict(self) -> Dict[str, int]:
+        """Returns the non-empty buckets, with the overflow bucket as
+        "<maxValue + 1>+"."""
+        last = len(self.counts) - 1
+        return {
+            f"{i}+" if i == last else str(i): count
+            for i, count in enumerate(self.counts)
+            if count
+        }
+
+
+class DamageStats:
+    """How much a gag track or cog attack was used and how much damage it
+    dealt.
+
+    Attributes:
+        uses (int): How many times it was rolled for a hit.
+        hits (int): How many of those rolls hit.
+        damage (int): The total damage it dealt.
+    """
+
+    __slots__ = ("uses", "hits", "damage")
+
+    def __init__(self) -> None:
+        self.uses: int = 0
+        self.hits: int = 0
+        self.damage: int = 0
+
+    def merge(self, other: "DamageStats") -> None:
+        """Adds the uses, hits and damage of another group of battles.
+
+        Args:
+            other (DamageStats): The statistics to add.
+        """
+        self.uses += other.uses
+        self.hits += other.hits
+        self.damage += other.damage
+
+
+class BattleAnalytics(BattleEventSink):
+    """Summarizes a stream of battles in a single pass.
+
+    The analytics are an event sink, so they can watch live battles, and
+    recorded battles can be fed to them with consume(). Events must arrive
+    one battle after another: a battle starts with its START event and is
+    counted once it reaches TOONS_WON or COGS_WON. Damage is credited to the
+    gag track or cog attack that hit last. Every statistic takes the same
+    memory however many battles are added, and analytics of separate shards
+    can be merged.
+
+    Args:
+        compression (int): The compression of the laff loss digest.
+        maxRounds (int): The most rounds the rounds histograms count
+            separately.
+
+    Attributes:
+        battles (int): How many battles ended.
+        toonWins (int): How many battles the toons won.
+        unfinished (int): How many battles started without ending.
+        roundsToWin (dict of str to CountHistogram): The rounds that battles
+            lasted, for each of TOONS_WON and COGS_WON.
+        laffLoss (RunningStats): The laff the toons of each battle lost.
+        laffLossDigest (QuantileDigest): The quantiles of laffLoss.
+        gagTracks (dict of int to DamageStats): The damage of each gag track.
+        cogAttacks (dict of int to DamageStats): The damage of each attack.
+        inBattle (bool): Whether a battle has started and not ended yet.
+        rounds (int): The rounds of the current battle so far.
+        laffLost (int): The laff lost by the current battle's toons so far.
+        lastHit (DamageStats): Whatever hit last in the current battle.
+    """
+
+    def __init__(self, compression: int = 100, maxRounds: int = 64) -> None:
+        self.battles: int = 0
+        self.toonWins: int = 0
+        self.unfinished: int = 0
+        self.roundsToWin: Dict[str, CountHistogram] = {
+            CogBattleState.TOONS_WON: CountHistogram(maxRounds),
+            CogBattleState.COGS_WON: CountHistogram(maxRounds),
+        }
+        self.laffLoss: RunningStats = RunningStats()
+        self.laffLossDigest: QuantileDigest = QuantileDigest(compression)
+        self.gagTracks: Dict[int, DamageStats] = {}
+        self.cogAttacks: Dict[int, DamageStats] = {}
+        self.inBattle: bool = False
+        self.rounds: int = 0
+        self.laffLost: int = 0
+        self.lastHit: Optional[DamageStats] = None
+
+    def emit(
+        self,
+        eventType: str,
+        subject: str,
+        index: Optional[int] = None,
+        value: Any = None,
+    ) -> None:
+        if eventType == BattleEventType.DAMAGE:
+            if subject == BattleEventSubject.TOON:
+                self.laffLost += value
+            if self.lastHit is not None:
+                self.lastHit.damage += value
+        elif eventType in (BattleEventType.HIT, BattleEventType.MISS):
+            if subject == BattleEventSubject.TOON:
+                stats = self.gagTracks.setdefault(
+                    Gag.TRACK[value], DamageStats()
+                )
+            else:
+                stats = self.cogAttacks.setdefault(value, DamageStats())
+            stats.uses += 1
+            if eventType == BattleEventType.HIT:
+                stats.hits += 1
+                self.lastHit = stats
+            else:
+                self.lastHit = None
+        elif eventType == BattleEventType.STATE:
+            if value == CogBattleState.GAG_SELECT:
+                self.rounds += 1
+            elif value in self.roundsToWin and self.inBattle:
+                self.endBattle(value)
+        elif eventType == BattleEventType.START:
+            if self.inBattle:
+                self.unfinished += 1
+            self.inBattle = True
+            self.rounds = 0
+            self.laffLost = 0
+            self.lastHit = None
+
+    def endBattle(self, outcome: str) -> None:
+        """Counts the current battle.
+
+        Args:
+            outcome (str): CogBattleState.TOONS_WON or COGS_WON.
+        """
+        self.inBattle = False
+        self.battles += 1
+        if outcome == CogBattleState.TOONS_WON:
+            self.toonWins += 1
+        self.roundsToWin[outcome].add(self.rounds)
+        self.laffLoss.add(self.laffLost)
+        self.laffLossDigest.add(self.laffLost)
+
+    def consume(self, events: Iterable[BattleEvent]) -> None:
+        """Adds recorded events, such as those of readEventLog().
+
+        Args:
+            events (iterable of BattleEvent): The events, in order.
+        """
+        emit = self.emit
+        for event in events:
+            emit(*event)
+
+    def merge(self, other: "BattleAnalytics") -> None:
+        """Adds the battles of another shard. Battles that either shard is
+        still in the middle of aren't merged.
+
+        Args:
+            other (BattleAnalytics): The analytics to add.
+        """
+        self.battles += other.battles
+        self.toonWins += other.toonWins
+        self.unfinished += other.unfinished
+        for outcome, histogram in other.roundsToWin.items():
+            self.roundsToWin[outcome].merge(histogram)
+        self.laffLoss.merge(other.laffLoss)
+        self.laffLossDigest.merge(other.laffLossDigest)
+        for mine, theirs in (
+            (self.gagTracks, other.gagTracks),
+            (self.cogAttacks, other.cogAttacks),
+        ):
+            for key, stats in theirs.items():
+                mine.setdefault(key, DamageStats()).merge(stats)
+
+    def toonWinRate(self) -> float:
+        """Returns the fraction of battles that the toons won."""
+        return self.toonWins / self.battles if self.battles else 0.0
+
+    def summary(self) -> dict:
+        """Returns every statistic as a dict that can be written as JSON."""
+        digest = self.laffLossDigest
+        return {
+            "battles": self.battles,
+            "unfinished": self.unfinished,
+            "toonWinRate": self.toonWinRate(),
+            "roundsToWin": {
+                outcome: histogram.toDict()
+                for outcome, histogram in self.roundsToWin.items()
+            },
+            "laffLoss": {
+                "mean": self.laffLoss.mean,
+                "stddev": self.laffLoss.stddev(),
+                "p50": digest.quantile(0.5),
+                "p90": digest.quantile(0.9),
+                "p99": digest.quantile(0.99),
+                "max": self.laffLoss.max if self.battles else 0,
+            },
+            "gagTracks": describeDamage(self.gagTracks, TABLES.gagTracks),
+            "cogAttacks": describeDamage(self.cogAttacks, CogCombatant.NAME),
+        }
+
+
+def describeDamage(
+    stats: Dict[int, DamageStats], names: List[str]
+) -> Dict[str, dict]:
+    """Describes the damage of each gag track or cog attack, with its share
+    of the damage dealt by every track or attack.
+
+    Args:
+        stats (dict of int to DamageStats): The statistics, by ID.
+        names (list of str): The name of each ID.
+    """
+    total = sum(entry.damage for entry in stats.values())
+    return {
+        names[key]: {
+            "uses": entry.uses,
+            "hits": entry.hits,
+            "damage": entry.damage,
+            "share": entry.damage / total if total else 0.0,
+        }
+        for key, entry in sorted(stats.items())
+    }
+
+
+def readEventLog(path: str) -> Iterator[BattleEvent]:
+    """Yields the events of a log written by FileEventSink.
+
+    Args:
+        path (str): The path of the log.
+    """
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                yield BattleEvent(*json.loads(line))
+
+
+def readReplayEvents(path: str) -> Iterator[BattleEvent]:
+    """Yields the events recorded in a replay.
+
+    Args:
+        path (str): The path of the replay.
+    """
+    eventTypes = {
+        recordType: eventType
+        for eventType, recordType in EVENT_RECORD_TYPES.items()
+    }
+    with ReplayReader(path) as reader:
+        for record in reader.records():
+            eventType = eventTypes.get(record.recordType)
+            if eventType is None:
+                continue
+            value: Any = int(record.value)
+            if record.recordType == ReplayRecordType.STATE:
+                value = STATES[value]
+            yield BattleEvent(
+                eventType,
+                SUBJECTS[record.subject],
+                None if record.index < 0 else record.index,
+                value,
+            )
+
+
+def analyzeShard(shard: BattleShard) -> BattleAnalytics:
+    """Plays every battle in a farm's shard and summarizes them.
+
+    Args:
+        shard (BattleShard): The shard to play.
+
+    Returns:
+        BattleAnalytics: The analytics of the shard's battles.
+    """
+    analytics = BattleAnalytics()
+    runShard(shard, analytics)
+    return analytics
+
+
+def analyzeFarm(
+    farm: BattleFarm, numBattles: int, maxWorkers: Optional[int] = None
+) -> BattleAnalytics:
+    """Plays a farm's battles and merges the analytics of its shards.
+
+    Args:
+        farm (BattleFarm): The farm describing the battles.
+        numBattles (int): How many battles to play in total.
+        maxWorkers (int): How many processes to use. Defaults to the number
+            of CPUs; 1 plays every shard in this process.
+
+    Returns:
+        BattleAnalytics: The merged analytics of every shard.
+    """
+    shards = farm.shards(numBattles)
+    analytics = BattleAnalytics()
+    if maxWorkers == 1:
+        for shard in shards:
+            analytics.merge(analyzeShard(shard))
+        return analytics
+    # Imported here so that serial runs don't pay for multiprocessing.
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(maxWorkers) as executor:
+        for shardAnalytics in executor.map(analyzeShard, shards):
+            analytics.merge(shardAnalytics)
+    return analytics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Summarizes battles from event logs, replays, or "
+        "simulation."
+    )
+    parser.add_argument(
+        "logs", nargs="*", help="Event logs written by FileEventSink."
+    )
+    parser.add_argument(
+        "--replay", action="append", default=[], help="A replay to read."
+    )
+    parser.add_argument(
+        "--simulate", type=int, default=0, help="How many battles to play."
+    )
+    parser.add_argument("--gags", nargs="+", default=["Throw", "Squirt"])
+    parser.add_argument("--cogs", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    analytics = BattleAnalytics()
+    for path in args.logs:
+        analytics.consume(readEventLog(path))
+    for path in args.replay:
+        analytics.consume(readReplayEvents(path))
+    if args.simulate:
+        farm = BattleFarm(
+            [TABLES.gagId(name) for name in args.gags],
+            args.cogs,
+            args.seed,
+            randomTargets=True,
+        )
+        analytics.merge(analyzeFarm(farm, args.simulate, args.workers))
+    print(json.dumps(analytics.summary(), indent=2))
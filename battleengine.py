@@ -0,0 +1,910 @@
+"""Copyright 2021, James S. Wang, All rights reserved."""
+
+from battlelog import (
+    BattleEventSink,
+    BattleEventSubject,
+    BattleEventType,
+    NullEventSink,
+)
+from cog import Cog, CogCombatant
+from cogstrategy import CogStrategy, RandomStrategy, ThreatTable
+from combatant import removeDefeated
+from battlerng import CounterRng
+from battletables import TABLES
+from gag import Gag
+from joinqueue import JoinQueue
+from toon import Toon, ToonCombatant
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+import random
+import struct
+
+
+class CogBattleState:
+    """Namespace for the different states possible in a cog battle."""
+
+    OFF: str = "Off"
+    GAG_SELECT: str = "GagSelect"
+    GAG_EXECUTE: str = "GagExecute"
+    COGS_ATTACK: str = "CogsAttack"
+    TOONS_WON: str = "ToonsWon"
+    COGS_WON: str = "CogsWon"
+
+
+class BattleActionType:
+    """Namespace for the different actions that can be applied to a battle."""
+
+    SELECT_GAG: str = "SelectGag"
+    SELECT_TARGET: str = "SelectTarget"
+    TOON_JOIN: str = "ToonJoin"
+    COG_JOIN: str = "CogJoin"
+
+
+class BattleAction(NamedTuple):
+    """An action to apply to a battle during gag select.
+
+    Attributes:
+        actionType (str): One of the constants in BattleActionType.
+        value (Any): The gag, target index, Toon, or Cog of the action.
+    """
+
+    actionType: str
+    value: Any
+
+
+class ToonSnapshot(NamedTuple):
+    """The saved state of a toon combatant.
+
+    Attributes:
+        health (int): The toon's laff.
+        selectedGag (int): The toon's selected gag.
+        selectedTarget (int): The index of the toon's target in the cogs, or
+            -1 if it has no target.
+    """
+
+    health: int
+    selectedGag: int
+    selectedTarget: int
+
+
+class CogSnapshot(NamedTuple):
+    """The saved state of a cog combatant.
+
+    Attributes:
+        cogType (int): The ID of the cog's suit and level.
+        health (int): The cog's health.
+        selectedAttack (int): The cog's last selected attack.
+    """
+
+    cogType: int
+    health: int
+    selectedAttack: int
+
+
+class SnapshotFormat:
+    """Namespace for the layout of serialized battle snapshots.
+
+    Attributes:
+        MAGIC (bytes): Identifies a serialized snapshot.
+        STATES (list of str): The states of a battle, by their serialized
+            index.
+        HEADER (Struct): The state, round, turn and number of each kind of
+            combatant. Rosters of up to 65535 toons and cogs fit.
+        TOON (Struct): A serialized ToonSnapshot.
+        COG (Struct): A serialized CogSnapshot.
+        NO_TARGET (int): The serialized target of a toon without one. Cog
+            indexes stop below it, since a roster holds at most 65535 cogs.
+    """
+
+    MAGIC: bytes = b"CBS2"
+    STATES: List[str] = [
+        CogBattleState.OFF,
+        CogBattleState.GAG_SELECT,
+        CogBattleState.GAG_EXECUTE,
+        CogBattleState.COGS_ATTACK,
+        CogBattleState.TOONS_WON,
+        CogBattleState.COGS_WON,
+    ]
+    HEADER: struct.Struct = struct.Struct("<4sBIHHHHH")
+    TOON: struct.Struct = struct.Struct("<iHH")
+    COG: struct.Struct = struct.Struct("<HiH")
+    NO_TARGET: int = 0xFFFF
+
+    @staticmethod
+    def packToon(toon: ToonSnapshot) -> bytes:
+        """Serializes a toon, storing a missing target as NO_TARGET.
+
+        Args:
+            toon (ToonSnapshot): The toon to serialize.
+        """
+        target = toon.selectedTarget
+        return SnapshotFormat.TOON.pack(
+            toon.health,
+            toon.selectedGag,
+            SnapshotFormat.NO_TARGET if target < 0 else target,
+        )
+
+    @staticmethod
+    def unpackToon(
+        health: int, selectedGag: int, selectedTarget: int
+    ) -> ToonSnapshot:
+        """Builds a toon from its serialized fields.
+
+        Args:
+            health (int): The toon's laff.
+            selectedGag (int): The toon's selected gag.
+            selectedTarget (int): The toon's serialized target.
+        """
+        if selectedTarget == SnapshotFormat.NO_TARGET:
+            selectedTarget = -1
+        return ToonSnapshot(health, selectedGag, selectedTarget)
+
+
+class BattleSnapshot(NamedTuple):
+    """An immutable copy of everything needed to resume a battle.
+
+    Snapshots never change, so any number of battles can be restored from
+    the same one, and snapshots taken one after another share the states of
+    combatants that didn't change.
+
+    Attributes:
+        state (str): One of the constants in CogBattleState.
+        round (int): How many times the battle has entered gag select.
+        selectedGagTurn (int): The index of the toon to select a gag for.
+        toons (tuple of ToonSnapshot): The toons in the battle.
+        cogs (tuple of CogSnapshot): The cogs in the battle.
+        pendingToons (tuple of ToonSnapshot): Toons waiting to join.
+        pendingCogs (tuple of CogSnapshot): Cogs waiting to join.
+    """
+
+    state: str
+    round: int
+    selectedGagTurn: int
+    toons: Tuple[ToonSnapshot, ...]
+    cogs: Tuple[CogSnapshot, ...]
+    pendingToons: Tuple[ToonSnapshot, ...]
+    pendingCogs: Tuple[CogSnapshot, ...]
+
+    def toBytes(self) -> bytes:
+        """Serializes the snapshot into a compact byte string."""
+        parts = [
+            SnapshotFormat.HEADER.pack(
+                SnapshotFormat.MAGIC,
+                SnapshotFormat.STATES.index(self.state),
+                self.round,
+                self.selectedGagTurn,
+                len(self.toons),
+                len(self.cogs),
+                len(self.pendingToons),
+                len(self.pendingCogs),
+            )
+        ]
+        for toons, cogs in (
+            (self.toons, self.cogs),
+            (self.pendingToons, self.pendingCogs),
+        ):
+            parts.extend(SnapshotFormat.packToon(toon) for toon in toons)
+            parts.extend(SnapshotFormat.COG.pack(*cog) for cog in cogs)
+        return b"".join(parts)
+
+    @classmethod
+    def fromBytes(cls, data: bytes) -> "BattleSnapshot":
+        """Reads a snapshot serialized by toBytes().
+
+        Args:
+            data (bytes): The serialized snapshot.
+
+        Raises:
+            ValueError: If the data isn't a serialized snapshot.
+        """
+        if (
+            len(data) < SnapshotFormat.HEADER.size
+            or data[: len(SnapshotFormat.MAGIC)] != SnapshotFormat.MAGIC
+        ):
+            raise ValueError("Not a battle snapshot")
+        (
+            _,
+            state,
+            battleRound,
+            selectedGagTurn,
+            *counts,
+        ) = SnapshotFormat.HEADER.unpack_from(data)
+        offset = SnapshotFormat.HEADER.size
+        expected = offset + sum(
+            count * layout.size
+            for count, layout in zip(
+                counts, (SnapshotFormat.TOON, SnapshotFormat.COG) * 2
+            )
+        )
+        if len(data) != expected:
+            raise ValueError("Battle snapshot has the wrong length")
+        groups = []
+        for count, kind, layout in zip(
+            counts,
+            (SnapshotFormat.unpackToon, CogSnapshot) * 2,
+            (SnapshotFormat.TOON, SnapshotFormat.COG) * 2,
+        ):
+            groups.append(
+                tuple(
+                    kind(*layout.unpack_from(data, offset + i * layout.size))
+                    for i in range(count)
+                )
+            )
+            offset += count * layout.size
+        toons, cogs, pendingToons, pendingCogs = groups
+        return cls(
+            SnapshotFormat.STATES[state],
+            battleRound,
+            selectedGagTurn,
+            toons,
+            cogs,
+            pendingToons,
+            pendingCogs,
+        )
+
+
+class BattleEngine:
+    """The rules of a cog battle, without any dependency on Panda3D.
+
+    The engine goes through the same states as the CogBattleFSM, but it only
+    advances when step() is called. This lets simulations, tests, and servers
+    drive battles without a ShowBase or the task manager.
+
+    Args:
+        toons (list of Toon): The toons that initiated this battle.
+        cogs (list of Cog): The cogs that initiated this battle.
+        deterministic (bool): Whether the battle's outcomes should be
+            deterministic.
+        rng (random.Random): The random number generator that every combatant
+            rolls with. Uses the global random module if not given. With a
+            CounterRng, every combatant's rolls are keyed by the round and
+            its combatantId instead.
+        eventSink (BattleEventSink): Where to report the battle's events.
+            Events are discarded if not given.
+        joinQueue (JoinQueue): Admits the toons and cogs that ask to join.
+            A queue with the default limits is used if not given.
+        maxToons (int): How many toons can be in the battle. Defaults to
+            MAX_TOONS_IN_BATTLE.
+        maxCogs (int): How many cogs can be in the battle. Defaults to
+            MAX_COGS_IN_BATTLE.
+        store (BattleStore): Where to save the battle's outcome, if
+            anywhere.
+        cogStrategy (CogStrategy): Chooses the cogs' attacks and targets.
+            Cogs attack at random if not given.
+
+    Attributes:
+        GAG_SELECT_WAIT_TIME (int): How long to wait during gag select.
+        MAX_TOONS_IN_BATTLE (int): How many toons can join a regular battle.
+        MAX_COGS_IN_BATTLE (int): How many cogs can join a regular battle.
+        maxToons (int): How many toons can be in this battle.
+        maxCogs (int): How many cogs can be in this battle.
+        nextCombatantId (int): The combatantId of the next combatant created.
+        toons (list of ToonCombatant): All toon combatants in the battle. The
+            list is compacted in place as toons are defeated.
+        cogs (list of CogCombatant): All cog combatants in the battle. The
+            list is compacted in place as cogs are defeated.
+        cogSlots (dict of int to int): Maps the combatantId of every cog in
+            the battle to its index in the cogs, so toons can find their
+            targets without searching.
+        defeatedToons (list of ToonCombatant): The toons removed from the
+            battle after being defeated.
+        defeatedCogs (list of CogCombatant): The cogs removed from the battle
+            after being defeated.
+        store (BattleStore): Where to save the battle's outcome, if anywhere.
+        cogStrategy (CogStrategy): Chooses the cogs' attacks and targets.
+        threats (ThreatTable): What the cogs know about the toons during
+            their attacks, rebuilt once per round if the strategy uses it.
+        isDeterminstic (bool): Whether the battle's outcomes are deterministic.
+        rng (random.Random): The random number generator of the battle.
+        counterRng (CounterRng): The rng, if it is a CounterRng.
+        eventSink (BattleEventSink): Where the battle's events are reported.
+        state (str): One of the constants in CogBattleState.
+        pendingToons (list of ToonCombatant): Toons waiting to join the battle.
+        pendingCogs (list of CogCombatant): Cogs waiting to join the battle.
+        selectedGagTurn (int): The index of the toon to select a gag for.
+        round (int): How many times the battle has entered gag select.
+        lastSnapshot (BattleSnapshot): The last snapshot taken or restored,
+            whose unchanged combatant states the next snapshot reuses.
+        joinQueue (JoinQueue): Admits the toons and cogs that ask to join.
+    """
+
+    GAG_SELECT_WAIT_TIME: int = 40
+    MAX_TOONS_IN_BATTLE: int = 4
+    MAX_COGS_IN_BATTLE: int = 4
+
+    def __init__(
+        self,
+        toons: List[Toon],
+        cogs: List[Cog],
+        deterministic: bool = False,
+        rng: random.Random = None,
+        eventSink: BattleEventSink = None,
+        joinQueue: Optional[JoinQueue] = None,
+        maxToons: int = MAX_TOONS_IN_BATTLE,
+        maxCogs: int = MAX_COGS_IN_BATTLE,
+        store: Optional["BattleStore"] = None,
+        cogStrategy: Optional[CogStrategy] = None,
+    ) -> None:
+        self.rng: random.Random = random if rng is None else rng
+        self.counterRng: Optional[CounterRng] = (
+            rng if isinstance(rng, CounterRng) else None
+        )
+        self.eventSink: BattleEventSink = (
+            NullEventSink() if eventSink is None else eventSink
+        )
+        self.maxToons: int = maxToons
+        self.maxCogs: int = maxCogs
+        self.nextCombatantId: int = 0
+        self.toons = [
+            ToonCombatant(self, toon, deterministic, self.rng)
+            for toon in toons
+        ]
+        self.cogs = [
+            CogCombatant(self, cog, deterministic, self.rng) for cog in cogs
+        ]
+        self.cogSlots: Dict[int, int] = {}
+        self.indexCogs()
+        self.defeatedToons: List[ToonCombatant] = []
+        self.defeatedCogs: List[CogCombatant] = []
+        self.store: Optional["BattleStore"] = store
+        self.cogStrategy: CogStrategy = (
+            RandomStrategy() if cogStrategy is None else cogStrategy
+        )
+        self.threats: ThreatTable = ThreatTable()
+        self.isDeterministic = deterministic
+        self.state: str = CogBattleState.OFF
+        self.pendingToons: List[ToonCombatant] = []
+        self.pendingCogs: List[CogCombatant] = []
+        self.selectedGagTurn: int = 0
+        self.round: int = 0
+        self.lastSnapshot: Optional[BattleSnapshot] = None
+        self.joinQueue: JoinQueue = (
+            JoinQueue() if joinQueue is None else joinQueue
+        )
+
+    def start(self) -> None:
+        """Starts the battle if it hasn't been started yet."""
+        if self.state == CogBattleState.OFF:
+            self.eventSink.emit(
+                BattleEventType.START, BattleEventSubject.BATTLE
+            )
+            self.transition(CogBattleState.GAG_SELECT)
+
+    def step(
+        self, actions: Iterable[BattleAction] = (), timedOut: bool = False
+    ) -> str:
+        """Advances the battle by applying actions during gag select.
+
+        Pending combatants are added before any actions are applied, the same
+        way the gag select timer adds them. Once every toon has selected a
+        gag, or once the gag select timer has run out, the gags are executed
+        and the cogs attack.
+
+        Args:
+            actions (iterable of BattleAction): The actions to apply, in order.
+            timedOut (bool): Whether the gag select timer has run out.
+
+        Returns:
+            str: The state of the battle after the step.
+        """
+        if self.state != CogBattleState.GAG_SELECT:
+            return self.state
+        battleRound = self.round
+        self.addPendingCombatants()
+        for action in actions:
+            self.applyAction(action)
+        # The actions may have finished the round already, in which case the
+        # timer ran out on a round that is over, not on the next one.
+        if (
+            timedOut
+            and self.state == CogBattleState.GAG_SELECT
+            and self.round == battleRound
+        ):
+            self.timeOut()
+        return self.state
+
+    def applyAction(self, action: BattleAction) -> None:
+        """Applies a single action to the battle.
+
+        Joins requested during gag select are added right away instead of
+        waiting for the next step.
+
+        Args:
+            action (BattleAction): The action to apply.
+        """
+        if action.actionType == BattleActionType.SELECT_GAG:
+            self.selectGag(action.value)
+        elif action.actionType == BattleActionType.SELECT_TARGET:
+            self.selectTarget(action.value)
+        elif action.actionType == BattleActionType.TOON_JOIN:
+            self.requestToonJoin(action.value)
+        elif action.actionType == BattleActionType.COG_JOIN:
+            self.requestCogJoin(action.value)
+        else:
+            raise ValueError(f"Unknown action type: {action.actionType}")
+        if (
+            action.actionType
+            in (BattleActionType.TOON_JOIN, BattleActionType.COG_JOIN)
+            and self.state == CogBattleState.GAG_SELECT
+        ):
+            self.addPendingCombatants()
+
+    def timeOut(self) -> None:
+        """Ends gag select because the toons ran out of time."""
+        if self.state != CogBattleState.GAG_SELECT:
+            return
+        self.eventSink.emit(BattleEventType.TIMEOUT, BattleEventSubject.BATTLE)
+        self.transition(CogBattleState.GAG_EXECUTE)
+
+    def isOver(self) -> bool:
+        """Returns whether either the toons or the cogs have won."""
+        return self.state in (
+            CogBattleState.TOONS_WON,
+            CogBattleState.COGS_WON,
+        )
+
+    def transition(self, state: str) -> None:
+        """Moves the battle into a state, following any transitions that
+        happen immediately afterwards.
+
+        Args:
+            state (str): One of the constants in CogBattleState.
+        """
+        nextState: Optional[str] = state
+        while nextState is not None:
+            nextState = getattr(self, "enter" + nextState)()
+
+    def setState(self, state: str) -> None:
+        """Sets the state of the battle and reports the transition.
+
+        Args:
+            state (str): One of the constants in CogBattleState.
+        """
+        self.state = state
+        self.eventSink.emit(
+            BattleEventType.STATE, BattleEventSubject.BATTLE, value=state
+        )
+
+    def enterGagSelect(self) -> None:
+        """Clears every toon's selection for a new round of gag select, and
+        admits the toons and cogs waiting to join if there is room now."""
+        self.setState(CogBattleState.GAG_SELECT)
+        self.round += 1
+        if self.counterRng is not None:
+            self.counterRng.startRound(self.round)
+        self.selectedGagTurn = 0
+        for toon in self.toons:
+            toon.selectedGag = Gag.NONE
+            toon.selectedTarget = ToonCombatant.NO_TARGET
+        self.joinQueue.startRound()
+        self.admitWaiting()
+
+    def enterGagExecute(self) -> str:
+        """Executes the selected gags.
+
+        Returns:
+            str: The state that the battle should move to next.
+        """
+        self.setState(CogBattleState.GAG_EXECUTE)
+        self.executeGags()
+        if self.cogs or self.pendingCogs:
+            return CogBattleState.COGS_ATTACK
+        return CogBattleState.TOONS_WON
+
+    def enterCogsAttack(self) -> str:
+        """Lets the cogs attack the toons.
+
+        Returns:
+            str: The state that the battle should move to next.
+        """
+        self.setState(CogBattleState.COGS_ATTACK)
+        self.attackToons()
+        if self.toons or self.pendingToons:
+            return CogBattleState.GAG_SELECT
+        return CogBattleState.COGS_WON
+
+    def enterToonsWon(self) -> None:
+        self.setState(CogBattleState.TOONS_WON)
+        self.endBattle()
+
+    def enterCogsWon(self) -> None:
+        self.setState(CogBattleState.COGS_WON)
+        self.endBattle()
+
+    def endBattle(self) -> None:
+        """Writes every toon's laff back to its Toon, and queues the outcome
+        to be saved if the battle has a store."""
+        for toons in (self.toons, self.pendingToons, self.defeatedToons):
+            for toon in toons:
+                toon.toon.laff = max(toon.health, 0)
+        if self.store is not None:
+            self.store.record(self)
+
+    def addPendingCombatants(self) -> None:
+        """Adds all of the pending toons and cogs to their respective lists."""
+        if not self.pendingToons and not self.pendingCogs:
+            return
+        self.eventSink.emit(
+            BattleEventType.ADD_PENDING, BattleEventSubject.BATTLE
+        )
+        self.joinQueue.stats.batches += 1
+        self.toons.extend(self.pendingToons)
+        self.pendingToons.clear()
+        start = len(self.cogs)
+        self.cogs.extend(self.pendingCogs)
+        self.pendingCogs.clear()
+        self.indexCogs(start)
+
+    def newCombatantId(self) -> int:
+        """Returns a combatantId that no other combatant in the battle has."""
+        combatantId = self.nextCombatantId
+        self.nextCombatantId += 1
+        return combatantId
+
+    def indexCogs(self, start: int = 0) -> None:
+        """Updates the slots of the cogs from an index onwards.
+
+        Args:
+            start (int): The first index whose cog was added or moved. The
+                slots are rebuilt from scratch if 0.
+        """
+        if not start:
+            self.cogSlots.clear()
+        for i in range(start, len(self.cogs)):
+            self.cogSlots[self.cogs[i].combatantId] = i
+
+    def cogById(self, cogId: int) -> Optional[CogCombatant]:
+        """Returns the cog in the battle with a combatantId, or None if it
+        isn't in the battle.
+
+        Args:
+            cogId (int): The combatantId of the cog.
+        """
+        slot = self.cogSlots.get(cogId)
+        return None if slot is None else self.cogs[slot]
+
+    def selectGag(self, gag: int) -> None:
+        """Selects a gag for the next toon.
+
+        Args:
+            gag (int): One of the constants in the Gag class.
+        """
+        if self.state != CogBattleState.GAG_SELECT:
+            return
+        self.eventSink.emit(
+            BattleEventType.SELECT_GAG,
+            BattleEventSubject.TOON,
+            self.selectedGagTurn,
+            gag,
+        )
+        self.toons[self.selectedGagTurn].selectedGag = gag
+        if len(self.cogs) == 1 or gag not in Gag.TARGET_REQUIRED:
+            self.selectTarget(0)
+
+    def selectTarget(self, target: int) -> None:
+        """Selects a target cog for the next toon.
+
+        Args:
+            target (int): An index in the cogs list.
+        """
+        if self.state != CogBattleState.GAG_SELECT:
+            return
+        if not 0 <= target < len(self.cogs):
+            self.eventSink.emit(
+                BattleEventType.INVALID_TARGET,
+                BattleEventSubject.TOON,
+                self.selectedGagTurn,
+                target,
+            )
+            return
+
+        self.eventSink.emit(
+            BattleEventType.SELECT_TARGET,
+            BattleEventSubject.TOON,
+            self.selectedGagTurn,
+            target,
+        )
+        self.toons[self.selectedGagTurn].selectedTarget = self.cogs[
+            target
+        ].combatantId
+        self.selectedGagTurn = (self.selectedGagTurn + 1) % len(self.toons)
+        if all(toon.selectedGag for toon in self.toons):
+            self.transition(CogBattleState.GAG_EXECUTE)
+
+    def selectTargetById(self, cogId: int) -> None:
+        """Selects a target cog for the next toon by its combatantId, which
+        unlike its index doesn't change as other cogs are defeated.
+
+        Args:
+            cogId (int): The combatantId of a cog in the battle.
+        """
+        slot = self.cogSlots.get(cogId)
+        self.selectTarget(len(self.cogs) if slot is None else slot)
+
+    def executeGags(self) -> None:
+        """Commits all gags selected by toons.
+
+        Selections are grouped by gag in a single pass over the toons. Each
+        group rolls once for a hit, its damage is added up per target, and
+        defeated cogs are removed once every group has been executed.
+        """
+        groups: Dict[int, List[ToonCombatant]] = {}
+        for toon in self.toons:
+            groups.setdefault(toon.selectedGag, []).append(toon)
+        for gag in Gag.EXECUTE_ORDER:
+            attackingToons = groups.get(gag)
+            # Use the first toon to roll for a hit; if the first succeeds, so
+            # do the rest.
+            if attackingToons and attackingToons[0].isAttackHit():
+                for cog, damage in self.groupDamage(
+                    gag, attackingToons
+                ).items():
+                    cog.takeDamage(damage)
+        if removeDefeated(self.cogs, self.defeatedCogs):
+            self.indexCogs()
+
+    def groupDamage(
+        self, gag: int, attackingToons: List[ToonCombatant]
+    ) -> Dict[CogCombatant, int]:
+        """Adds up the damage that a group of toons deals to each target.
+
+        A toon whose target was already defeated, either earlier in the round
+        or by the toons before it in the group, deals no damage. Override this
+        to add combo or multi-target bonuses.
+
+        Args:
+            gag (int): The gag that the group used.
+            attackingToons (list of ToonCombatant): The toons that hit.
+
+        Returns:
+            dict of CogCombatant to int: The damage to deal to each cog.
+        """
+        damage: Dict[CogCombatant, int] = {}
+        for toon in attackingToons:
+            target = self.cogById(toon.selectedTarget)
+            if target is not None and target.health > damage.get(target, 0):
+                damage[target] = damage.get(target, 0) + Gag.DAMAGE[gag]
+        return damage
+
+    def attackToons(self) -> None:
+        """Tells all cogs to execute an attack on the toons.
+
+        Each cog selects its attack once, from the threat table that every
+        cog of the battle shares, so smarter strategies cost the same per cog
+        however many cogs there are.
+        """
+        if self.cogStrategy.USES_THREATS:
+            self.threats.build(self)
+        for cog in self.cogs:
+            cog.selectAttack()
+            if cog.isAttackHit():
+                cog.executeAttack()
+        removeDefeated(self.toons, self.defeatedToons)
+
+    def snapshot(self) -> BattleSnapshot:
+        """Saves the state of the battle.
+
+        Returns:
+            BattleSnapshot: The saved state, which restore() can resume from.
+        """
+        last = self.lastSnapshot
+        snapshot = BattleSnapshot(
+            self.state,
+            self.round,
+            self.selectedGagTurn,
+            shareStates(
+                [self.toonSnapshot(toon) for toon in self.toons],
+                last.toons if last else (),
+            ),
+            shareStates(
+                [self.cogSnapshot(cog) for cog in self.cogs],
+                last.cogs if last else (),
+            ),
+            shareStates(
+                [self.toonSnapshot(toon) for toon in self.pendingToons],
+                last.pendingToons if last else (),
+            ),
+            shareStates(
+                [self.cogSnapshot(cog) for cog in self.pendingCogs],
+                last.pendingCogs if last else (),
+            ),
+        )
+        self.lastSnapshot = snapshot
+        return snapshot
+
+    def toonSnapshot(self, toon: ToonCombatant) -> ToonSnapshot:
+        """Saves the state of a toon.
+
+        Args:
+            toon (ToonCombatant): The toon to save.
+        """
+        return ToonSnapshot(
+            toon.health,
+            toon.selectedGag,
+            self.cogSlots.get(toon.selectedTarget, -1),
+        )
+
+    @staticmethod
+    def cogSnapshot(cog: CogCombatant) -> CogSnapshot:
+        """Saves the state of a cog.
+
+        Args:
+            cog (CogCombatant): The cog to save.
+        """
+        return CogSnapshot(cog.cogType, cog.health, cog.selectedAttack)
+
+    def restore(self, snapshot: BattleSnapshot) -> None:
+        """Resumes the battle from a snapshot.
+
+        Combatants already in the battle are reused, so restoring the same
+        battle over and over doesn't allocate new combatants.
+
+        Args:
+            snapshot (BattleSnapshot): The state to resume from.
+        """
+        self.state = snapshot.state
+        self.round = snapshot.round
+        self.selectedGagTurn = snapshot.selectedGagTurn
+        self.restoreCogs(self.cogs, snapshot.cogs)
+        self.indexCogs()
+        self.restoreCogs(self.pendingCogs, snapshot.pendingCogs)
+        self.restoreToons(self.toons, snapshot.toons)
+        self.restoreToons(self.pendingToons, snapshot.pendingToons)
+        self.defeatedToons.clear()
+        self.defeatedCogs.clear()
+        if self.counterRng is not None:
+            self.counterRng.startRound(self.round)
+        self.lastSnapshot = snapshot
+
+    def restoreCogs(
+        self, cogs: List[CogCombatant], states: Tuple[CogSnapshot, ...]
+    ) -> None:
+        """Restores a list of cogs in place.
+
+        Args:
+            cogs (list of CogCombatant): The cogs to restore.
+            states (tuple of CogSnapshot): The saved states of the cogs.
+        """
+        del cogs[len(states) :]
+        for i, state in enumerate(states):
+            if i == len(cogs):
+                cogs.append(
+                    CogCombatant(
+                        self,
+                        Cog(*TABLES.cogTypes[state.cogType]),
+                        self.isDeterministic,
+                        self.rng,
+                    )
+                )
+            cog = cogs[i]
+            if cog.cogType != state.cogType:
+                cog.cogType = state.cogType
+                cog.attacks = TABLES.cogAttacks[state.cogType]
+            cog.health = state.health
+            cog.selectedAttack = state.selectedAttack
+
+    def restoreToons(
+        self, toons: List[ToonCombatant], states: Tuple[ToonSnapshot, ...]
+    ) -> None:
+        """Restores a list of toons in place. The cogs must be restored
+        first, since toons target them by index.
+
+        Args:
+            toons (list of ToonCombatant): The toons to restore.
+            states (tuple of ToonSnapshot): The saved states of the toons.
+        """
+        del toons[len(states) :]
+        for i, state in enumerate(states):
+            if i == len(toons):
+                toons.append(
+                    ToonCombatant(self, Toon(), self.isDeterministic, self.rng)
+                )
+            toon = toons[i]
+            toon.health = state.health
+            toon.selectedGag = state.selectedGag
+            toon.selectedTarget = (
+                ToonCombatant.NO_TARGET
+                if state.selectedTarget < 0
+                else self.cogs[state.selectedTarget].combatantId
+            )
+
+    def canToonJoin(self) -> bool:
+        """Returns whether there is room for another toon to join."""
+        return len(self.toons) + len(self.pendingToons) < self.maxToons
+
+    def canCogJoin(self) -> bool:
+        """Returns whether there is room for another cog to join."""
+        return len(self.cogs) + len(self.pendingCogs) < self.maxCogs
+
+    def requestToonJoin(self, toon: Toon) -> bool:
+        """Requests for a toon to join the battle.
+
+        The toon waits in the join queue if the battle is full.
+
+        Args:
+            toon (Toon): The toon that wants to join the battle.
+
+        Returns:
+            bool: Whether the toon joined or is waiting to, rather than being
+                turned away.
+        """
+        self.joinQueue.stats.requested += 1
+        if self.canToonJoin() and not self.joinQueue.waitingToons:
+            self.admitToon(toon)
+            return True
+        return self.joinQueue.wait(toon, self.joinQueue.waitingToons)
+
+    def requestCogJoin(self, cog: Cog) -> bool:
+        """Requests for a cog to join the battle.
+
+        The cog waits in the join queue if the battle is full.
+
+        Args:
+            cog (Cog): The cog that wants to join the battle.
+
+        Returns:
+            bool: Whether the cog joined or is waiting to, rather than being
+                turned away.
+        """
+        self.joinQueue.stats.requested += 1
+        if self.canCogJoin() and not self.joinQueue.waitingCogs:
+            self.admitCog(cog)
+            return True
+        return self.joinQueue.wait(cog, self.joinQueue.waitingCogs)
+
+    def admitToon(self, toon: Toon) -> None:
+        """Adds a toon to the pending toons.
+
+        Args:
+            toon (Toon): The toon to admit.
+        """
+        self.eventSink.emit(
+            BattleEventType.JOIN, BattleEventSubject.TOON, value=toon.laff
+        )
+        self.pendingToons.append(
+            ToonCombatant(self, toon, self.isDeterministic, self.rng)
+        )
+        self.joinQueue.stats.admitted += 1
+
+    def admitCog(self, cog: Cog) -> None:
+        """Adds a cog to the pending cogs.
+
+        Args:
+            cog (Cog): The cog to admit.
+        """
+        self.eventSink.emit(
+            BattleEventType.JOIN,
+            BattleEventSubject.COG,
+            cog.cogType,
+            cog.health,
+        )
+        self.pendingCogs.append(
+            CogCombatant(self, cog, self.isDeterministic, self.rng)
+        )
+        self.joinQueue.stats.admitted += 1
+
+    def admitWaiting(self) -> None:
+        """Admits the toons and cogs waiting to join, oldest first, for as
+        long as there is room."""
+        waitingToons = self.joinQueue.waitingToons
+        while waitingToons and self.canToonJoin():
+            self.admitToon(waitingToons.popleft())
+        waitingCogs = self.joinQueue.waitingCogs
+        while waitingCogs and self.canCogJoin():
+            self.admitCog(waitingCogs.popleft())
+
+
+def shareStates(states: list, previous: tuple) -> tuple:
+    """Builds a tuple of combatant states that reuses the equal states of a
+    previous snapshot, so unchanged combatants are only stored once.
+
+    Args:
+        states (list of tuple): The new states.
+        previous (tuple of tuple): The states of the previous snapshot.
+    """
+    shared = tuple(states)
+    if shared == previous:
+        return previous
+    return tuple(
+        previous[i] if i < len(previous) and previous[i] == state else state
+        for i, state in enumerate(shared)
+    )
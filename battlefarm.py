@@ -0,0 +1,239 @@
+"""Copyright 2021, James S. Wang, All rights reserved."""
+
+from battleengine import (
+    BattleAction,
+    BattleActionType,
+    BattleEngine,
+    CogBattleState,
+)
+from battlelog import BattleEventSink
+from cog import Cog
+from gag import Gag
+from toon import Toon
+from typing import Dict, List, NamedTuple, Optional
+import random
+
+
+class BattleStats:
+    """Mergeable statistics about a group of finished battles.
+
+    Attributes:
+        battles (int): How many battles were played.
+        toonWins (int): How many battles the toons won.
+        cogWins (int): How many battles the cogs won.
+        rounds (dict of int to int): Maps number of rounds to the number of
+            battles that lasted that long.
+    """
+
+    def __init__(self) -> None:
+        self.battles: int = 0
+        self.toonWins: int = 0
+        self.cogWins: int = 0
+        self.rounds: Dict[int, int] = {}
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, BattleStats) and vars(self) == vars(other)
+
+    def record(self, battle: BattleEngine) -> None:
+        """Records the outcome of a battle.
+
+        Args:
+            battle (BattleEngine): The battle to record.
+        """
+        self.battles += 1
+        if battle.state == CogBattleState.TOONS_WON:
+            self.toonWins += 1
+        elif battle.state == CogBattleState.COGS_WON:
+            self.cogWins += 1
+        self.rounds[battle.round] = self.rounds.get(battle.round, 0) + 1
+
+    def merge(self, other: "BattleStats") -> None:
+        """Adds the statistics of another group of battles to this one.
+
+        Args:
+            other (BattleStats): The statistics to add.
+        """
+        self.battles += other.battles
+        self.toonWins += other.toonWins
+        self.cogWins += other.cogWins
+        for rounds, count in other.rounds.items():
+            self.rounds[rounds] = self.rounds.get(rounds, 0) + count
+
+    def toonWinRate(self) -> float:
+        """Returns the fraction of battles that the toons won."""
+        return self.toonWins / self.battles if self.battles else 0.0
+
+
+class BattleShard(NamedTuple):
+    """A piece of a farm's workload that is run by a single worker.
+
+    Attributes:
+        seed (str): The seed for the shard's random number generator.
+        battles (int): How many battles to play.
+        toonGags (list of int): The gag that each toon selects every round.
+        numCogs (int): How many cogs are in each battle.
+        randomTargets (bool): Whether toons pick random cogs to target.
+        maxRounds (int): The most rounds to play per battle.
+    """
+
+    seed: str
+    battles: int
+    toonGags: List[int]
+    numCogs: int
+    randomTargets: bool
+    maxRounds: int
+
+
+def runShard(
+    shard: BattleShard, eventSink: Optional[BattleEventSink] = None
+) -> BattleStats:
+    """Plays every battle in a shard with the shard's own seeded RNG.
+
+    Args:
+        shard (BattleShard): The shard to play.
+        eventSink (BattleEventSink): Where to report the events of every
+            battle. Events are discarded if not given.
+
+    Returns:
+        BattleStats: The statistics of the shard's battles.
+    """
+    rng = random.Random(shard.seed)
+    stats = BattleStats()
+    for _ in range(shard.battles):
+        battle = BattleEngine(
+            [Toon() for _ in shard.toonGags],
+            [Cog() for _ in range(shard.numCogs)],
+            rng=rng,
+            eventSink=eventSink,
+        )
+        toonGags = {
+            toon.combatantId: gag
+            for toon, gag in zip(battle.toons, shard.toonGags)
+        }
+        battle.start()
+        while not battle.isOver() and battle.round <= shard.maxRounds:
+            battle.step(selectGags(battle, toonGags, shard, rng))
+        stats.record(battle)
+    return stats
+
+
+def selectGags(
+    battle: BattleEngine,
+    toonGags: Dict[int, int],
+    shard: BattleShard,
+    rng: random.Random,
+) -> List[BattleAction]:
+    """Builds the gag select actions for every toon in a battle.
+
+    Args:
+        battle (BattleEngine): The battle to select gags in.
+        toonGags (dict of int to int): Maps the combatantId of each toon to
+            its gag, so toons keep their gags as others are defeated.
+        shard (BattleShard): The shard describing how the toons target.
+        rng (random.Random): The random number generator for targets.
+
+    Returns:
+        list of BattleAction: The actions to pass to BattleEngine.step().
+    """
+    actions = []
+    for toon in battle.toons:
+        gag = toonGags[toon.combatantId]
+        actions.append(BattleAction(BattleActionType.SELECT_GAG, gag))
+        if len(battle.cogs) > 1 and gag in Gag.TARGET_REQUIRED:
+            target = (
+                rng.randrange(len(battle.cogs)) if shard.randomTargets else 0
+            )
+            actions.append(
+                BattleAction(BattleActionType.SELECT_TARGET, target)
+            )
+    return actions
+
+
+class BattleFarm:
+    """Runs a large number of headless battles across multiple processes.
+
+    The workload is split into shards of a fixed size, and each shard seeds
+    its own RNG from the farm's seed and the shard's index. Since the shards
+    don't depend on how many workers there are, the same seed always produces
+    the same merged statistics.
+
+    Args:
+        toonGags (list of int): The gag that each toon selects every round.
+        numCogs (int): How many cogs are in each battle.
+        seed (int): The seed that all shard seeds are derived from.
+        randomTargets (bool): Whether toons pick random cogs to target.
+        shardSize (int): How many battles to play in each shard.
+        maxRounds (int): The most rounds to play per battle.
+
+    Attributes:
+        toonGags (list of int): The gag that each toon selects every round.
+        numCogs (int): How many cogs are in each battle.
+        seed (int): The seed that all shard seeds are derived from.
+        randomTargets (bool): Whether toons pick random cogs to target.
+        shardSize (int): How many battles to play in each shard.
+        maxRounds (int): The most rounds to play per battle.
+    """
+
+    def __init__(
+        self,
+        toonGags: List[int],
+        numCogs: int,
+        seed: int = 0,
+        randomTargets: bool = False,
+        shardSize: int = 1000,
+        maxRounds: int = 100,
+    ) -> None:
+        self.toonGags: List[int] = list(toonGags)
+        self.numCogs: int = numCogs
+        self.seed: int = seed
+        self.randomTargets: bool = randomTargets
+        self.shardSize: int = shardSize
+        self.maxRounds: int = maxRounds
+
+    def shards(self, numBattles: int) -> List[BattleShard]:
+        """Splits a workload into shards.
+
+        Args:
+            numBattles (int): How many battles to play in total.
+
+        Returns:
+            list of BattleShard: The shards, in order.
+        """
+        return [
+            BattleShard(
+                f"{self.seed}:{index}",
+                min(self.shardSize, numBattles - start),
+                self.toonGags,
+                self.numCogs,
+                self.randomTargets,
+                self.maxRounds,
+            )
+            for index, start in enumerate(range(0, numBattles, self.shardSize))
+        ]
+
+    def run(
+        self, numBattles: int, maxWorkers: Optional[int] = None
+    ) -> BattleStats:
+        """Plays a number of battles and merges their statistics.
+
+        Args:
+            numBattles (int): How many battles to play in total.
+            maxWorkers (int): How many processes to use. Defaults to the
+                number of CPUs; 1 plays every shard in this process.
+
+        Returns:
+            BattleStats: The merged statistics of every shard.
+        """
+        shards = self.shards(numBattles)
+        stats = BattleStats()
+        if maxWorkers == 1:
+            for shard in shards:
+                stats.merge(runShard(shard))
+            return stats
+        # Imported here so that serial runs don't pay for multiprocessing.
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(maxWorkers) as executor:
+            for shardStats in executor.map(runShard, shards):
+                stats.merge(shardStats)
+        return stats
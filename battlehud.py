@@ -0,0 +1,257 @@
+"""Copyright 2021, James S. Wang, All rights reserved."""
+
+from battleengine import (
+    BattleEngine,
+    CogBattleState,
+    CogSnapshot,
+    ToonSnapshot,
+)
+from battlelog import BattleEventSink, BattleEventType
+from battletables import TABLES
+from direct.task import Task
+from direct.task.TaskManagerGlobal import taskMgr
+from gag import Gag
+from panda3d.core import ClockObject, NodePath, TextNode
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class BattleHud(BattleEventSink):
+    """Shows the state of a battle in the window, one text row per toon and
+    per cog, along with how long frames take.
+
+    The HUD is the battle's event sink, but it doesn't draw anything when an
+    event is emitted: events only mark it dirty. Once per frame, a dirty HUD
+    takes a snapshot of the battle and updates the rows whose toon or cog
+    changed since the last frame, so a burst of events costs one update.
+    Every row keeps its TextNode for as long as the HUD lives; rows that
+    aren't needed are blanked rather than removed.
+
+    Args:
+        parent (NodePath): The node to show the HUD under, such as
+            base.a2dTopRight.
+
+    Attributes:
+        ROW_HEIGHT (float): The distance between rows.
+        SCALE (float): The size of the text.
+        TOON_COLUMN (float): Where the right edge of the toon rows is.
+        COG_COLUMN (float): Where the right edge of the cog rows is.
+        FRAME_TEXT_INTERVAL (float): How often to update the frame time, in
+            seconds.
+        STATE_NAMES (dict of str to str): How to show each state.
+        root (NodePath): The node that every row is under.
+        battle (BattleEngine): The battle shown, if any.
+        dirty (bool): Whether the battle may have changed since the last
+            update.
+        secondsLeft (int): The seconds left in gag select, if known.
+        header (TextNode): Shows the state and round of the battle.
+        frameText (TextNode): Shows how long frames take.
+        toonRows (list of TextNode): The row of each toon.
+        cogRows (list of TextNode): The row of each cog.
+        shownToons (tuple of ToonSnapshot): The toon states being shown.
+        shownCogs (tuple of CogSnapshot): The cog states being shown.
+        frames (int): How many frames have been counted.
+        rowUpdates (int): How many times the text of a row has changed.
+        frameTimes (list of float): The frame times since the frame text was
+            last updated.
+        task (Task): The task that updates the HUD every frame, if started.
+    """
+
+    ROW_HEIGHT: float = 0.06
+    SCALE: float = 0.05
+    TOON_COLUMN: float = -0.85
+    COG_COLUMN: float = -0.07
+    FRAME_TEXT_INTERVAL: float = 0.5
+    STATE_NAMES: Dict[str, str] = {
+        CogBattleState.OFF: "Not started",
+        CogBattleState.GAG_SELECT: "Gag Select",
+        CogBattleState.GAG_EXECUTE: "Executing gags",
+        CogBattleState.COGS_ATTACK: "Cogs attacking",
+        CogBattleState.TOONS_WON: "Toons won!",
+        CogBattleState.COGS_WON: "Cogs won!",
+    }
+
+    def __init__(self, parent: NodePath) -> None:
+        self.root: NodePath = parent.attachNewNode("BattleHud")
+        self.battle: Optional[BattleEngine] = None
+        self.dirty: bool = True
+        self.secondsLeft: Optional[int] = None
+        self.header: TextNode = self.newRow(self.COG_COLUMN, 0)
+        self.frameText: TextNode = self.newRow(self.COG_COLUMN, 1)
+        self.toonRows: List[TextNode] = []
+        self.cogRows: List[TextNode] = []
+        self.shownToons: Tuple[ToonSnapshot, ...] = ()
+        self.shownCogs: Tuple[CogSnapshot, ...] = ()
+        self.frames: int = 0
+        self.rowUpdates: int = 0
+        self.frameTimes: List[float] = []
+        self.task: Optional[Task.Task] = None
+
+    def track(self, battle: BattleEngine) -> None:
+        """Shows a battle, which should report its events to this HUD.
+
+        Args:
+            battle (BattleEngine): The battle to show.
+        """
+        self.battle = battle
+        self.dirty = True
+
+    def emit(
+        self,
+        eventType: str,
+        subject: str,
+        index: Optional[int] = None,
+        value: Any = None,
+    ) -> None:
+        if eventType == BattleEventType.TIMER:
+            self.secondsLeft = value
+        elif eventType == BattleEventType.STATE:
+            self.secondsLeft = None
+        self.dirty = True
+
+    def start(self) -> None:
+        """Updates the HUD once per frame until stopped."""
+        if self.task is None:
+            self.task = taskMgr.add(self.updateTask, "battleHudUpdate")
+
+    def stop(self) -> None:
+        """Stops updating the HUD."""
+        if self.task is not None:
+            taskMgr.remove(self.task)
+            self.task = None
+
+    def updateTask(self, task: Task.Task) -> int:
+        """Updates the HUD with the time the last frame took."""
+        self.update(ClockObject.getGlobalClock().getDt())
+        return Task.cont
+
+    def update(self, frameTime: float) -> None:
+        """Counts a frame and redraws the rows that changed, if any did.
+
+        Args:
+            frameTime (float): How long the last frame took, in seconds.
+        """
+        self.countFrame(frameTime)
+        if not self.dirty or self.battle is None:
+            return
+        self.dirty = False
+        snapshot = self.battle.snapshot()
+        header = f"Round {snapshot.round}: {self.STATE_NAMES[snapshot.state]}"
+        if self.secondsLeft is not None:
+            header += f" ({self.secondsLeft}s)"
+        self.setRow(self.header, header)
+        self.shownToons = self.updateRows(
+            self.toonRows,
+            self.TOON_COLUMN,
+            self.shownToons,
+            snapshot.toons,
+            self.describeToon,
+        )
+        self.shownCogs = self.updateRows(
+            self.cogRows,
+            self.COG_COLUMN,
+            self.shownCogs,
+            snapshot.cogs,
+            self.describeCog,
+        )
+
+    def countFrame(self, frameTime: float) -> None:
+        """Adds a frame to the frame time overlay, which shows the mean and
+        slowest frame every FRAME_TEXT_INTERVAL seconds.
+
+        Args:
+            frameTime (float): How long the frame took, in seconds.
+        """
+        self.frames += 1
+        self.frameTimes.append(frameTime)
+        total = sum(self.frameTimes)
+        if total < self.FRAME_TEXT_INTERVAL:
+            return
+        mean = total / len(self.frameTimes)
+        self.frameText.setText(
+            f"{mean * 1000:.1f} ms/frame ({1 / mean if mean else 0:.0f} fps), "
+            f"slowest {max(self.frameTimes) * 1000:.1f} ms"
+        )
+        self.frameTimes.clear()
+
+    def updateRows(
+        self,
+        rows: List[TextNode],
+        column: float,
+        shown: tuple,
+        states: tuple,
+        describe,
+    ) -> tuple:
+        """Redraws the rows of the combatants whose state changed.
+
+        Args:
+            rows (list of TextNode): The rows, which are added to as needed.
+            column (float): Where the right edge of the rows is.
+            shown (tuple): The states that the rows show.
+            states (tuple): The states to show.
+            describe (callable): Describes a state, given its index.
+
+        Returns:
+            tuple: The states now shown.
+        """
+        for i, state in enumerate(states):
+            if i == len(rows):
+                rows.append(self.newRow(column, i + 2))
+            if i >= len(shown) or shown[i] != state:
+                self.setRow(rows[i], describe(i, state))
+        for row in rows[len(states) :]:
+            self.setRow(row, "")
+        return states
+
+    def setRow(self, row: TextNode, text: str) -> None:
+        """Changes the text of a row, unless it already shows that text.
+
+        Args:
+            row (TextNode): The row.
+            text (str): The text to show.
+        """
+        if row.getText() != text:
+            row.setText(text)
+            self.rowUpdates += 1
+
+    def newRow(self, column: float, i: int) -> TextNode:
+        """Creates a row of text.
+
+        Args:
+            column (float): Where the right edge of the row is.
+            i (int): The position of the row (higher = lower on screen).
+        """
+        row = TextNode(f"BattleHudRow{i}")
+        row.setAlign(TextNode.ARight)
+        row.setTextColor(1, 1, 1, 1)
+        row.setShadow(0.05, 0.05)
+        row.setShadowColor(0, 0, 0, 0.5)
+        path = self.root.attachNewNode(row)
+        path.setScale(self.SCALE)
+        path.setPos(column, 0, -self.ROW_HEIGHT * i - 0.1)
+        return row
+
+    @staticmethod
+    def describeToon(i: int, toon: ToonSnapshot) -> str:
+        """Describes a toon's laff and selection.
+
+        Args:
+            i (int): The index of the toon.
+            toon (ToonSnapshot): The state of the toon.
+        """
+        text = f"Toon {i + 1}: {toon.health} laff"
+        if toon.selectedGag:
+            text += f", {Gag.NAME[toon.selectedGag]}"
+        if toon.selectedTarget >= 0:
+            text += f" on cog {toon.selectedTarget + 1}"
+        return text
+
+    @staticmethod
+    def describeCog(i: int, cog: CogSnapshot) -> str:
+        """Describes a cog's type and health.
+
+        Args:
+            i (int): The index of the cog.
+            cog (CogSnapshot): The state of the cog.
+        """
+        suit, level = TABLES.cogTypes[cog.cogType]
+        return f"Cog {i + 1} ({suit} {level}): {cog.health} health"
@@ -0,0 +1,202 @@
+"""Copyright 2021, James S. Wang, All rights reserved."""
+
+from gag import Gag
+from typing import Any, Dict, List, NamedTuple, Optional, TextIO
+import json
+
+
+class BattleEventType:
+    """Namespace for the different events that a battle reports."""
+
+    START: str = "Start"
+    STATE: str = "State"
+    STATUS: str = "Status"
+    TIMER: str = "Timer"
+    JOIN: str = "Join"
+    SELECT_GAG: str = "SelectGag"
+    SELECT_TARGET: str = "SelectTarget"
+    INVALID_TARGET: str = "InvalidTarget"
+    HIT: str = "Hit"
+    MISS: str = "Miss"
+    DAMAGE: str = "Damage"
+    TIMEOUT: str = "Timeout"
+    ADD_PENDING: str = "AddPending"
+
+
+class BattleEventSubject:
+    """Namespace for what a battle event is about."""
+
+    BATTLE: str = "Battle"
+    TOON: str = "Toon"
+    COG: str = "Cog"
+
+
+class BattleEvent(NamedTuple):
+    """A single thing that happened in a battle.
+
+    Attributes:
+        eventType (str): One of the constants in BattleEventType.
+        subject (str): One of the constants in BattleEventSubject.
+        index (int): The index of the toon or cog the event is about, if
+            known. For cogs joining the battle, the cog type instead.
+        value (Any): The state, gag, attack, damage, etc. of the event.
+    """
+
+    eventType: str
+    subject: str
+    index: Optional[int]
+    value: Any
+
+
+class BattleEventSink:
+    """Receives the events of a battle. The base sink ignores every event."""
+
+    def emit(
+        self,
+        eventType: str,
+        subject: str,
+        index: Optional[int] = None,
+        value: Any = None,
+    ) -> None:
+        """Reports an event.
+
+        Args:
+            eventType (str): One of the constants in BattleEventType.
+            subject (str): One of the constants in BattleEventSubject.
+            index (int): The index of the toon or cog the event is about.
+            value (Any): The state, gag, attack, damage, etc. of the event.
+        """
+
+    def flush(self) -> None:
+        """Writes out any events that are still buffered."""
+
+    def close(self) -> None:
+        """Flushes the sink and releases anything it holds."""
+        self.flush()
+
+
+class NullEventSink(BattleEventSink):
+    """A sink that discards every event, for simulations that run silently."""
+
+
+class BufferedEventSink(BattleEventSink):
+    """A sink that keeps every event in memory.
+
+    Attributes:
+        events (list of BattleEvent): The events in the order they happened.
+    """
+
+    def __init__(self) -> None:
+        self.events: List[BattleEvent] = []
+
+    def emit(
+        self,
+        eventType: str,
+        subject: str,
+        index: Optional[int] = None,
+        value: Any = None,
+    ) -> None:
+        self.events.append(BattleEvent(eventType, subject, index, value))
+
+    def clear(self) -> None:
+        """Removes every event from the buffer."""
+        self.events.clear()
+
+
+class FileEventSink(BattleEventSink):
+    """A sink that writes events to a file as JSON lines, in batches.
+
+    Args:
+        file (TextIO): The file to write to.
+        batchSize (int): How many events to buffer before writing them.
+
+    Attributes:
+        file (TextIO): The file to write to.
+        batchSize (int): How many events to buffer before writing them.
+        buffer (list of str): Encoded events that haven't been written yet.
+    """
+
+    def __init__(self, file: TextIO, batchSize: int = 4096) -> None:
+        self.file: TextIO = file
+        self.batchSize: int = batchSize
+        self.buffer: List[str] = []
+
+    @classmethod
+    def open(cls, path: str, batchSize: int = 4096) -> "FileEventSink":
+        """Creates a sink that appends to the file at a path.
+
+        Args:
+            path (str): The path of the file.
+            batchSize (int): How many events to buffer before writing them.
+        """
+        return cls(open(path, "a"), batchSize)
+
+    def emit(
+        self,
+        eventType: str,
+        subject: str,
+        index: Optional[int] = None,
+        value: Any = None,
+    ) -> None:
+        self.buffer.append(json.dumps([eventType, subject, index, value]))
+        if len(self.buffer) >= self.batchSize:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.buffer:
+            self.file.write("\n".join(self.buffer) + "\n")
+            self.buffer.clear()
+        self.file.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+
+class ConsoleEventSink(BattleEventSink):
+    """A sink that prints events to the console the way the demo shows them.
+
+    Attributes:
+        STATE_MESSAGES (dict of str to str): What to print when entering a
+            state.
+    """
+
+    STATE_MESSAGES: Dict[str, str] = {
+        "GagSelect": "\nEntered Gag Select",
+        "ToonsWon": "Toons won the battle!",
+        "CogsWon": "Cogs won the battle!",
+    }
+
+    def emit(
+        self,
+        eventType: str,
+        subject: str,
+        index: Optional[int] = None,
+        value: Any = None,
+    ) -> None:
+        if eventType == BattleEventType.HIT:
+            print(f"The {subject.lower()} hit")
+        elif eventType == BattleEventType.MISS:
+            print(f"The {subject.lower()} missed")
+        elif eventType == BattleEventType.TIMER:
+            print(f"Time left: {value}")
+        elif eventType == BattleEventType.STATE:
+            if value in self.STATE_MESSAGES:
+                print(self.STATE_MESSAGES[value])
+        elif eventType == BattleEventType.STATUS:
+            toonHealth, cogHealth = value
+            for i, health in enumerate(toonHealth):
+                print(f"Toon {i + 1}: {health} laff")
+            for i, health in enumerate(cogHealth):
+                print(f"Cog {i + 1}: {health} health")
+            print()
+        elif eventType == BattleEventType.SELECT_GAG:
+            print(f"Selected {Gag.NAME[value]} for toon {index + 1}.")
+        elif eventType == BattleEventType.SELECT_TARGET:
+            print(f"Selected cog {value + 1}")
+        elif eventType == BattleEventType.INVALID_TARGET:
+            print("Selected nonexistent cog, try again")
+        elif eventType == BattleEventType.JOIN:
+            print(f"Adding {subject}")
+        elif eventType == BattleEventType.START:
+            print("Starting Cog Battle")
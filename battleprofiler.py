@@ -0,0 +1,253 @@
+"""Copyright 2021, James S. Wang, All rights reserved."""
+
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List
+import functools
+import os
+import time
+
+
+class LatencyHistogram:
+    """Counts latencies in buckets whose bounds double from one microsecond
+    up to about half a minute.
+
+    Attributes:
+        BOUNDS_NS (list of int): The upper bound of every bucket but the last,
+            which holds everything slower.
+        counts (list of int): How many latencies fell in each bucket.
+        count (int): How many latencies were recorded.
+        totalNs (int): The sum of every latency.
+        maxNs (int): The slowest latency.
+    """
+
+    BOUNDS_NS: List[int] = [1000 << i for i in range(26)]
+
+    def __init__(self) -> None:
+        self.counts: List[int] = [0] * (len(self.BOUNDS_NS) + 1)
+        self.count: int = 0
+        self.totalNs: int = 0
+        self.maxNs: int = 0
+
+    def record(self, latency: int) -> None:
+        """Adds a latency to the histogram.
+
+        Args:
+            latency (int): The latency in nanoseconds.
+        """
+        self.counts[bisect_left(self.BOUNDS_NS, latency)] += 1
+        self.count += 1
+        self.totalNs += latency
+        if latency > self.maxNs:
+            self.maxNs = latency
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns the count, sum, mean and max in microseconds, along with
+        the upper bound and count of every bucket that isn't empty."""
+        return {
+            "count": self.count,
+            "totalUs": self.totalNs / 1000,
+            "meanUs": self.totalNs / self.count / 1000 if self.count else 0.0,
+            "maxUs": self.maxNs / 1000,
+            "buckets": [
+                [
+                    bound / 1000 if i < len(self.BOUNDS_NS) else None,
+                    count,
+                ]
+                for i, (bound, count) in enumerate(
+                    zip(self.BOUNDS_NS + [0], self.counts)
+                )
+                if count
+            ],
+        }
+
+
+class BattleProfiler:
+    """Records how long the phases of battles take.
+
+    A profiler does nothing until it is attached to a battle, which replaces
+    the battle's phase methods on that instance with timed versions. Battles
+    that aren't attached run the class methods as they are, so leaving the
+    profiler in a build costs nothing until it is used. One profiler can be
+    attached to any number of battles, and adds up their timings.
+
+    Attach a profiler before starting the battle, since the gag select timer
+    keeps the methods it was scheduled with.
+
+    Attributes:
+        ENGINE_PHASES (list of str): The battle methods to time.
+        FSM_PHASES (list of str): The CogBattleFSM methods to time, besides
+            the enter and exit methods of every state.
+        METRIC (str): The name of the Prometheus histogram.
+        histograms (dict of str to LatencyHistogram): The latencies of each
+            phase.
+    """
+
+    ENGINE_PHASES: List[str] = [
+        "executeGags",
+        "attackToons",
+        "addPendingCombatants",
+        "timeOut",
+    ]
+    FSM_PHASES: List[str] = [
+        "startGagSelectTimer",
+        "gagSelectTimeout",
+        "gagSelectCountdownTick",
+    ]
+    METRIC: str = "cogbattle_phase_seconds"
+
+    def __init__(self) -> None:
+        self.histograms: Dict[str, LatencyHistogram] = {}
+
+    def histogram(self, name: str) -> LatencyHistogram:
+        """Returns the histogram of a phase, creating it if needed.
+
+        Args:
+            name (str): The name of the phase.
+        """
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        return histogram
+
+    def timed(self, name: str, function: Callable) -> Callable:
+        """Wraps a function so that every call is recorded as a phase.
+
+        Args:
+            name (str): The name of the phase.
+            function (callable): The function to time.
+        """
+        record = self.histogram(name).record
+        clock = time.perf_counter_ns
+
+        @functools.wraps(function)
+        def timedFunction(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(clock() - start)
+
+        return timedFunction
+
+    def attach(self, battle: "BattleEngine") -> None:
+        """Starts timing the phases of a battle.
+
+        Engine phases are named after their methods. If the battle is a
+        CogBattle, the enter and exit methods of its FSM's states and its gag
+        select timer are timed too, named "fsm." and the method, along with
+        "fsm.in" and the state for the time spent in states that have an
+        exit method.
+
+        Args:
+            battle (BattleEngine): The battle to time.
+        """
+        for name in self.ENGINE_PHASES:
+            setattr(battle, name, self.timed(name, getattr(battle, name)))
+        fsm = getattr(battle, "cogBattleFSM", None)
+        if fsm is None:
+            return
+
+        for name in self.FSM_PHASES:
+            setattr(fsm, name, self.timed("fsm." + name, getattr(fsm, name)))
+        entered: Dict[str, int] = {}
+        for state in fsm.defaultTransitions:
+            onEnter = getattr(fsm, "enter" + state, None)
+            onExit = getattr(fsm, "exit" + state, None)
+            if onExit is not None:
+                onEnter = self.dwellStart(state, onEnter, entered)
+                onExit = self.dwellEnd(state, onExit, entered)
+                setattr(
+                    fsm, "exit" + state, self.timed("fsm.exit" + state, onExit)
+                )
+            if onEnter is not None:
+                setattr(
+                    fsm,
+                    "enter" + state,
+                    self.timed("fsm.enter" + state, onEnter),
+                )
+
+    def dwellStart(
+        self, state: str, onEnter: Callable, entered: Dict[str, int]
+    ) -> Callable:
+        """Wraps an enter method so that it notes when the state began.
+
+        Args:
+            state (str): The state being entered.
+            onEnter (callable): The enter method, or None if there isn't one.
+            entered (dict of str to int): When each state was last entered.
+        """
+
+        def enterState(*args):
+            entered[state] = time.perf_counter_ns()
+            if onEnter is not None:
+                onEnter(*args)
+
+        return enterState
+
+    def dwellEnd(
+        self, state: str, onExit: Callable, entered: Dict[str, int]
+    ) -> Callable:
+        """Wraps an exit method so that it records how long the state lasted.
+
+        Args:
+            state (str): The state being exited.
+            onExit (callable): The exit method.
+            entered (dict of str to int): When each state was last entered.
+        """
+        record = self.histogram("fsm.in" + state).record
+
+        def exitState(*args):
+            start = entered.pop(state, None)
+            if start is not None:
+                record(time.perf_counter_ns() - start)
+            onExit(*args)
+
+        return exitState
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Returns the timings of every phase, as returned by
+        LatencyHistogram.snapshot()."""
+        return {
+            name: histogram.snapshot()
+            for name, histogram in sorted(self.histograms.items())
+        }
+
+    def toPrometheus(self) -> str:
+        """Formats the timings of every phase in the Prometheus text format,
+        as one histogram labelled by phase."""
+        lines = [
+            f"# HELP {self.METRIC} Time spent in each phase of cog battles.",
+            f"# TYPE {self.METRIC} histogram",
+        ]
+        for name, histogram in sorted(self.histograms.items()):
+            label = f'phase="{name}"'
+            cumulative = 0
+            for bound, count in zip(
+                LatencyHistogram.BOUNDS_NS, histogram.counts
+            ):
+                cumulative += count
+                lines.append(
+                    f'{self.METRIC}_bucket{{{label},le="{bound / 1e9:g}"}} '
+                    f"{cumulative}"
+                )
+            lines.append(
+                f'{self.METRIC}_bucket{{{label},le="+Inf"}} {histogram.count}'
+            )
+            lines.append(
+                f"{self.METRIC}_sum{{{label}}} {histogram.totalNs / 1e9:g}"
+            )
+            lines.append(f"{self.METRIC}_count{{{label}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def writePrometheus(self, path: str) -> None:
+        """Writes the timings to a file in the Prometheus text format.
+
+        The file is replaced in one step, so a collector reading it never
+        sees a partial dump.
+
+        Args:
+            path (str): The file to write.
+        """
+        with open(path + ".tmp", "w") as file:
+            file.write(self.toPrometheus())
+        os.replace(path + ".tmp", path)
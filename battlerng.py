@@ -0,0 +1,207 @@
+"""Copyright 2021, James S. Wang, All rights reserved."""
+
+from typing import List, Optional, Sequence
+
+MASK: int = (1 << 64) - 1
+GOLDEN: int = 0x9E3779B97F4A7C15
+
+
+def counter(battleRound: int, actor: int, draw: int) -> int:
+    """Packs the position of a roll into a single counter.
+
+    Args:
+        battleRound (int): The round the roll is made in.
+        actor (int): The combatantId of the combatant rolling.
+        draw (int): How many rolls the combatant made earlier in the round.
+    """
+    return (battleRound << 40) | (actor << 16) | draw
+
+
+def roll(key: int, battleRound: int, actor: int, draw: int) -> float:
+    """Returns the roll at a position of a battle's stream, from 0 to 1.
+
+    This is SplitMix64 seeked straight to the counter, so any roll can be
+    regenerated without generating the rolls before it.
+
+    Args:
+        key (int): The key of the battle's stream.
+        battleRound (int): The round the roll is made in.
+        actor (int): The combatantId of the combatant rolling.
+        draw (int): How many rolls the combatant made earlier in the round.
+    """
+    z = (key + counter(battleRound, actor, draw) * GOLDEN) & MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK
+    return ((z ^ (z >> 31)) >> 11) * (1.0 / (1 << 53))
+
+
+def rollBlock(key: int, battleRound: int, actors: int, draws: int):
+    """Generates the first rolls of every combatant in a round at once.
+
+    Args:
+        key (int): The key of the battle's stream.
+        battleRound (int): The round to generate.
+        actors (int): Generates the rolls of combatantIds 0 to actors - 1.
+        draws (int): How many rolls to generate per combatant.
+
+    Returns:
+        ndarray of float: The rolls, shaped (actors, draws), equal to
+            calling roll() for each of them.
+    """
+    # Imported here so that battles which never need a block don't pay for
+    # NumPy.
+    import numpy as np
+
+    counters = (
+        np.uint64(battleRound << 40)
+        | (np.arange(actors, dtype=np.uint64)[:, None] << np.uint64(16))
+        | np.arange(draws, dtype=np.uint64)[None, :]
+    )
+    z = np.uint64(key) + counters * np.uint64(GOLDEN)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z ^= z >> np.uint64(31)
+    return (z >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+
+class CounterRng:
+    """A random number generator for battles whose rolls are keyed by
+    (battle, round, combatant) instead of drawn from one shared sequence.
+
+    Pass one as the rng of a battle and every combatant gets its own
+    RollStream. A combatant's n-th roll of a round is the same no matter how
+    many rolls other combatants made, or in which order, so two runs of a
+    battle only diverge at the roll that actually differs. No state needs to
+    be saved to replay a round: restoring the round is enough.
+
+    Battles with many combatants generate the first rolls of every combatant
+    in one NumPy block per round. Smaller battles, and rolls past the block,
+    are computed one at a time by roll(). Both give the same values. Either
+    way, rolling costs more than the Mersenne Twister, so use a CounterRng
+    where battles need to be replayed, sharded or compared rather than where
+    they need to be as fast as possible.
+
+    Args:
+        key (int): The key of the battle's stream, such as its ID mixed with
+            a seed.
+
+    Attributes:
+        DRAWS_PER_ROUND (int): How many rolls per combatant to generate in
+            each block. A random cog rolls three times per round, a toon once.
+        BLOCK_MIN_ACTORS (int): The fewest combatants a battle needs before
+            blocks are generated.
+        key (int): The key of the battle's stream.
+        round (int): The round that rolls are made in.
+        generation (int): Counts calls to startRound(), so that streams
+            start over even when a round is restored and played again.
+        actors (int): One more than the highest combatantId with a stream.
+        block (list of list of float): The rolls of the round of each
+            combatantId, or None if they haven't been generated yet.
+    """
+
+    DRAWS_PER_ROUND: int = 3
+    BLOCK_MIN_ACTORS: int = 32
+
+    def __init__(self, key: int) -> None:
+        self.key: int = key & MASK
+        self.round: int = 0
+        self.generation: int = 0
+        self.actors: int = 0
+        self.block: Optional[Sequence[List[float]]] = None
+
+    def stream(self, actor: int) -> "RollStream":
+        """Returns the stream of rolls of a combatant.
+
+        Args:
+            actor (int): The combatantId of the combatant.
+        """
+        self.actors = max(self.actors, actor + 1)
+        return RollStream(self, actor)
+
+    def startRound(self, battleRound: int) -> None:
+        """Moves every stream to the start of a round.
+
+        Args:
+            battleRound (int): The round to move to.
+        """
+        self.round = battleRound
+        self.generation += 1
+        self.block = None
+
+    def generateBlock(self) -> Sequence[List[float]]:
+        """Generates the block of the round, if the battle is large enough
+        for one, and returns it."""
+        if self.actors < self.BLOCK_MIN_ACTORS:
+            self.block = ()
+        else:
+            self.block = rollBlock(
+                self.key, self.round, self.actors, self.DRAWS_PER_ROUND
+            ).tolist()
+        return self.block
+
+
+class RollStream:
+    """The rolls of a single combatant, with the parts of the random.Random
+    interface that combatants use.
+
+    Args:
+        source (CounterRng): The generator of the combatant's battle.
+        actor (int): The combatantId of the combatant.
+
+    Attributes:
+        source (CounterRng): The generator of the combatant's battle.
+        actor (int): The combatantId of the combatant.
+        round (int): The round of the last roll.
+        generation (int): The generation of the generator at the last roll.
+        draw (int): How many rolls were made in that round.
+        rolls (list of float): The combatant's rolls from the round's block,
+            if it has any.
+    """
+
+    __slots__ = ("source", "actor", "round", "generation", "draw", "rolls")
+
+    def __init__(self, source: CounterRng, actor: int) -> None:
+        self.source: CounterRng = source
+        self.actor: int = actor
+        self.round: int = 0
+        self.generation: int = -1
+        self.draw: int = 0
+        self.rolls: Sequence[float] = ()
+
+    def random(self) -> float:
+        """Returns the next roll, from 0 to 1."""
+        if self.generation != self.source.generation:
+            self.startRound()
+        draw = self.draw
+        self.draw = draw + 1
+        if draw < len(self.rolls):
+            return self.rolls[draw]
+        return roll(self.source.key, self.round, self.actor, draw)
+
+    def startRound(self) -> None:
+        """Moves the stream to the start of its generator's round."""
+        source = self.source
+        self.round = source.round
+        self.generation = source.generation
+        self.draw = 0
+        block = source.block
+        if block is None:
+            block = source.generateBlock()
+        self.rolls = block[self.actor] if self.actor < len(block) else ()
+
+    def choice(self, seq: Sequence):
+        """Returns a random element of a sequence.
+
+        Args:
+            seq (sequence): The sequence to choose from, which can't be
+                empty.
+        """
+        return seq[self.randrange(len(seq))]
+
+    def randrange(self, stop: int) -> int:
+        """Returns a random integer from 0 up to, but not including, stop.
+
+        Args:
+            stop (int): The end of the range, which must be positive.
+        """
+        return int(self.random() * stop)
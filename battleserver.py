@@ -0,0 +1,548 @@
+"""Copyright 2021, James S. Wang, All rights reserved."""
+
+from battleengine import (
+    BattleAction,
+    BattleActionType,
+    BattleEngine,
+    CogBattleState,
+)
+from battleprofiler import BattleProfiler
+from battlestore import BattleStore
+from cog import Cog
+from gag import Gag
+from joinqueue import JoinQueue, JoinStats
+from toon import Toon
+from typing import Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import heapq
+import json
+import random
+import time
+
+
+class DeadlineHeap:
+    """A single heap of deadlines shared by every battle on a server.
+
+    Rescheduling or cancelling a deadline doesn't search the heap; instead,
+    each key has a generation number and stale entries are skipped when they
+    reach the top.
+
+    Attributes:
+        heap (list of tuple): Entries of (deadline, key, generation).
+        generations (dict of int to int): The live generation of each key.
+    """
+
+    def __init__(self) -> None:
+        self.heap: List[Tuple[float, int, int]] = []
+        self.generations: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.generations)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self.generations
+
+    def schedule(self, key: int, deadline: float) -> None:
+        """Sets the deadline of a key, replacing any earlier deadline.
+
+        Args:
+            key (int): The key to schedule, such as a battle ID.
+            deadline (float): When the deadline expires.
+        """
+        generation = self.generations.get(key, 0) + 1
+        self.generations[key] = generation
+        heapq.heappush(self.heap, (deadline, key, generation))
+
+    def cancel(self, key: int) -> None:
+        """Removes the deadline of a key, if it has one.
+
+        Args:
+            key (int): The key to cancel.
+        """
+        self.generations.pop(key, None)
+
+    def nextDeadline(self) -> Optional[float]:
+        """Returns the earliest live deadline, or None if there isn't one."""
+        while self.heap:
+            deadline, key, generation = self.heap[0]
+            if self.generations.get(key) == generation:
+                return deadline
+            heapq.heappop(self.heap)
+        return None
+
+    def popExpired(self, now: float) -> List[int]:
+        """Removes and returns every key whose deadline has passed.
+
+        Args:
+            now (float): The current time.
+
+        Returns:
+            list of int: The expired keys, earliest first.
+        """
+        expired = []
+        while self.heap and self.heap[0][0] <= now:
+            _, key, generation = heapq.heappop(self.heap)
+            if self.generations.get(key) == generation:
+                del self.generations[key]
+                expired.append(key)
+        return expired
+
+
+class BattleServer:
+    """Hosts many headless battles on a single asyncio event loop.
+
+    Clients send one JSON request per line over a local socket. Every request
+    names an op and, apart from createBattle, the battle it applies to:
+
+        {"op": "selectGag", "battle": 3, "value": 2}
+
+    The ops are createBattle, selectGag, selectTarget, requestToonJoin and
+    requestCogJoin. Each response reports the battle's state and round, or an
+    error. Gag select deadlines for all battles are kept in one DeadlineHeap
+    and served by one timer task.
+
+    Joins are batched: the first join of a batch schedules the pending
+    combatants to be added once the join window has passed, and the whole
+    batch then restarts gag select once, as long as the battle's join queue
+    still allows restarts this round. A join to a battle whose join queue is
+    full is answered with an error, so clients back off instead of piling
+    up.
+
+    Args:
+        waitTime (float): How long gag select lasts, in seconds.
+        seed (int): Seed for the random number generator of the battles.
+        profiler (BattleProfiler): Times the phases of every battle, if
+            given.
+        joinWindow (float): How long to collect joins for before adding them
+            to a battle, in seconds.
+        store (BattleStore): Where to save the outcome of every battle, if
+            anywhere.
+
+    Attributes:
+        waitTime (float): How long gag select lasts, in seconds.
+        rng (random.Random): The random number generator of the battles.
+        battles (dict of int to BattleEngine): The live battles by ID.
+        deadlines (DeadlineHeap): The gag select deadlines of all battles.
+        nextBattleId (int): The ID to give to the next battle.
+        timeouts (int): How many gag selects have run out of time.
+        profiler (BattleProfiler): Times the phases of every battle, if
+            profiling.
+        joinWindow (float): How long to collect joins for, in seconds.
+        joinFlushes (DeadlineHeap): When to add each battle's pending joins.
+        joinStats (JoinStats): Counts of the join requests of every battle.
+        store (BattleStore): Where to save the outcome of every battle, if
+            saving.
+    """
+
+    def __init__(
+        self,
+        waitTime: float = BattleEngine.GAG_SELECT_WAIT_TIME,
+        seed: Optional[int] = None,
+        profiler: Optional[BattleProfiler] = None,
+        joinWindow: float = 0.25,
+        store: Optional[BattleStore] = None,
+    ) -> None:
+        self.waitTime: float = waitTime
+        self.rng: random.Random = random.Random(seed)
+        self.battles: Dict[int, BattleEngine] = {}
+        self.deadlines: DeadlineHeap = DeadlineHeap()
+        self.nextBattleId: int = 0
+        self.timeouts: int = 0
+        self.wakeup: Optional[asyncio.Event] = None
+        self.profiler: Optional[BattleProfiler] = profiler
+        self.joinWindow: float = joinWindow
+        self.joinFlushes: DeadlineHeap = DeadlineHeap()
+        self.joinStats: JoinStats = JoinStats()
+        self.store: Optional[BattleStore] = store
+
+    def handleRequest(self, request: dict) -> dict:
+        """Applies a single request from a client.
+
+        Args:
+            request (dict): The decoded request, which is answered with an
+                error if it isn't a JSON object.
+
+        Returns:
+            dict: The response to send back.
+        """
+        if not isinstance(request, dict):
+            return {"error": "Requests must be JSON objects"}
+        op = request.get("op")
+        if op == "createBattle":
+            numToons = request.get("toons", 1)
+            numCogs = request.get("cogs", 1)
+            for count in (numToons, numCogs):
+                if type(count) is not int or count < 1:
+                    return {"error": f"Invalid number of combatants: {count}"}
+            return self.status(self.createBattle(numToons, numCogs))
+
+        battleId = request.get("battle")
+        battle = self.battles.get(battleId)
+        if battle is None:
+            return {"error": f"Unknown battle: {battleId}"}
+        value = request.get("value")
+        if op == "selectGag":
+            if type(value) is not int or not Gag.NONE < value < len(Gag.NAME):
+                return {"error": f"Unknown gag: {value}"}
+            action = BattleAction(BattleActionType.SELECT_GAG, value)
+        elif op == "selectTarget":
+            if type(value) is not int or not 0 <= value < len(battle.cogs):
+                return {"error": f"Unknown target: {value}"}
+            action = BattleAction(BattleActionType.SELECT_TARGET, value)
+        elif op in ("requestToonJoin", "requestCogJoin"):
+            return self.requestJoin(battleId, op == "requestToonJoin")
+        else:
+            return {"error": f"Unknown op: {op}"}
+
+        # The action is applied without stepping the battle, since a step
+        # would add the pending joins before their batch is due.
+        currentRound = battle.round
+        battle.applyAction(action)
+        if battle.round != currentRound and not battle.isOver():
+            self.startRound(battleId)
+        return self.status(battleId)
+
+    def requestJoin(self, battleId: int, isToon: bool) -> dict:
+        """Asks for a new toon or cog to join a battle in the next batch.
+
+        Args:
+            battleId (int): The ID of the battle.
+            isToon (bool): Whether a toon joins, rather than a cog.
+
+        Returns:
+            dict: The status of the battle, or an error if it is full.
+        """
+        battle = self.battles[battleId]
+        if isToon:
+            accepted = battle.requestToonJoin(Toon())
+        else:
+            accepted = battle.requestCogJoin(Cog())
+        if not accepted:
+            return dict(self.status(battleId), error="Battle is full")
+        if (
+            battle.state == CogBattleState.GAG_SELECT
+            and (battle.pendingToons or battle.pendingCogs)
+            and battleId not in self.joinFlushes
+        ):
+            self.joinFlushes.schedule(battleId, self.now() + self.joinWindow)
+            self.wakeTimers(self.now() + self.joinWindow)
+        return self.status(battleId)
+
+    def flushJoins(self, battleId: int) -> None:
+        """Adds a battle's pending joins as one batch.
+
+        Args:
+            battleId (int): The ID of the battle.
+        """
+        battle = self.battles.get(battleId)
+        if battle is None or battle.state != CogBattleState.GAG_SELECT:
+            return
+        if not battle.pendingToons and not battle.pendingCogs:
+            return
+        battle.addPendingCombatants()
+        if battle.joinQueue.requestTimerReset():
+            self.resetDeadline(battleId)
+
+    def startRound(self, battleId: int) -> None:
+        """Adds the pending joins of a battle that just started a new round
+        of gag select, and restarts its deadline.
+
+        Args:
+            battleId (int): The ID of the battle.
+        """
+        self.joinFlushes.cancel(battleId)
+        self.battles[battleId].addPendingCombatants()
+        self.resetDeadline(battleId)
+
+    def createBattle(self, numToons: int = 1, numCogs: int = 1) -> int:
+        """Creates and starts a new battle.
+
+        Args:
+            numToons (int): How many toons start in the battle, up to
+                MAX_TOONS_IN_BATTLE.
+            numCogs (int): How many cogs start in the battle, up to
+                MAX_COGS_IN_BATTLE.
+
+        Returns:
+            int: The ID of the new battle.
+        """
+        battleId = self.nextBattleId
+        self.nextBattleId += 1
+        numToons = min(numToons, BattleEngine.MAX_TOONS_IN_BATTLE)
+        numCogs = min(numCogs, BattleEngine.MAX_COGS_IN_BATTLE)
+        battle = BattleEngine(
+            [Toon() for _ in range(numToons)],
+            [Cog() for _ in range(numCogs)],
+            rng=self.rng,
+            joinQueue=JoinQueue(stats=self.joinStats),
+            store=self.store,
+        )
+        if self.profiler is not None:
+            self.profiler.attach(battle)
+        battle.start()
+        self.battles[battleId] = battle
+        self.resetDeadline(battleId)
+        return battleId
+
+    def status(self, battleId: int) -> dict:
+        """Returns the state of a battle, removing it if it is over.
+
+        Args:
+            battleId (int): The ID of the battle.
+        """
+        battle = self.battles[battleId]
+        if battle.isOver():
+            del self.battles[battleId]
+            self.deadlines.cancel(battleId)
+            self.joinFlushes.cancel(battleId)
+        return {
+            "battle": battleId,
+            "state": battle.state,
+            "round": battle.round,
+        }
+
+    def resetDeadline(self, battleId: int) -> None:
+        """Restarts the gag select deadline of a battle.
+
+        Args:
+            battleId (int): The ID of the battle.
+        """
+        deadline = self.now() + self.waitTime
+        self.deadlines.schedule(battleId, deadline)
+        self.wakeTimers(deadline)
+
+    def wakeTimers(self, deadline: float) -> None:
+        """Wakes the timer task if a new deadline is the earliest one, so it
+        doesn't sleep past it.
+
+        Args:
+            deadline (float): The deadline that was just scheduled.
+        """
+        if self.wakeup and deadline <= self.nextDeadline():
+            self.wakeup.set()
+
+    def nextDeadline(self) -> Optional[float]:
+        """Returns the earliest deadline of any battle, or None if there
+        isn't one."""
+        deadlines = [
+            deadline
+            for deadline in (
+                self.deadlines.nextDeadline(),
+                self.joinFlushes.nextDeadline(),
+            )
+            if deadline is not None
+        ]
+        return min(deadlines, default=None)
+
+    def timeOut(self, battleId: int) -> None:
+        """Ends gag select for a battle whose deadline has passed.
+
+        Args:
+            battleId (int): The ID of the battle.
+        """
+        self.timeouts += 1
+        battle = self.battles[battleId]
+        battle.timeOut()
+        if battle.isOver():
+            del self.battles[battleId]
+            self.joinFlushes.cancel(battleId)
+        else:
+            self.startRound(battleId)
+
+    def now(self) -> float:
+        """Returns the current time of the server's clock."""
+        return time.monotonic()
+
+    async def runTimers(self) -> None:
+        """Adds batches of joins and times out battles as their deadlines
+        pass, forever.
+
+        The task sleeps until the earliest deadline, or until an earlier one
+        is scheduled, so idle battles don't cost anything.
+        """
+        self.wakeup = asyncio.Event()
+        while True:
+            deadline = self.nextDeadline()
+            timeout = None if deadline is None else deadline - self.now()
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            for battleId in self.joinFlushes.popExpired(self.now()):
+                self.flushJoins(battleId)
+            for battleId in self.deadlines.popExpired(self.now()):
+                self.timeOut(battleId)
+
+    async def handleClient(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Answers requests from a single client until it disconnects.
+
+        Args:
+            reader (StreamReader): Reads the client's requests.
+            writer (StreamWriter): Writes the responses to the client.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = self.handleRequest(json.loads(line))
+                except (ValueError, KeyError, TypeError) as e:
+                    response = {"error": str(e)}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def writeMetrics(self, path: str, interval: float) -> None:
+        """Writes the profiler's timings to a file periodically, forever.
+
+        Args:
+            path (str): The file to write the Prometheus text dump to.
+            interval (float): How often to write the file, in seconds.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            self.profiler.writePrometheus(path)
+
+    async def serve(
+        self,
+        path: str,
+        metricsPath: Optional[str] = None,
+        metricsInterval: float = 10.0,
+    ) -> None:
+        """Serves clients on a Unix domain socket until cancelled.
+
+        Args:
+            path (str): The path of the socket.
+            metricsPath (str): Where to write the profiler's timings, if
+                profiling.
+            metricsInterval (float): How often to write the timings, in
+                seconds.
+        """
+        tasks = [asyncio.ensure_future(self.runTimers())]
+        if self.profiler is not None and metricsPath is not None:
+            tasks.append(
+                asyncio.ensure_future(
+                    self.writeMetrics(metricsPath, metricsInterval)
+                )
+            )
+        server = await asyncio.start_unix_server(self.handleClient, path)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if self.profiler is not None and metricsPath is not None:
+                self.profiler.writePrometheus(metricsPath)
+            if self.store is not None:
+                self.store.flush()
+
+
+async def runLoad(
+    path: str, numBattles: int, numClients: int = 10, cogs: int = 1
+) -> dict:
+    """Plays many concurrent battles against a server and measures latency.
+
+    Every battle is created up front so they are all live at once, then each
+    client keeps throwing in its share of the battles until they end.
+
+    Args:
+        path (str): The path of the server's socket.
+        numBattles (int): How many battles to hold at once.
+        numClients (int): How many connections to spread the battles over.
+        cogs (int): How many cogs are in each battle.
+
+    Returns:
+        dict: The number of actions and their latency percentiles in ms.
+    """
+    latencies: List[float] = []
+
+    async def request(reader, writer, message: dict) -> dict:
+        start = time.perf_counter()
+        writer.write(json.dumps(message).encode() + b"\n")
+        response = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - start)
+        return response
+
+    async def client(battles: int) -> None:
+        reader, writer = await asyncio.open_unix_connection(path)
+        ids = []
+        for _ in range(battles):
+            message = {"op": "createBattle", "cogs": cogs}
+            ids.append((await request(reader, writer, message))["battle"])
+        while ids:
+            response = await request(
+                reader,
+                writer,
+                {"op": "selectGag", "battle": ids[0], "value": Gag.THROW},
+            )
+            if "error" in response or response["state"] in (
+                CogBattleState.TOONS_WON,
+                CogBattleState.COGS_WON,
+            ):
+                ids.pop(0)
+            else:
+                ids.append(ids.pop(0))
+        writer.close()
+
+    start = time.perf_counter()
+    shares = [
+        numBattles // numClients + (i < numBattles % numClients)
+        for i in range(numClients)
+    ]
+    await asyncio.gather(*(client(share) for share in shares if share))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    if not latencies:
+        return {
+            "battles": numBattles,
+            "actions": 0,
+            "actionsPerSecond": 0.0,
+            "p50Ms": 0.0,
+            "p99Ms": 0.0,
+        }
+    return {
+        "battles": numBattles,
+        "actions": len(latencies),
+        "actionsPerSecond": len(latencies) / elapsed if elapsed else 0.0,
+        "p50Ms": latencies[len(latencies) // 2] * 1000,
+        "p99Ms": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hosts cog battles.")
+    parser.add_argument("command", choices=["serve", "load"])
+    parser.add_argument("--socket", default="/tmp/cogbattle.sock")
+    parser.add_argument("--battles", type=int, default=1000)
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument(
+        "--metrics", help="Profile battles and write timings to this file."
+    )
+    parser.add_argument("--metrics-interval", type=float, default=10.0)
+    parser.add_argument(
+        "--database", help="Save the outcome of every battle to this file."
+    )
+    args = parser.parse_args()
+    if args.command == "serve":
+        store = None if args.database is None else BattleStore(args.database)
+        server = BattleServer(
+            profiler=None if args.metrics is None else BattleProfiler(),
+            store=store,
+        )
+        try:
+            asyncio.run(
+                server.serve(args.socket, args.metrics, args.metrics_interval)
+            )
+        finally:
+            if store is not None:
+                store.close()
+    else:
+        result = asyncio.run(runLoad(args.socket, args.battles, args.clients))
+        print(json.dumps(result, indent=2))
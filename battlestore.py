@@ -0,0 +1,245 @@
+"""Copyright 2021, James S. Wang, All rights reserved."""
+
+from battlelog import BattleEventSubject
+from typing import List, NamedTuple, Optional, Tuple
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CombatantRecord(NamedTuple):
+    """The state of a combatant when its battle ended.
+
+    Attributes:
+        subject (str): BattleEventSubject.TOON or BattleEventSubject.COG.
+        combatantId (int): The combatant's ID within its battle.
+        cogType (int): The cog's type, or -1 for toons.
+        health (int): The combatant's health, or 0 if it was defeated.
+    """
+
+    subject: str
+    combatantId: int
+    cogType: int
+    health: int
+
+
+class BattleRecord(NamedTuple):
+    """The outcome of a battle.
+
+    Attributes:
+        outcome (str): CogBattleState.TOONS_WON or CogBattleState.COGS_WON.
+        rounds (int): How many rounds the battle lasted.
+        endedAt (float): When the battle ended, in seconds since the epoch.
+        combatants (tuple of CombatantRecord): Every toon and cog that fought
+            in the battle, including the defeated ones.
+    """
+
+    outcome: str
+    rounds: int
+    endedAt: float
+    combatants: Tuple[CombatantRecord, ...]
+
+    @classmethod
+    def fromBattle(cls, battle: "BattleEngine") -> "BattleRecord":
+        """Records a battle that just ended.
+
+        Args:
+            battle (BattleEngine): The battle, in TOONS_WON or COGS_WON.
+        """
+        toons = battle.toons + battle.pendingToons + battle.defeatedToons
+        cogs = battle.cogs + battle.pendingCogs + battle.defeatedCogs
+        return cls(
+            battle.state,
+            battle.round,
+            time.time(),
+            tuple(
+                CombatantRecord(
+                    BattleEventSubject.TOON,
+                    toon.combatantId,
+                    -1,
+                    max(toon.health, 0),
+                )
+                for toon in toons
+            )
+            + tuple(
+                CombatantRecord(
+                    BattleEventSubject.COG,
+                    cog.combatantId,
+                    cog.cogType,
+                    max(cog.health, 0),
+                )
+                for cog in cogs
+            ),
+        )
+
+
+class BattleStore:
+    """Saves the outcomes of battles to a SQLite database.
+
+    Writes are behind: record() only puts the battle on a queue, and a
+    background thread writes queued battles in batches, one transaction per
+    batch. A batch is written once it is full, once flushInterval has passed
+    since its first battle was queued, or when flush() is called, so a battle
+    loop never waits on the disk.
+
+    Args:
+        path (str): The database file, which is created if needed.
+        batchSize (int): The most battles to write per transaction.
+        flushInterval (float): The longest a queued battle waits before it is
+            written, in seconds.
+
+    Attributes:
+        SCHEMA (list of str): The statements that create the tables.
+        FLUSH (object): Put on the queue to write the current batch now.
+        path (str): The database file.
+        batchSize (int): The most battles to write per transaction.
+        flushInterval (float): The longest a queued battle waits.
+        queue (Queue): The battles waiting to be written, and control markers.
+        recorded (int): How many battles have been queued.
+        written (int): How many battles have been written.
+        transactions (int): How many transactions have been committed.
+        error (Exception): The first error raised by the writer, if any.
+        thread (Thread): The writer thread.
+    """
+
+    SCHEMA: List[str] = [
+        "CREATE TABLE IF NOT EXISTS battles ("
+        "id INTEGER PRIMARY KEY, outcome TEXT, rounds INTEGER, endedAt REAL)",
+        "CREATE TABLE IF NOT EXISTS combatants ("
+        "battleId INTEGER REFERENCES battles(id), subject TEXT, "
+        "combatantId INTEGER, cogType INTEGER, health INTEGER)",
+    ]
+    FLUSH: object = object()
+
+    def __init__(
+        self, path: str, batchSize: int = 256, flushInterval: float = 1.0
+    ) -> None:
+        self.path: str = path
+        self.batchSize: int = batchSize
+        self.flushInterval: float = flushInterval
+        self.queue: queue.Queue = queue.Queue()
+        self.recorded: int = 0
+        self.written: int = 0
+        self.transactions: int = 0
+        self.error: Optional[Exception] = None
+        self.thread: threading.Thread = threading.Thread(
+            target=self.writeLoop, name="BattleStore", daemon=True
+        )
+        self.thread.start()
+
+    def record(self, battle: "BattleEngine") -> None:
+        """Queues the outcome of a battle that just ended.
+
+        Args:
+            battle (BattleEngine): The battle, in TOONS_WON or COGS_WON.
+        """
+        self.recorded += 1
+        self.queue.put(BattleRecord.fromBattle(battle))
+
+    def flush(self) -> None:
+        """Waits until every battle queued so far has been written.
+
+        Raises:
+            Exception: The error that stopped a write, if any.
+        """
+        self.queue.put(self.FLUSH)
+        self.queue.join()
+        self.raiseError()
+
+    def close(self) -> None:
+        """Writes every queued battle and stops the writer thread.
+
+        Raises:
+            Exception: The error that stopped a write, if any.
+        """
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.raiseError()
+
+    def raiseError(self) -> None:
+        """Raises the writer's error, if it had one, in the caller's thread."""
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def connect(self) -> sqlite3.Connection:
+        """Opens the database, creating its tables if needed."""
+        connection = sqlite3.connect(self.path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        with connection:
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+        return connection
+
+    def writeLoop(self) -> None:
+        """Writes batches of battles until None is taken off the queue."""
+        try:
+            connection = self.connect()
+        except Exception as error:
+            logger.exception("Couldn't open the battle database")
+            self.error = error
+            connection = None
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            taken = 1
+            batch: List[BattleRecord] = []
+            deadline = time.monotonic() + self.flushInterval
+            while True:
+                if item is None:
+                    stopping = True
+                    break
+                if item is self.FLUSH:
+                    break
+                batch.append(item)
+                if len(batch) >= self.batchSize:
+                    break
+                try:
+                    item = self.queue.get(
+                        timeout=max(0.0, deadline - time.monotonic())
+                    )
+                except queue.Empty:
+                    break
+                taken += 1
+            # Every item taken is marked done even if the write fails, so
+            # flush() never waits on a batch that will never be written.
+            try:
+                if batch and connection is not None:
+                    self.writeBatch(connection, batch)
+            except Exception as error:
+                logger.exception("Couldn't write a batch of battles")
+                self.error = self.error or error
+            finally:
+                for _ in range(taken):
+                    self.queue.task_done()
+        if connection is not None:
+            connection.close()
+
+    def writeBatch(
+        self, connection: sqlite3.Connection, batch: List[BattleRecord]
+    ) -> None:
+        """Writes a batch of battles in one transaction.
+
+        Args:
+            connection (Connection): The database, owned by the writer.
+            batch (list of BattleRecord): The battles to write.
+        """
+        with connection:
+            for record in batch:
+                battleId = connection.execute(
+                    "INSERT INTO battles (outcome, rounds, endedAt) "
+                    "VALUES (?, ?, ?)",
+                    record[:3],
+                ).lastrowid
+                connection.executemany(
+                    "INSERT INTO combatants VALUES (?, ?, ?, ?, ?)",
+                    [(battleId,) + combatant for combatant in record[3]],
+                )
+        self.written += len(batch)
+        self.transactions += 1
@@ -0,0 +1,245 @@
+"""Copyright 2021, James S. Wang, All rights reserved."""
+
+from array import array
+from typing import Dict, List, Optional, Tuple
+import csv
+import json
+import os
+import pickle
+
+
+class BattleTables:
+    """Gag and cog data compiled into flat lookup tables with integer IDs.
+
+    Gag IDs start at 1 in the order the gags are listed, since 0 is reserved
+    for Gag.NONE. Every row of the cog attack table is its own attack, so two
+    suits can share an attack name with different damage.
+
+    Attributes:
+        VERSION (int): Changes whenever the compiled layout changes, which
+            invalidates old caches.
+        gagNames (list of str): Name of each gag.
+        gagIds (dict of str to int): Maps gag names to gag IDs.
+        gagTracks (list of str): Name of each track, by track ID.
+        gagTrack (array of int): Track ID of each gag.
+        gagLevel (array of int): Level of each gag.
+        gagDamage (array of int): Damage of each gag.
+        gagChanceToHit (array of float): Chance to hit of each gag.
+        gagTargetRequired (list of int): Gags that require a target.
+        gagExecuteOrder (list of int): Gags that are executed, in order.
+        cogTypes (list of tuple): The (suit, level) of each cog type.
+        cogTypeIds (dict of tuple to int): Maps (suit, level) to cog type IDs.
+        cogHealth (array of int): Health of each cog type.
+        cogAttackNames (list of str): Name of each cog attack.
+        cogAttackDamage (array of int): Damage of each cog attack.
+        cogAttackChanceToHit (array of float): Chance to hit of each attack.
+        cogAttacks (list of list of int): Attack IDs of each cog type.
+    """
+
+    VERSION: int = 1
+
+    def __init__(self) -> None:
+        self.gagNames: List[str] = ["None"]
+        self.gagIds: Dict[str, int] = {}
+        self.gagTracks: List[str] = []
+        self.gagTrack: array = array("i", [-1])
+        self.gagLevel: array = array("i", [0])
+        self.gagDamage: array = array("i", [0])
+        self.gagChanceToHit: array = array("d", [0.0])
+        self.gagTargetRequired: List[int] = []
+        self.gagExecuteOrder: List[int] = []
+        self.cogTypes: List[Tuple[str, int]] = []
+        self.cogTypeIds: Dict[Tuple[str, int], int] = {}
+        self.cogHealth: array = array("i")
+        self.cogAttackNames: List[str] = []
+        self.cogAttackDamage: array = array("i")
+        self.cogAttackChanceToHit: array = array("d")
+        self.cogAttacks: List[List[int]] = []
+
+    @classmethod
+    def compile(
+        cls, gags: List[dict], cogs: List[dict], cogAttacks: List[dict]
+    ) -> "BattleTables":
+        """Compiles rows of gag and cog data into lookup tables.
+
+        Args:
+            gags (list of dict): Rows with name, track, level, damage,
+                chanceToHit, targetRequired and executeOrder. Gags with an
+                executeOrder of 0 are never executed.
+            cogs (list of dict): Rows with suit, level and health.
+            cogAttacks (list of dict): Rows with suit, level, name, damage and
+                chanceToHit.
+
+        Returns:
+            BattleTables: The compiled tables.
+        """
+        tables = cls()
+        executeOrder = []
+        for row in gags:
+            gag = len(tables.gagNames)
+            track = row["track"]
+            if track not in tables.gagTracks:
+                tables.gagTracks.append(track)
+            tables.gagNames.append(row["name"])
+            tables.gagIds[row["name"]] = gag
+            tables.gagTrack.append(tables.gagTracks.index(track))
+            tables.gagLevel.append(int(row["level"]))
+            tables.gagDamage.append(int(row["damage"]))
+            tables.gagChanceToHit.append(float(row["chanceToHit"]))
+            if int(row["targetRequired"]):
+                tables.gagTargetRequired.append(gag)
+            if int(row["executeOrder"]):
+                executeOrder.append((int(row["executeOrder"]), gag))
+        tables.gagExecuteOrder = [gag for _, gag in sorted(executeOrder)]
+
+        for row in cogs:
+            cogType = (row["suit"], int(row["level"]))
+            tables.cogTypeIds[cogType] = len(tables.cogTypes)
+            tables.cogTypes.append(cogType)
+            tables.cogHealth.append(int(row["health"]))
+            tables.cogAttacks.append([])
+        for row in cogAttacks:
+            cogType = tables.cogTypeIds[(row["suit"], int(row["level"]))]
+            tables.cogAttacks[cogType].append(len(tables.cogAttackNames))
+            tables.cogAttackNames.append(row["name"])
+            tables.cogAttackDamage.append(int(row["damage"]))
+            tables.cogAttackChanceToHit.append(float(row["chanceToHit"]))
+        return tables
+
+    def gagId(self, name: str) -> int:
+        """Returns the ID of the gag with a name.
+
+        Args:
+            name (str): The name of the gag.
+        """
+        return self.gagIds[name]
+
+    def cogType(self, suit: str, level: int) -> int:
+        """Returns the ID of the cog type with a suit and level.
+
+        Args:
+            suit (str): The suit of the cog.
+            level (int): The level of the cog.
+        """
+        return self.cogTypeIds[(suit, level)]
+
+    def cogAttackId(self, cogType: int, name: str) -> int:
+        """Returns the ID of one of a cog type's attacks.
+
+        Args:
+            cogType (int): The ID of the cog type.
+            name (str): The name of the attack.
+        """
+        for attack in self.cogAttacks[cogType]:
+            if self.cogAttackNames[attack] == name:
+                return attack
+        raise KeyError(name)
+
+
+DEFAULT_TABLES_PATH: str = os.path.join(os.path.dirname(__file__), "data")
+TABLE_FILES: Dict[str, str] = {
+    "gags": "gags.csv",
+    "cogs": "cogs.csv",
+    "cogAttacks": "cogattacks.csv",
+}
+
+
+def readRows(path: str) -> Dict[str, List[dict]]:
+    """Reads the rows of every table from a directory of CSVs or a JSON file.
+
+    A JSON file holds an object with gags, cogs and cogAttacks keys, each a
+    list of rows.
+
+    Args:
+        path (str): The directory or JSON file to read.
+
+    Returns:
+        dict of str to list of dict: The rows of each table.
+    """
+    if not os.path.isdir(path):
+        with open(path) as file:
+            data = json.load(file)
+        return {table: data[table] for table in TABLE_FILES}
+    rows = {}
+    for table, fileName in TABLE_FILES.items():
+        with open(os.path.join(path, fileName), newline="") as file:
+            rows[table] = list(csv.DictReader(file))
+    return rows
+
+
+def sourceKey(path: str) -> tuple:
+    """Returns a key that changes whenever the tables at a path change.
+
+    Args:
+        path (str): The directory or JSON file of the tables.
+    """
+    paths = (
+        [os.path.join(path, fileName) for fileName in TABLE_FILES.values()]
+        if os.path.isdir(path)
+        else [path]
+    )
+    stats = [os.stat(p) for p in paths]
+    return (BattleTables.VERSION,) + tuple(
+        (s.st_mtime_ns, s.st_size) for s in stats
+    )
+
+
+def cachePathFor(path: str) -> str:
+    """Returns where the compiled tables for a path are cached.
+
+    Args:
+        path (str): The directory or JSON file of the tables.
+    """
+    if os.path.isdir(path):
+        return os.path.join(path, "compiled.cache")
+    return path + ".cache"
+
+
+def loadBattleTables(
+    path: str = DEFAULT_TABLES_PATH, cachePath: Optional[str] = None
+) -> BattleTables:
+    """Loads compiled tables, compiling and caching them if they changed.
+
+    Args:
+        path (str): The directory of CSVs or JSON file to load.
+        cachePath (str): Where to cache the compiled tables. Defaults to next
+            to the source tables.
+
+    Returns:
+        BattleTables: The compiled tables.
+    """
+    cachePath = cachePathFor(path) if cachePath is None else cachePath
+    key = sourceKey(path)
+    try:
+        with open(cachePath, "rb") as file:
+            cachedKey, tables = pickle.load(file)
+        if cachedKey == key:
+            return tables
+    except Exception:
+        # A cache that can't be read, or that was pickled by another version
+        # of the tables, is compiled again from the source tables.
+        pass
+
+    rows = readRows(path)
+    tables = BattleTables.compile(
+        rows["gags"], rows["cogs"], rows["cogAttacks"]
+    )
+    # The cache is written to a temporary file of this process first, so
+    # that a crash or another process compiling at the same time never
+    # leaves a torn cache behind.
+    tempPath = f"{cachePath}.{os.getpid()}.tmp"
+    try:
+        with open(tempPath, "wb") as file:
+            pickle.dump((key, tables), file, pickle.HIGHEST_PROTOCOL)
+        os.replace(tempPath, cachePath)
+    except OSError:
+        # The cache is only an optimization, so a read-only directory just
+        # means compiling every time.
+        try:
+            os.remove(tempPath)
+        except OSError:
+            pass
+    return tables
+
+
+TABLES: BattleTables = loadBattleTables()
@@ -0,0 +1,608 @@
+"""Copyright 2021, James S. Wang, All rights reserved."""
+
+from battleengine import BattleAction, BattleActionType, BattleEngine
+from battlelog import NullEventSink
+from battlerng import CounterRng
+from cog import Cog
+from cogstrategy import (
+    CogStrategy,
+    ExpectedDamageStrategy,
+    FocusFireStrategy,
+    LowestLaffStrategy,
+    RandomStrategy,
+)
+from gag import Gag
+from toon import Toon
+from typing import Dict, List, Optional, Tuple
+import argparse
+import functools
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+DEFAULT_ROSTERS: List[Tuple[int, int]] = [
+    (1, 1),
+    (2, 2),
+    (BattleEngine.MAX_TOONS_IN_BATTLE, BattleEngine.MAX_COGS_IN_BATTLE),
+    (
+        2 * BattleEngine.MAX_TOONS_IN_BATTLE,
+        2 * BattleEngine.MAX_COGS_IN_BATTLE,
+    ),
+]
+RAID_ROSTERS: List[Tuple[int, int]] = [
+    (4, 4),
+    (8, 8),
+    (16, 16),
+    (32, 32),
+    (64, 64),
+]
+IMPORT_MODULES: List[str] = [
+    "battleengine",
+    "gagpolicy",
+    "outcomesolver",
+    "replay",
+    "battlefarm",
+    "batchsim",
+    "balancesweep",
+    "battleanalytics",
+    "battleserver",
+    "cogbattle",
+    "main",
+]
+
+
+@functools.lru_cache(maxsize=None)
+def loadCogBattle() -> Optional[type]:
+    """Imports CogBattle with an offscreen window.
+
+    Panda3D takes longer to import than the rest of the benchmarks put
+    together, so it's only imported once a benchmark needs it.
+
+    Returns:
+        type: The CogBattle class, or None if Panda3D isn't installed.
+    """
+    try:
+        from panda3d.core import loadPrcFileData
+
+        loadPrcFileData("", "window-type offscreen")
+        from cogbattle import CogBattle
+    except ImportError:
+        return None
+    return CogBattle
+
+
+def summarize(samples: List[int]) -> Dict[str, float]:
+    """Summarizes latency samples.
+
+    Args:
+        samples (list of int): Latencies in nanoseconds.
+
+    Returns:
+        dict of str to float: The count, mean, p50, p99 and max in
+            microseconds.
+    """
+    samples = sorted(samples)
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "meanUs": sum(samples) / len(samples) / 1000,
+        "p50Us": samples[len(samples) // 2] / 1000,
+        "p99Us": samples[int(len(samples) * 0.99)] / 1000,
+        "maxUs": samples[-1] / 1000,
+    }
+
+
+def newBattle(numToons: int, numCogs: int, rng: random.Random) -> BattleEngine:
+    """Creates and starts a silent headless battle.
+
+    Args:
+        numToons (int): How many toons start in the battle.
+        numCogs (int): How many cogs start in the battle.
+        rng (random.Random): The random number generator of the battle.
+    """
+    battle = BattleEngine(
+        [Toon() for _ in range(numToons)],
+        [Cog() for _ in range(numCogs)],
+        rng=rng,
+    )
+    battle.start()
+    return battle
+
+
+def selectAll(battle: BattleEngine, rng: random.Random) -> None:
+    """Selects a throw at a random cog for every toon without executing.
+
+    Args:
+        battle (BattleEngine): The battle to select gags in.
+        rng (random.Random): The random number generator for targets.
+    """
+    for toon in battle.toons:
+        toon.selectedGag = Gag.THROW
+        toon.selectedTarget = rng.choice(battle.cogs).combatantId
+
+
+def benchmarkThroughput(
+    numBattles: int, numToons: int = 1, numCogs: int = 1, seed: int = 0
+) -> Dict[str, float]:
+    """Plays full battles back to back and measures how many finish a second.
+
+    Args:
+        numBattles (int): How many battles to play.
+        numToons (int): How many toons start in each battle.
+        numCogs (int): How many cogs start in each battle.
+        seed (int): Seed for the random number generator.
+
+    Returns:
+        dict of str to float: The battles, rounds and their rates.
+    """
+    rng = random.Random(seed)
+    rounds = 0
+    start = time.perf_counter()
+    for _ in range(numBattles):
+        battle = newBattle(numToons, numCogs, rng)
+        while not battle.isOver():
+            actions = []
+            for _ in battle.toons:
+                actions.append(
+                    BattleAction(BattleActionType.SELECT_GAG, Gag.THROW)
+                )
+                if len(battle.cogs) > 1:
+                    actions.append(
+                        BattleAction(
+                            BattleActionType.SELECT_TARGET,
+                            rng.randrange(len(battle.cogs)),
+                        )
+                    )
+            battle.step(actions)
+        rounds += battle.round
+    elapsed = time.perf_counter() - start
+    return {
+        "battles": numBattles,
+        "rounds": rounds,
+        "seconds": elapsed,
+        "battlesPerSecond": numBattles / elapsed,
+        "roundsPerSecond": rounds / elapsed,
+    }
+
+
+def benchmarkRoundLatency(
+    numRounds: int, numToons: int = 1, numCogs: int = 1, seed: int = 0
+) -> Dict[str, Dict[str, float]]:
+    """Measures single calls of executeGags() and attackToons().
+
+    Each call is made on a fresh battle, so every sample covers a full round
+    of attacks rather than a battle that has already been won.
+
+    Args:
+        numRounds (int): How many rounds to sample.
+        numToons (int): How many toons are in each battle.
+        numCogs (int): How many cogs are in each battle.
+        seed (int): Seed for the random number generator.
+
+    Returns:
+        dict of str to dict: Latency summaries of each method.
+    """
+    rng = random.Random(seed)
+    samples: Dict[str, List[int]] = {"executeGags": [], "attackToons": []}
+    for _ in range(numRounds):
+        battle = newBattle(numToons, numCogs, rng)
+        selectAll(battle, rng)
+        start = time.perf_counter_ns()
+        battle.executeGags()
+        samples["executeGags"].append(time.perf_counter_ns() - start)
+
+        battle = newBattle(numToons, numCogs, rng)
+        start = time.perf_counter_ns()
+        battle.attackToons()
+        samples["attackToons"].append(time.perf_counter_ns() - start)
+    return {name: summarize(times) for name, times in samples.items()}
+
+
+def benchmarkActionLatency(
+    numRounds: int, numToons: int = 4, numCogs: int = 4, seed: int = 0
+) -> Dict[str, Dict[str, float]]:
+    """Measures gag select actions that don't end gag select.
+
+    Every round is sampled on a fresh battle so that the roster stays full.
+    The last toon's target is applied untimed, since it executes the round.
+
+    Args:
+        numRounds (int): How many rounds of gag select to sample.
+        numToons (int): How many toons are in each battle.
+        numCogs (int): How many cogs are in each battle. Must be more than 1
+            so that targets are selected separately.
+        seed (int): Seed for the random number generator.
+
+    Returns:
+        dict of str to dict: Latency summaries of each action type.
+    """
+    rng = random.Random(seed)
+    samples: Dict[str, List[int]] = {
+        BattleActionType.SELECT_GAG: [],
+        BattleActionType.SELECT_TARGET: [],
+    }
+    for _ in range(numRounds):
+        battle = newBattle(numToons, numCogs, rng)
+        actions = []
+        for _ in range(numToons):
+            actions.append(
+                BattleAction(BattleActionType.SELECT_GAG, Gag.THROW)
+            )
+            actions.append(
+                BattleAction(
+                    BattleActionType.SELECT_TARGET, rng.randrange(numCogs)
+                )
+            )
+        for action in actions[:-1]:
+            start = time.perf_counter_ns()
+            battle.applyAction(action)
+            samples[action.actionType].append(time.perf_counter_ns() - start)
+        battle.applyAction(actions[-1])
+    return {name: summarize(times) for name, times in samples.items()}
+
+
+def benchmarkRosterScaling(
+    numRounds: int,
+    rosters: List[Tuple[int, int]] = RAID_ROSTERS,
+    seed: int = 0,
+) -> List[dict]:
+    """Measures how the cost of a round grows with the size of the battle.
+
+    Each sample plays one full round on a fresh battle: every toon selects a
+    throw at a random cog by its combatantId, then the gags are executed and
+    the cogs attack. If selections and attacks stay constant time, the cost
+    per combatant stays flat as the rosters grow.
+
+    Args:
+        numRounds (int): How many rounds to sample per roster.
+        rosters (list of tuple): The (toons, cogs) sizes to measure.
+        seed (int): Seed for the random number generator.
+
+    Returns:
+        list of dict: The latency summary of a round and the mean cost per
+            combatant of each roster size.
+    """
+    rng = random.Random(seed)
+    results = []
+    for numToons, numCogs in rosters:
+        samples = []
+        for _ in range(numRounds):
+            battle = newBattle(numToons, numCogs, rng)
+            targets = [
+                rng.choice(battle.cogs).combatantId for _ in battle.toons
+            ]
+            start = time.perf_counter_ns()
+            for target in targets:
+                battle.selectGag(Gag.THROW)
+                if numCogs > 1:
+                    battle.selectTargetById(target)
+            samples.append(time.perf_counter_ns() - start)
+        summary = summarize(samples)
+        results.append(
+            {
+                "toons": numToons,
+                "cogs": numCogs,
+                "round": summary,
+                "usPerCombatant": summary["meanUs"] / (numToons + numCogs),
+            }
+        )
+    return results
+
+
+def benchmarkRngRounds(
+    numRounds: int,
+    rosters: List[Tuple[int, int]] = [(4, 4), (32, 32)],
+    seed: int = 0,
+) -> List[dict]:
+    """Compares the cost of the attacks of a round when rolling with the
+    Mersenne Twister and with a CounterRng.
+
+    Args:
+        numRounds (int): How many rounds to sample per roster and generator.
+        rosters (list of tuple): The (toons, cogs) sizes to measure.
+        seed (int): Seed for the random number generators.
+
+    Returns:
+        list of dict: The mean microseconds of executeGags() and
+            attackToons() with each generator, for each roster size.
+    """
+    rng = random.Random(seed)
+    results = []
+    for numToons, numCogs in rosters:
+        result = {"toons": numToons, "cogs": numCogs}
+        for name, newRng in (
+            ("mersenneTwister", lambda i: random.Random(i)),
+            ("counter", lambda i: CounterRng(i)),
+        ):
+            total = 0
+            for i in range(numRounds):
+                battle = newBattle(numToons, numCogs, newRng(seed + i))
+                selectAll(battle, rng)
+                start = time.perf_counter_ns()
+                battle.executeGags()
+                battle.attackToons()
+                total += time.perf_counter_ns() - start
+            result[name + "Us"] = total / numRounds / 1000
+        results.append(result)
+    return results
+
+
+def benchmarkCogStrategies(
+    numRounds: int,
+    rosters: List[Tuple[int, int]] = RAID_ROSTERS,
+    seed: int = 0,
+) -> List[dict]:
+    """Measures what each cog strategy costs per cog as rosters grow.
+
+    Args:
+        numRounds (int): How many rounds to sample per roster and strategy.
+        rosters (list of tuple): The (toons, cogs) sizes to measure.
+        seed (int): Seed for the random number generators.
+
+    Returns:
+        list of dict: The mean microseconds per cog of attackToons() with
+            each strategy, for each roster size.
+    """
+    strategies: Dict[str, CogStrategy] = {
+        "random": RandomStrategy(),
+        "lowestLaff": LowestLaffStrategy(),
+        "focusFire": FocusFireStrategy(),
+        "expectedDamage": ExpectedDamageStrategy(),
+    }
+    rng = random.Random(seed)
+    results = []
+    for numToons, numCogs in rosters:
+        result = {"toons": numToons, "cogs": numCogs}
+        for name, strategy in strategies.items():
+            total = 0
+            for i in range(numRounds):
+                battle = newBattle(numToons, numCogs, random.Random(seed + i))
+                battle.cogStrategy = strategy
+                selectAll(battle, rng)
+                start = time.perf_counter_ns()
+                battle.attackToons()
+                total += time.perf_counter_ns() - start
+            result[name + "UsPerCog"] = total / numRounds / numCogs / 1000
+        results.append(result)
+    return results
+
+
+def measureMemory(create, count: int) -> float:
+    """Measures how much memory each object made by a factory holds.
+
+    Args:
+        create (callable): Creates a single live object.
+        count (int): How many objects to keep alive at once.
+
+    Returns:
+        float: The average number of bytes allocated per object.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        objects = [create() for _ in range(count)]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del objects
+    return (after - before) / count
+
+
+def benchmarkMemory(
+    count: int, rosters: List[Tuple[int, int]] = DEFAULT_ROSTERS
+) -> List[dict]:
+    """Measures the memory of live battles across roster sizes.
+
+    CogBattle is only measured if Panda3D can be imported. Its gag select
+    timers are stopped before measuring so the task manager doesn't hold on
+    to the battles.
+
+    Args:
+        count (int): How many battles of each roster to keep alive at once.
+        rosters (list of tuple): The (toons, cogs) sizes to measure.
+
+    Returns:
+        list of dict: The bytes per battle of each roster size.
+    """
+    rng = random.Random(0)
+    CogBattle = loadCogBattle()
+
+    def newCogBattle(numToons: int, numCogs: int) -> "CogBattle":
+        battle = CogBattle(
+            [Toon() for _ in range(numToons)],
+            [Cog() for _ in range(numCogs)],
+            rng=rng,
+            eventSink=NullEventSink(),
+        )
+        battle.startCogBattle()
+        battle.cogBattleFSM.stopGagSelectTimer()
+        return battle
+
+    results = []
+    for numToons, numCogs in rosters:
+        results.append(
+            {
+                "toons": numToons,
+                "cogs": numCogs,
+                "battleEngineBytes": measureMemory(
+                    lambda: newBattle(numToons, numCogs, rng), count
+                ),
+                "cogBattleBytes": (
+                    None
+                    if CogBattle is None
+                    else measureMemory(
+                        lambda: newCogBattle(numToons, numCogs), count
+                    )
+                ),
+            }
+        )
+    return results
+
+
+def measureImport(module: str) -> Optional[Tuple[int, int, bool]]:
+    """Imports a module in a fresh interpreter, the way a worker process or
+    command line tool starts up.
+
+    Args:
+        module (str): The name of the module to import.
+
+    Returns:
+        tuple: The nanoseconds the import took, the nanoseconds from starting
+            the interpreter until it exited, and whether the import loaded
+            Panda3D. None if the module couldn't be imported.
+    """
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter_ns()\n"
+        f"import {module}\n"
+        "print(time.perf_counter_ns() - start)\n"
+        "print(any(name.partition('.')[0] in ('panda3d', 'direct')"
+        " for name in sys.modules))\n"
+    )
+    start = time.perf_counter_ns()
+    process = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    coldStart = time.perf_counter_ns() - start
+    if process.returncode:
+        return None
+    importTime, loadsPanda3D = process.stdout.split()
+    return int(importTime), coldStart, loadsPanda3D == "True"
+
+
+def benchmarkImportTime(
+    repeats: int, modules: List[str] = IMPORT_MODULES
+) -> Dict[str, Optional[dict]]:
+    """Measures how long each module takes to import from a cold start.
+
+    Args:
+        repeats (int): How many fresh interpreters to import each module in.
+        modules (list of str): The modules to import.
+
+    Returns:
+        dict of str to dict: Latency summaries of the import and of the
+            whole interpreter, and whether the module loads Panda3D. None for
+            modules that couldn't be imported.
+    """
+    results: Dict[str, Optional[dict]] = {}
+    for module in modules:
+        samples = [measureImport(module) for _ in range(repeats)]
+        if None in samples:
+            results[module] = None
+            continue
+        results[module] = {
+            "import": summarize([sample[0] for sample in samples]),
+            "coldStart": summarize([sample[1] for sample in samples]),
+            "loadsPanda3D": any(sample[2] for sample in samples),
+        }
+    return results
+
+
+def runBenchmarks(scale: float = 1.0, seed: int = 0) -> dict:
+    """Runs every benchmark.
+
+    Args:
+        scale (float): Multiplies the amount of work of every benchmark, so CI
+            can run a quick pass and a workstation a longer one.
+        seed (int): Seed for the random number generators.
+
+    Returns:
+        dict: The results, along with the environment they were measured in.
+    """
+
+    def size(n: int) -> int:
+        return max(1, int(n * scale))
+
+    maxToons = BattleEngine.MAX_TOONS_IN_BATTLE
+    maxCogs = BattleEngine.MAX_COGS_IN_BATTLE
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "system": platform.system(),
+            "panda3d": loadCogBattle() is not None,
+        },
+        "throughput": {
+            "1v1": benchmarkThroughput(size(2000), 1, 1, seed),
+            f"{maxToons}v{maxCogs}": benchmarkThroughput(
+                size(500), maxToons, maxCogs, seed
+            ),
+        },
+        "roundLatency": benchmarkRoundLatency(
+            size(5000), maxToons, maxCogs, seed
+        ),
+        "actionLatency": benchmarkActionLatency(
+            size(2000), maxToons, maxCogs, seed
+        ),
+        "rosterScaling": benchmarkRosterScaling(size(200), seed=seed),
+        "rngRounds": benchmarkRngRounds(size(500), seed=seed),
+        "cogStrategies": benchmarkCogStrategies(size(200), seed=seed),
+        "memory": benchmarkMemory(size(500)),
+        "importTime": benchmarkImportTime(size(20)),
+    }
+
+
+def compareResults(
+    baseline: dict, results: dict, tolerance: float = 0.2
+) -> List[str]:
+    """Finds throughput benchmarks that regressed against a baseline.
+
+    Args:
+        baseline (dict): Results of an earlier run of runBenchmarks().
+        results (dict): Results of the current run.
+        tolerance (float): The fraction of throughput that may be lost before
+            it counts as a regression.
+
+    Returns:
+        list of str: A description of each regression.
+    """
+    regressions = []
+    for name, result in results["throughput"].items():
+        expected = baseline.get("throughput", {}).get(name)
+        if expected is None:
+            continue
+        limit = expected["battlesPerSecond"] * (1 - tolerance)
+        if result["battlesPerSecond"] < limit:
+            regressions.append(
+                f"{name}: {result['battlesPerSecond']:.0f} battles/s, "
+                f"expected at least {limit:.0f}"
+            )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks cog battles.")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this file.")
+    parser.add_argument(
+        "--baseline", help="Fail if throughput regressed from this file."
+    )
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    results = runBenchmarks(args.scale, args.seed)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compareResults(
+                json.load(file), results, args.tolerance
+            )
+        for regression in regressions:
+            print(regression, file=sys.stderr)
+        sys.exit(1 if regressions else 0)
@@ -1,88 +1,112 @@
 """Copyright 2021, James S. Wang, All rights reserved."""
 
+from battlelog import BattleEventSubject, BattleEventType
+from battletables import TABLES
 from combatant import Combatant
 import random
-from typing import List, Dict
+from typing import List
 from overrides import overrides
 
 
 class Cog:
     """Represents a cog as it would in the normal gameplay mode.
 
+    Args:
+        suit (str): The suit of the cog.
+        level (int): The level of the cog.
+
     Attributes:
-        health (int): Hardcoded health of the cog is set to 12. Ideally, we
-            would pass in the cog's suit and level to the constructor and
-            health would automatically be determined according to some table.
+        DEFAULT_SUIT (str): The suit of cogs that don't specify one.
+        cogType (int): The ID of the cog's suit and level in the battle
+            tables.
+        health (int): Health of the cog, determined by its suit and level.
     """
 
-    def __init__(self) -> None:
-        self.health: int = 12
+    DEFAULT_SUIT: str = "Generic"
+    __slots__ = ("cogType", "health")
+
+    def __init__(self, suit: str = DEFAULT_SUIT, level: int = 1) -> None:
+        self.cogType: int = TABLES.cogType(suit, level)
+        self.health: int = TABLES.cogHealth[self.cogType]
 
 
 class CogCombatant(Combatant):
     """Represents a cog, an AI combatant.
 
-    Currently attacks, damage, and chance to hit are hardcoded; however,
-    ideally these values would be read from a spreadsheet or filled through
-    another more flexible method.
+    Attacks, damage, and chance to hit are read from the battle tables
+    according to the cog's suit and level.
 
     Args:
         battle (CogBattle): The CogBattle that instantiates this cog.
         cog (Cog): The cog to base this combatant off of.
         deterministic (bool): Whether the combatant's actions are
             deterministic. Used for unit testing.
+        rng (random.Random): The random number generator to roll with.
 
     Attributes:
-        ATTACK_A (str): Generic attack 1.
-        ATTACK_B (str): Generic attack 2.
-        ATTACKS (list of str): All attacks this cog can execute.
-        DAMAGE (dict of str to int): Damage of each attack.
-        CHANCE_TO_HIT (dict of str to float): Chance of each attack hitting,
-            from 0 to 1.
-        selectedAttack (str): The attack to use when executing an attack.
+        ATTACK_A (int): Generic attack 1.
+        ATTACK_B (int): Generic attack 2.
+        ATTACKS (list of int): All attacks a default cog can execute.
+        DAMAGE (array of int): Damage of each attack.
+        CHANCE_TO_HIT (array of float): Chance of each attack hitting, from 0
+            to 1.
+        NAME (list of str): Name of each attack.
+        cogType (int): The ID of the cog's suit and level.
+        attacks (list of int): All attacks this cog can execute.
+        selectedAttack (int): The attack to use when executing an attack.
+        selectedTarget (int): The index of the toon to attack in the
+            battle's toons. Only valid during the cogs' attacks.
     """
 
-    ATTACK_A: str = "Attack A"
-    ATTACK_B: str = "Attack B"
-    ATTACKS: List[str] = [ATTACK_A, ATTACK_B]
-    DAMAGE: Dict[str, int] = {ATTACK_A: 2, ATTACK_B: 3}
-    CHANCE_TO_HIT: Dict[str, float] = {ATTACK_A: 0.85, ATTACK_B: 0.6}
+    SUBJECT: str = BattleEventSubject.COG
+    ATTACKS: List[int] = TABLES.cogAttacks[TABLES.cogType(Cog.DEFAULT_SUIT, 1)]
+    ATTACK_A: int = ATTACKS[0]
+    ATTACK_B: int = ATTACKS[1]
+    DAMAGE = TABLES.cogAttackDamage
+    CHANCE_TO_HIT = TABLES.cogAttackChanceToHit
+    NAME: List[str] = TABLES.cogAttackNames
+    __slots__ = ("cogType", "attacks", "selectedAttack", "selectedTarget")
 
     def __init__(
-        self, battle: "CogBattle", cog: Cog, deterministic: bool = False
+        self,
+        battle: "CogBattle",
+        cog: Cog,
+        deterministic: bool = False,
+        rng: random.Random = None,
     ) -> None:
-        super().__init__(battle, deterministic)
+        super().__init__(battle, deterministic, rng)
         self.health: int = cog.health
-        self.selectedAttack: str = self.ATTACK_A
+        self.cogType: int = cog.cogType
+        self.attacks: List[int] = TABLES.cogAttacks[cog.cogType]
+        self.selectedAttack: int = self.attacks[0]
+        self.selectedTarget: int = 0
 
     @overrides
     def executeAttack(self):
         if self.battle.toons:
-            self.selectAttack()
-            target = (
-                self.battle.toons[0]
-                if self.isDeterministic
-                else random.choice(self.battle.toons)
-            )
+            target = self.battle.toons[self.selectedTarget]
             target.takeDamage(self.DAMAGE[self.selectedAttack])
 
     def selectAttack(self) -> None:
-        """Sets the selectedAttack attribute to a random attack, or the first
-        one if this combatant is set to be deterministic."""
-        self.selectedAttack = (
-            self.ATTACKS[0]
-            if self.isDeterministic
-            else random.choice(self.ATTACKS)
-        )
+        """Sets the selectedAttack and selectedTarget attributes, as chosen
+        by the battle's cog strategy. Called once per turn, before
+        isAttackHit()."""
+        if self.battle.toons:
+            self.selectedAttack, self.selectedTarget = (
+                self.battle.cogStrategy.choose(self, self.battle.threats)
+            )
 
     @overrides
     def isAttackHit(self) -> bool:
-        self.selectAttack()
         isHit = (
             True
             if self.isDeterministic
-            else random.random()
+            else self.rng.random()
             < CogCombatant.CHANCE_TO_HIT[self.selectedAttack]
         )
-        print(f"The cog {'hit' if isHit else 'missed'}")
+        self.battle.eventSink.emit(
+            BattleEventType.HIT if isHit else BattleEventType.MISS,
+            self.SUBJECT,
+            value=self.selectedAttack,
+        )
         return isHit
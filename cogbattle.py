@@ -1,24 +1,23 @@
 """Copyright 2021, James S. Wang, All rights reserved."""
 
-from cog import Cog, CogCombatant
+from battleengine import BattleEngine, BattleSnapshot, CogBattleState
+from battlelog import (
+    BattleEventSink,
+    BattleEventSubject,
+    BattleEventType,
+    ConsoleEventSink,
+)
+from cog import Cog
+from cogstrategy import CogStrategy
 from direct.fsm.FSM import FSM
 from direct.task import Task
 from direct.task.TaskManagerGlobal import taskMgr
-from gag import Gag
-from toon import Toon, ToonCombatant
-from typing import Dict, List
+from joinqueue import JoinQueue
+from overrides import overrides
+from toon import Toon
+from typing import Dict, List, Optional
 from utils import TimePrinter
-import math
-
-
-class CogBattleState:
-    """Namespace for the different states possible in the CogBattleFSM"""
-
-    GAG_SELECT: str = "GagSelect"
-    GAG_EXECUTE: str = "GagExecute"
-    COGS_ATTACK: str = "CogsAttack"
-    TOONS_WON: str = "ToonsWon"
-    COGS_WON: str = "CogsWon"
+import random
 
 
 class CogBattleFSM(FSM):
@@ -33,8 +32,14 @@ class CogBattleFSM(FSM):
         defaultTransitions (dict of str to list of str): The valid transitions
             from state to state.
         battle (CogBattle): The CogBattle that this FSM belongs to.
-        gagSelectTimer (Task): The task that runs the gag select timer.
-        timePrinter (TimePrinter): Util object to print the gag select timer.
+        gagSelectTimer (Task): The task that ends gag select once the wait
+            time has passed.
+        gagSelectCountdown (Task): The task that displays the time left once
+            per second.
+        addPendingTask (Task): The task that adds pending combatants on the
+            next frame, if one is scheduled.
+        secondsLeft (int): The next number of seconds left to display.
+        timePrinter (TimePrinter): Util object to report the gag select timer.
     """
 
     def __init__(self, name: str, battle: "CogBattle"):
@@ -54,204 +59,213 @@ class CogBattleFSM(FSM):
         }
         self.battle: CogBattle = battle
         self.gagSelectTimer: Task = None
-        self.timePrinter: TimePrinter = TimePrinter()
+        self.gagSelectCountdown: Task = None
+        self.addPendingTask: Task = None
+        self.secondsLeft: int = 0
+        self.timePrinter: TimePrinter = TimePrinter(battle.eventSink)
 
     def enterGagSelect(self) -> None:
-        print()
-        print("Entered Gag Select")
+        self.battle.enterGagSelect()
         self.printStatus()
-        self.gagSelectTimer = taskMgr.add(
-            self.gagSelectTimerTick, "GagSelectTimerTick"
-        )
+        if self.battle.pendingToons or self.battle.pendingCogs:
+            self.addPendingCombatants()
+        self.startGagSelectTimer()
+
+    def startGagSelectTimer(self) -> None:
+        """Schedules the gag select deadline and the countdown display.
+
+        Both are timed tasks, so nothing runs between seconds while the toons
+        are deciding.
+        """
         self.timePrinter.clear()
-        self.battle.selectedGagTurn = 0
-        for toon in self.battle.toons:
-            toon.selectedGag = Gag.NONE
-            toon.selectedTarget = None
+        self.secondsLeft = self.battle.GAG_SELECT_WAIT_TIME
+        self.gagSelectTimer = taskMgr.doMethodLater(
+            self.battle.GAG_SELECT_WAIT_TIME,
+            self.gagSelectTimeout,
+            "GagSelectTimeout",
+        )
+        self.gagSelectCountdown = taskMgr.doMethodLater(
+            0, self.gagSelectCountdownTick, "GagSelectCountdown"
+        )
 
-    def gagSelectTimerTick(self, task: Task) -> int:
-        if (
-            len(self.battle.pendingToons) > 0
-            or len(self.battle.pendingCogs) > 0
-        ):
-            self.addPendingCombatants()
-            return self.resetGagSelectTimer()
+    def stopGagSelectTimer(self) -> None:
+        """Removes the gag select deadline and the countdown display."""
+        taskMgr.remove(self.gagSelectTimer)
+        taskMgr.remove(self.gagSelectCountdown)
 
-        if task.time > CogBattle.GAG_SELECT_WAIT_TIME:
-            self.request(CogBattleState.GAG_EXECUTE)
+    def gagSelectTimeout(self, task: Task) -> int:
+        self.battle.timeOut()
+        return Task.done
+
+    def gagSelectCountdownTick(self, task: Task) -> int:
+        self.timePrinter.printTime(self.secondsLeft)
+        self.secondsLeft -= 1
+        if self.secondsLeft <= 0:
             return Task.done
-        self.timePrinter.printTime(
-            math.ceil(CogBattle.GAG_SELECT_WAIT_TIME - task.time)
-        )
-        return Task.cont
+        task.delayTime = 1
+        return Task.again
+
+    def requestAddPendingCombatants(self) -> None:
+        """Adds the pending combatants once the battle's join batch window
+        has passed, or on the next frame if it has none, if the battle is in
+        gag select. Joins in the same batch reset the timer at most once."""
+        if (
+            self.battle.state == CogBattleState.GAG_SELECT
+            and (self.battle.pendingToons or self.battle.pendingCogs)
+            and self.addPendingTask is None
+        ):
+            if self.battle.JOIN_BATCH_WINDOW > 0:
+                self.addPendingTask = taskMgr.doMethodLater(
+                    self.battle.JOIN_BATCH_WINDOW,
+                    self.addPendingCombatantsTask,
+                    "GagSelectAddPending",
+                )
+            else:
+                self.addPendingTask = taskMgr.add(
+                    self.addPendingCombatantsTask, "GagSelectAddPending"
+                )
+
+    def addPendingCombatantsTask(self, task: Task) -> int:
+        self.addPendingTask = None
+        self.addPendingCombatants()
+        if self.battle.joinQueue.requestTimerReset():
+            self.resetGagSelectTimer()
+        return Task.done
 
     def addPendingCombatants(self) -> None:
         """Adds all of the pending toons and cogs to their respective lists."""
-        self.battle.toons.extend(self.battle.pendingToons)
-        self.battle.pendingToons = []
-        self.battle.cogs.extend(self.battle.pendingCogs)
-        self.battle.pendingCogs = []
+        self.battle.addPendingCombatants()
         self.printStatus()
 
     def resetGagSelectTimer(self) -> None:
         """Resets the gag select timer back to its starting time."""
-        taskMgr.remove(self.gagSelectTimer)
-        self.gagSelectTimer = taskMgr.add(
-            self.gagSelectTimerTick, "GagSelectTimerTick"
-        )
-        self.timePrinter.clear()
+        self.stopGagSelectTimer()
+        self.startGagSelectTimer()
 
     def exitGagSelect(self) -> None:
-        taskMgr.remove(self.gagSelectTimer)
+        self.stopGagSelectTimer()
+        if self.addPendingTask is not None:
+            taskMgr.remove(self.addPendingTask)
+            self.addPendingTask = None
 
     def enterGagExecute(self) -> None:
-        self.battle.executeGags()
-        if self.battle.cogs or self.battle.pendingCogs:
-            self.demand(CogBattleState.COGS_ATTACK)
-        else:
-            self.demand(CogBattleState.TOONS_WON)
+        self.demand(self.battle.enterGagExecute())
 
     def enterCogsAttack(self) -> None:
-        self.battle.attackToons()
-        if self.battle.toons or self.battle.pendingToons:
-            self.demand(CogBattleState.GAG_SELECT)
-        else:
-            self.demand(CogBattleState.COGS_WON)
+        self.demand(self.battle.enterCogsAttack())
 
     def enterCogsWon(self) -> None:
-        print("Cogs won the battle!")
+        self.battle.enterCogsWon()
         self.printStatus()
 
     def enterToonsWon(self) -> None:
-        print("Toons won the battle!")
+        self.battle.enterToonsWon()
         self.printStatus()
 
     def printStatus(self) -> None:
-        """Prints all toons and cogs in the cog battle."""
-        for i, toon in enumerate(self.battle.toons):
-            print(f"Toon {i + 1}: {toon.health} laff")
-        for i, cog in enumerate(self.battle.cogs):
-            print(f"Cog {i + 1}: {cog.health} health")
-        print()
+        """Reports the health of all toons and cogs in the cog battle."""
+        self.battle.eventSink.emit(
+            BattleEventType.STATUS,
+            BattleEventSubject.BATTLE,
+            value=(
+                [toon.health for toon in self.battle.toons],
+                [cog.health for cog in self.battle.cogs],
+            ),
+        )
 
 
-class CogBattle:
-    """Represents a cog battle.
+class CogBattle(BattleEngine):
+    """Represents a cog battle that is driven by the CogBattleFSM.
 
     Args:
         toons (list of Toon): The toons that initiated this battle.
         cogs (list of Cog): The cogs that initiated this battle.
         deterministic (bool): Whether the battle's outcomes should be
             deterministic.
+        rng (random.Random): The random number generator that every combatant
+            rolls with. Uses the global random module if not given.
+        eventSink (BattleEventSink): Where to report the battle's events.
+            Events are printed to the console if not given.
+        joinQueue (JoinQueue): Admits the toons and cogs that ask to join.
+            A queue with the default limits is used if not given.
+        maxToons (int): How many toons can be in the battle.
+        maxCogs (int): How many cogs can be in the battle.
+        store (BattleStore): Where to save the battle's outcome, if
+            anywhere.
+        cogStrategy (CogStrategy): Chooses the cogs' attacks and targets.
+            Cogs attack at random if not given.
 
     Attributes:
-        GAG_SELECT_WAIT_TIME (int): How long to wait during gag select.
-        MAX_TOONS_IN_BATTLE (int): How many toons can join the battle.
-        MAX_COGS_IN_BATTLE (int): How many cogs can join the battle.
-        toons (list of ToonCombatant): All toon combatants in the battle.
-        cogs (list of CogCombatant): All cog combatants in the battle.
-        isDeterminstic (bool): Whether the battle's outcomes are deterministic.
+        JOIN_BATCH_WINDOW (float): How many seconds to collect joins for
+            before adding them to the battle together. Joins are collected
+            for a single frame if 0.
         cogBattleFSM (CogBattleFSM): The finite state-machine that represents
             this cog battle's state.
-        pendingToons (list of ToonCombatant): Toons waiting to join the battle.
-        pendingCogs (list of CogCombatant): Cogs waiting to join the battle.
-        selectedGagTurn (int): The index of the toon to select a gag for.
     """
 
-    GAG_SELECT_WAIT_TIME: int = 40
-    MAX_TOONS_IN_BATTLE: int = 4
-    MAX_COGS_IN_BATTLE: int = 4
+    JOIN_BATCH_WINDOW: float = 0.0
 
     def __init__(
-        self, toons: List[Toon], cogs: List[Cog], deterministic: bool = False
+        self,
+        toons: List[Toon],
+        cogs: List[Cog],
+        deterministic: bool = False,
+        rng: random.Random = None,
+        eventSink: BattleEventSink = None,
+        joinQueue: Optional[JoinQueue] = None,
+        maxToons: int = BattleEngine.MAX_TOONS_IN_BATTLE,
+        maxCogs: int = BattleEngine.MAX_COGS_IN_BATTLE,
+        store: Optional["BattleStore"] = None,
+        cogStrategy: Optional[CogStrategy] = None,
     ) -> None:
-        self.toons = [
-            ToonCombatant(self, toon, deterministic) for toon in toons
-        ]
-        self.cogs = [CogCombatant(self, cog, deterministic) for cog in cogs]
-        self.isDeterministic = deterministic
+        super().__init__(
+            toons,
+            cogs,
+            deterministic,
+            rng,
+            ConsoleEventSink() if eventSink is None else eventSink,
+            joinQueue,
+            maxToons,
+            maxCogs,
+            store,
+            cogStrategy,
+        )
         self.cogBattleFSM: CogBattleFSM = CogBattleFSM("CogBattleFSM", self)
-        self.pendingToons: List[ToonCombatant] = []
-        self.pendingCogs: List[CogCombatant] = []
-        self.selectedGagTurn: int = 0
 
     def startCogBattle(self) -> None:
         """Requests the cog battle to start."""
-        print("Starting Cog Battle")
-        if self.cogBattleFSM.state == "Off":
-            self.cogBattleFSM.request(CogBattleState.GAG_SELECT)
+        self.start()
 
-    def selectGag(self, gag: int) -> None:
-        """Selects a gag for the next toon.
-
-        Args:
-            gag (int): One of the constants in the Gag class.
-        """
-        if self.cogBattleFSM.state != CogBattleState.GAG_SELECT:
-            return
-        print(f"Selected {Gag.NAME[gag]} for toon {self.selectedGagTurn + 1}.")
-        self.toons[self.selectedGagTurn].selectedGag = gag
-        if len(self.cogs) == 1 or gag not in Gag.TARGET_REQUIRED:
-            self.selectTarget(0)
-
-    def selectTarget(self, target: int) -> None:
-        """Selects a target cog for the next toon.
-
-        Args:
-            target (int): An index in the cogs list.
-        """
-        if self.cogBattleFSM.state != CogBattleState.GAG_SELECT:
-            return
-        if target >= len(self.cogs):
-            print("Selected nonexistent cog, try again")
-            return
-
-        print(f"Selected cog {target + 1}")
-        self.toons[self.selectedGagTurn].selectedTarget = self.cogs[target]
-        self.selectedGagTurn = (self.selectedGagTurn + 1) % len(self.toons)
-        if all(toon.selectedGag for toon in self.toons):
-            self.cogBattleFSM.request(CogBattleState.GAG_EXECUTE)
-
-    def executeGags(self) -> None:
-        """Commits all gags selected by toons."""
-        for gag in Gag.EXECUTE_ORDER:
-            attackingToons = [
-                toon for toon in self.toons if toon.selectedGag == gag
-            ]
-            # Use the first toon to roll for a hit; if the first succeeds, so
-            # do the rest.
-            if attackingToons and attackingToons[0].isAttackHit():
-                for toon in attackingToons:
-                    toon.executeAttack()
-                self.cogs = [cog for cog in self.cogs if cog.isAlive()]
-
-    def attackToons(self) -> None:
-        """Tells all cogs to execute an attack on the toons."""
-        for cog in self.cogs:
-            if cog.isAttackHit():
-                cog.executeAttack()
-        self.toons = [toon for toon in self.toons if toon.isAlive()]
-
-    def requestToonJoin(self, toon: Toon) -> None:
-        """Requests for a toon to join the battle.
-
-        Args:
-            toon (Toon): The toon that wants to join the battle.
-        """
-        if len(self.toons) + len(self.pendingToons) < self.MAX_TOONS_IN_BATTLE:
-            print("Adding Toon")
-            self.pendingToons.append(
-                ToonCombatant(self, toon, self.isDeterministic)
-            )
+    @overrides
+    def transition(self, state: str) -> None:
+        self.cogBattleFSM.request(state)
 
-    def requestCogJoin(self, cog: Cog) -> None:
-        """Requests for a cog to join the battle.
+    @overrides
+    def restore(self, snapshot: BattleSnapshot) -> None:
+        """Resumes the battle from a snapshot, moving the FSM straight into
+        the snapshot's state without running any transitions. The gag select
+        timer starts over if the battle is restored into gag select.
 
         Args:
-            cog (Cog): The cog that wants to join the battle.
+            snapshot (BattleSnapshot): The state to resume from.
         """
-        if len(self.cogs) + len(self.pendingCogs) < self.MAX_COGS_IN_BATTLE:
-            print("Adding Cog")
-            self.pendingCogs.append(
-                CogCombatant(self, cog, self.isDeterministic)
-            )
+        fsm = self.cogBattleFSM
+        if fsm.state == CogBattleState.GAG_SELECT:
+            fsm.exitGagSelect()
+        super().restore(snapshot)
+        fsm.state = snapshot.state
+        if snapshot.state == CogBattleState.GAG_SELECT:
+            fsm.printStatus()
+            fsm.startGagSelectTimer()
+
+    @overrides
+    def requestToonJoin(self, toon: Toon) -> bool:
+        accepted = super().requestToonJoin(toon)
+        self.cogBattleFSM.requestAddPendingCombatants()
+        return accepted
+
+    @overrides
+    def requestCogJoin(self, cog: Cog) -> bool:
+        accepted = super().requestCogJoin(cog)
+        self.cogBattleFSM.requestAddPendingCombatants()
+        return accepted
@@ -0,0 +1,229 @@
+"""Copyright 2021, James S. Wang, All rights reserved."""
+
+from abc import ABC, abstractmethod
+from cog import CogCombatant
+from gag import Gag
+from typing import Dict, List, Tuple
+import heapq
+
+
+class ThreatTable:
+    """What the cogs of a battle know about the toons during one round of
+    attacks.
+
+    The table is built once per round, before any cog attacks, and shared by
+    every cog in the battle, so a cog's choice never has to look at every
+    toon. As each cog chooses, the damage it is expected to deal is taken
+    off its target's laff, so cogs later in the round can tell which toons
+    are likely to be knocked out already.
+
+    Attributes:
+        threat (list of float): The damage each toon's gag was expected to
+            deal this round.
+        laff (list of int): Each toon's laff at the start of the round.
+        laffLeft (list of float): The laff each toon is expected to have
+            left after the attacks chosen so far.
+        killChances (dict of int to list of float): Maps attacks to the
+            chance they knock out each toon, given its laff at the start of
+            the round. Filled in for an attack the first time it is needed.
+        rankings (dict of str to list of int): Toon indices in the order a
+            strategy wants to attack them, by name.
+        cursors (dict of str to int): How far each ranking has been used up.
+        heap (list of tuple): The toons as (-laffLeft, index), so the toon
+            with the most laff left is first.
+    """
+
+    def __init__(self) -> None:
+        self.threat: List[float] = []
+        self.laff: List[int] = []
+        self.laffLeft: List[float] = []
+        self.killChances: Dict[int, List[float]] = {}
+        self.rankings: Dict[str, List[int]] = {}
+        self.cursors: Dict[str, int] = {}
+        self.heap: List[Tuple[float, int]] = []
+
+    def build(self, battle: "BattleEngine") -> None:
+        """Starts the table over for a round of attacks.
+
+        Args:
+            battle (BattleEngine): The battle, whose toons just executed
+                their gags.
+        """
+        self.threat = [
+            Gag.DAMAGE[toon.selectedGag]
+            * min(0.95, Gag.CHANCE_TO_HIT[toon.selectedGag])
+            for toon in battle.toons
+        ]
+        self.laff = [toon.health for toon in battle.toons]
+        self.laffLeft = [float(laff) for laff in self.laff]
+        self.killChances.clear()
+        self.rankings.clear()
+        self.cursors.clear()
+        self.heap = []
+
+    def killChance(self, attack: int) -> List[float]:
+        """Returns the chance an attack knocks out each toon.
+
+        Args:
+            attack (int): The attack.
+        """
+        chances = self.killChances.get(attack)
+        if chances is None:
+            damage = CogCombatant.DAMAGE[attack]
+            chance = CogCombatant.CHANCE_TO_HIT[attack]
+            chances = [chance if damage >= laff else 0.0 for laff in self.laff]
+            self.killChances[attack] = chances
+        return chances
+
+    def rank(self, name: str, key) -> None:
+        """Sorts the toons into a ranking, unless it exists already.
+
+        Args:
+            name (str): The name of the ranking.
+            key (callable): Sorts a toon, given its index. Lower comes first.
+        """
+        if name not in self.rankings:
+            self.rankings[name] = sorted(range(len(self.laffLeft)), key=key)
+            self.cursors[name] = 0
+
+    def nextTarget(self, name: str) -> int:
+        """Returns the highest ranked toon that isn't expected to be knocked
+        out already, or the highest ranked toon if every one of them is.
+
+        The cursor of the ranking only moves forward, so every cog of a round
+        together skips each toon at most once.
+
+        Args:
+            name (str): The name of the ranking.
+        """
+        ranking = self.rankings[name]
+        cursor = self.cursors[name]
+        while cursor < len(ranking) and self.laffLeft[ranking[cursor]] <= 0:
+            cursor += 1
+        self.cursors[name] = cursor
+        return ranking[cursor] if cursor < len(ranking) else ranking[0]
+
+    def healthiestTarget(self) -> int:
+        """Returns the toon expected to have the most laff left."""
+        if not self.heap:
+            self.heap = [(-laff, i) for i, laff in enumerate(self.laffLeft)]
+            heapq.heapify(self.heap)
+        return self.heap[0][1]
+
+    def commit(self, attack: int, target: int) -> None:
+        """Takes the expected damage of an attack off its target.
+
+        Args:
+            attack (int): The attack.
+            target (int): The index of the toon it targets.
+        """
+        self.laffLeft[target] -= (
+            CogCombatant.DAMAGE[attack] * CogCombatant.CHANCE_TO_HIT[attack]
+        )
+        if self.heap and self.heap[0][1] == target:
+            heapq.heapreplace(self.heap, (-self.laffLeft[target], target))
+
+
+class CogStrategy(ABC):
+    """Chooses the attacks and targets of cogs.
+
+    A strategy only looks at the cog and the battle's threat table, so the
+    same strategy can play any number of cogs in any number of battles.
+
+    Attributes:
+        USES_THREATS (bool): Whether the battle has to build its threat table
+            each round for this strategy.
+    """
+
+    USES_THREATS: bool = True
+
+    @abstractmethod
+    def choose(
+        self, cog: CogCombatant, threats: ThreatTable
+    ) -> Tuple[int, int]:
+        """Chooses an attack and target for a cog.
+
+        Args:
+            cog (CogCombatant): The cog, whose battle has toons left.
+            threats (ThreatTable): The battle's table for this round.
+
+        Returns:
+            tuple of int: The attack and the index of the toon to target.
+        """
+
+
+class RandomStrategy(CogStrategy):
+    """Picks a random attack and a random toon, or the first of each if the
+    cog is deterministic. This is how cogs have always attacked."""
+
+    USES_THREATS: bool = False
+
+    def choose(
+        self, cog: CogCombatant, threats: ThreatTable
+    ) -> Tuple[int, int]:
+        if cog.isDeterministic:
+            return cog.attacks[0], 0
+        return (
+            cog.rng.choice(cog.attacks),
+            cog.rng.choice(range(len(cog.battle.toons))),
+        )
+
+
+class LowestLaffStrategy(CogStrategy):
+    """Attacks the toon with the least laff with the cog's hardest hitting
+    attack, moving on to the next toon once the damage chosen so far is
+    expected to knock it out."""
+
+    def choose(
+        self, cog: CogCombatant, threats: ThreatTable
+    ) -> Tuple[int, int]:
+        threats.rank("laff", threats.laff.__getitem__)
+        attack = max(cog.attacks, key=CogCombatant.DAMAGE.__getitem__)
+        target = threats.nextTarget("laff")
+        threats.commit(attack, target)
+        return attack, target
+
+
+class FocusFireStrategy(CogStrategy):
+    """Has every cog attack the same toon until it is expected to be knocked
+    out, starting with the toon whose gags are the biggest threat.
+
+    Each cog uses the attack most likely to knock out the toon on its own,
+    or with the most expected damage if none of its attacks can.
+    """
+
+    def choose(
+        self, cog: CogCombatant, threats: ThreatTable
+    ) -> Tuple[int, int]:
+        threats.rank("threat", lambda i: (-threats.threat[i], i))
+        target = threats.nextTarget("threat")
+        attack = max(
+            cog.attacks,
+            key=lambda a: (
+                threats.killChance(a)[target],
+                CogCombatant.DAMAGE[a] * CogCombatant.CHANCE_TO_HIT[a],
+            ),
+        )
+        threats.commit(attack, target)
+        return attack, target
+
+
+class ExpectedDamageStrategy(CogStrategy):
+    """Maximizes the laff the cogs are expected to take from the toons.
+
+    Each cog uses its attack with the most expected damage on the toon
+    expected to have the most laff left, so no damage is wasted on toons that
+    earlier attacks are likely to knock out.
+    """
+
+    def choose(
+        self, cog: CogCombatant, threats: ThreatTable
+    ) -> Tuple[int, int]:
+        attack = max(
+            cog.attacks,
+            key=lambda a: CogCombatant.DAMAGE[a]
+            * CogCombatant.CHANCE_TO_HIT[a],
+        )
+        target = threats.healthiestTarget()
+        threats.commit(attack, target)
+        return attack, target
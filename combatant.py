@@ -1,32 +1,59 @@
 """Copyright 2021, James S. Wang, All rights reserved."""
 
-from abc import ABC, abstractmethod
-from overrides import EnforceOverrides
+from abc import abstractmethod
+from battlelog import BattleEventType
+from battlerng import CounterRng
+from overrides.enforce import EnforceOverridesMeta
+from typing import List, Optional
+import random
 
 
-class Combatant(ABC, EnforceOverrides):
+class Combatant(metaclass=EnforceOverridesMeta):
     """The combatant is the base class for any character that will partake in
     battles.
 
     The idea here is to separate battle logic from non-battle logic by creating
-    new objects (combatants) when battles are initiated.
+    new objects (combatants) when battles are initiated. Combatants are
+    slotted, so they don't carry a dict each; subclasses must declare their
+    own __slots__ for any attributes they add.
 
     Args:
         battle (CogBattle): The battle that this combatant is a part of.
         deterministic (bool): Whether the combatant's actions are
             deterministic.
+        rng (random.Random): The random number generator to roll with. Uses
+            the global random module if not given. A CounterRng gives the
+            combatant its own stream of rolls.
 
     Attributes:
+        SUBJECT (str): The BattleEventSubject that events about this combatant
+            are reported as.
         health (int): How much health the combatant currently has.
         battle (CogBattle): The battle that this combatant is a part of.
         isDeterministic (bool): Whether the combatant's actions are
             deterministic.
+        rng (random.Random): The random number generator to roll with, or
+            the combatant's RollStream.
+        combatantId (int): Identifies the combatant within its battle. Unlike
+            its index in the battle's lists, it never changes.
     """
 
-    def __init__(self, battle: "CogBattle", deterministic: bool = False):
+    SUBJECT: str
+    __slots__ = ("health", "battle", "isDeterministic", "rng", "combatantId")
+
+    def __init__(
+        self,
+        battle: "CogBattle",
+        deterministic: bool = False,
+        rng: random.Random = None,
+    ):
         self.health: int
         self.battle: "CogBattle" = battle
         self.isDeterministic: bool = deterministic
+        self.combatantId: int = battle.newCombatantId()
+        self.rng: random.Random = random if rng is None else rng
+        if isinstance(rng, CounterRng):
+            self.rng = rng.stream(self.combatantId)
 
     @abstractmethod
     def executeAttack(self) -> None:
@@ -46,7 +73,38 @@ class Combatant(ABC, EnforceOverrides):
             damage (int): Pre-filtered damage to receive.
         """
         self.health -= damage
+        self.battle.eventSink.emit(
+            BattleEventType.DAMAGE, self.SUBJECT, value=damage
+        )
 
     def isAlive(self) -> bool:
         """Returns whether the combatant is alive."""
         return self.health > 0
+
+
+def removeDefeated(
+    combatants: List[Combatant], defeated: Optional[List[Combatant]] = None
+) -> bool:
+    """Removes every combatant that isn't alive, in place.
+
+    The survivors keep their order. Nothing is allocated, so the lists of a
+    battle can be compacted after every attack without creating garbage.
+
+    Args:
+        combatants (list of Combatant): The combatants to compact.
+        defeated (list of Combatant): Where to move the removed combatants,
+            if anywhere.
+
+    Returns:
+        bool: Whether any combatant was removed.
+    """
+    alive = 0
+    for combatant in combatants:
+        if combatant.health > 0:
+            combatants[alive] = combatant
+            alive += 1
+        elif defeated is not None:
+            defeated.append(combatant)
+    removed = alive < len(combatants)
+    del combatants[alive:]
+    return removed
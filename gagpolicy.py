@@ -0,0 +1,311 @@
+"""Copyright 2021, James S. Wang, All rights reserved."""
+
+from abc import ABC, abstractmethod
+from battleengine import BattleEngine, BattleSnapshot, CogBattleState
+from collections import OrderedDict
+from gag import Gag
+from typing import Dict, List, Optional, Tuple
+import math
+import random
+import time
+
+
+class GagPolicy(ABC):
+    """Chooses gags for toons that are played by bots.
+
+    A policy only looks at the battle, so the same policy can play any number
+    of toons in any number of battles.
+    """
+
+    @abstractmethod
+    def choose(self, battle: BattleEngine) -> Tuple[int, int]:
+        """Chooses a gag and target for the toon whose turn it is.
+
+        Args:
+            battle (BattleEngine): The battle, which must be in gag select.
+
+        Returns:
+            tuple of int: The gag and the index of the cog to target.
+        """
+
+    def play(self, battle: BattleEngine) -> None:
+        """Selects a gag, and a target if needed, for the toon whose turn it
+        is.
+
+        Args:
+            battle (BattleEngine): The battle to select a gag in.
+        """
+        if battle.state != CogBattleState.GAG_SELECT or not battle.cogs:
+            return
+        gag, target = self.choose(battle)
+        battle.selectGag(gag)
+        if len(battle.cogs) > 1 and gag in Gag.TARGET_REQUIRED:
+            battle.selectTarget(target)
+
+
+class GreedyPolicy(GagPolicy):
+    """Picks the gag and target most likely to defeat a cog this round, or
+    with the most expected damage if no cog can be defeated.
+
+    Damage that toons earlier in the turn order have already committed to a
+    cog is subtracted from its health, so toons don't waste gags on cogs that
+    are likely to be defeated anyway. Ties go to the cog with the least health
+    left, since finishing it off stops its attack.
+    """
+
+    def choose(self, battle: BattleEngine) -> Tuple[int, int]:
+        committed = committedDamage(battle)
+        best, bestScore = (Gag.PASS, 0), (0.0, 0.0, 0)
+        for gag in Gag.EXECUTE_ORDER:
+            chance = min(0.95, Gag.CHANCE_TO_HIT[gag])
+            for target, cog in enumerate(battle.cogs):
+                left = cog.health - committed[target]
+                if left <= 0:
+                    continue
+                score = (
+                    chance if Gag.DAMAGE[gag] >= left else 0.0,
+                    chance * min(Gag.DAMAGE[gag], left),
+                    -left,
+                )
+                if score > bestScore:
+                    best, bestScore = (gag, target), score
+        if best[0] == Gag.PASS:
+            # Every cog already has enough damage committed to it, so back
+            # up the cog that needs the most.
+            target = max(
+                range(len(battle.cogs)),
+                key=lambda i: battle.cogs[i].health - committed[i],
+            )
+            best = (Gag.EXECUTE_ORDER[-1], target)
+        return best
+
+
+class MonteCarloPolicy(GagPolicy):
+    """Searches for the best gag by playing out the rest of the battle.
+
+    Every candidate gag and target is played out on copies of the battle,
+    with the greedy policy making every later choice and dice rolled by the
+    policy's own random number generator. Candidates are sampled by UCB1 until
+    the time budget runs out, so promising moves get more playouts.
+
+    The statistics of every searched position are kept in a transposition
+    table keyed on the battle state, so a position that comes up again, in the
+    same battle or another one, continues from its earlier playouts instead of
+    starting over.
+
+    Args:
+        timeBudget (float): How long to search for each choice, in seconds.
+        maxRounds (int): The most rounds to play out before scoring a
+            battle by the health left on each side.
+        tableSize (int): The most positions to keep in the transposition
+            table.
+        seed (int): Seed for the random number generator of the playouts.
+
+    Attributes:
+        EXPLORATION (float): How strongly UCB1 favours rarely played moves.
+        timeBudget (float): How long to search for each choice, in seconds.
+        maxRounds (int): The most rounds to play out.
+        tableSize (int): The most positions to keep in the table.
+        rng (random.Random): Generates the seeds of the playouts.
+        seeds (list of int): The seed of each move's n-th playout.
+        rollout (GreedyPolicy): The policy that plays out every battle.
+        scratchRng (random.Random): Rolls the dice of the scratch battle,
+            reseeded for every playout.
+        scratch (BattleEngine): The battle that every playout runs on, with
+            the cog strategy of the battle being played.
+        table (OrderedDict): Maps positions to the playout count and total
+            score of each move, least recently used first.
+        playouts (int): How many battles have been played out.
+    """
+
+    EXPLORATION: float = math.sqrt(2)
+
+    def __init__(
+        self,
+        timeBudget: float = 0.005,
+        maxRounds: int = 20,
+        tableSize: int = 100000,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.timeBudget: float = timeBudget
+        self.maxRounds: int = maxRounds
+        self.tableSize: int = tableSize
+        self.rng: random.Random = random.Random(seed)
+        self.seeds: List[int] = []
+        self.rollout: GreedyPolicy = GreedyPolicy()
+        self.scratchRng: random.Random = random.Random()
+        self.scratch: BattleEngine = BattleEngine([], [], rng=self.scratchRng)
+        self.table: OrderedDict = OrderedDict()
+        self.playouts: int = 0
+
+    def choose(self, battle: BattleEngine) -> Tuple[int, int]:
+        deadline = time.perf_counter() + self.timeBudget
+        moves = self.moves(battle)
+        if len(moves) == 1:
+            return moves[0]
+
+        key = self.positionKey(battle)
+        stats = self.table.get(key)
+        if stats is None:
+            stats = {move: [0, 0.0] for move in moves}
+            self.table[key] = stats
+            if len(self.table) > self.tableSize:
+                self.table.popitem(last=False)
+        else:
+            self.table.move_to_end(key)
+
+        snapshot = battle.snapshot()
+        # Playouts have to face the cogs the way the live battle's do.
+        self.scratch.cogStrategy = battle.cogStrategy
+        while True:
+            move = self.nextMove(stats)
+            score = self.playOut(
+                snapshot, move, self.playoutSeed(stats[move][0])
+            )
+            stats[move][0] += 1
+            stats[move][1] += score
+            if time.perf_counter() >= deadline:
+                break
+        # The most played move is less noisy than the best scoring one.
+        return max(stats, key=lambda move: stats[move][0])
+
+    def moves(self, battle: BattleEngine) -> List[Tuple[int, int]]:
+        """Lists every gag and target worth considering.
+
+        Passing is never better than attacking, and gags that don't need a
+        target always hit the first cog. Cogs of the same type with the same
+        health and damage committed to them are interchangeable, so only the
+        first of them is a target.
+
+        Args:
+            battle (BattleEngine): The battle to choose a move in.
+        """
+        committed = committedDamage(battle)
+        targets = []
+        seen = set()
+        for target, cog in enumerate(battle.cogs):
+            signature = (cog.cogType, cog.health, committed[target])
+            if signature not in seen:
+                seen.add(signature)
+                targets.append(target)
+        return [
+            (gag, target)
+            for gag in Gag.EXECUTE_ORDER
+            for target in (targets if gag in Gag.TARGET_REQUIRED else [0])
+        ]
+
+    def nextMove(self, stats: Dict[tuple, list]) -> Tuple[int, int]:
+        """Picks the next move to play out by UCB1.
+
+        Args:
+            stats (dict of tuple to list): The playout count and total score
+                of each move.
+        """
+        total = sum(count for count, _ in stats.values())
+        best, bestScore = None, -1.0
+        for move, (count, score) in stats.items():
+            if not count:
+                return move
+            ucb = score / count + self.EXPLORATION * math.sqrt(
+                math.log(total) / count
+            )
+            if ucb > bestScore:
+                best, bestScore = move, ucb
+        return best
+
+    def playoutSeed(self, index: int) -> int:
+        """Returns the seed of a move's playout.
+
+        The n-th playout of every move rolls the same dice, so moves are
+        compared on the same luck and fewer playouts tell them apart.
+
+        Args:
+            index (int): How many times the move has been played out.
+        """
+        while index >= len(self.seeds):
+            self.seeds.append(self.rng.getrandbits(64))
+        return self.seeds[index]
+
+    def playOut(
+        self, snapshot: BattleSnapshot, move: Tuple[int, int], seed: int
+    ) -> float:
+        """Plays a move and the rest of the battle from a snapshot.
+
+        The playout runs on a scratch battle that is restored from the
+        snapshot every time, so playouts don't allocate new battles.
+
+        Args:
+            snapshot (BattleSnapshot): The battle to play out, in gag select.
+            move (tuple of int): The gag and target to play.
+            seed (int): Seed for the dice of the playout.
+
+        Returns:
+            float: 1 if the toons won, 0 if the cogs won, or the toons' share
+                of the health left if the battle didn't finish.
+        """
+        self.playouts += 1
+        self.scratchRng.seed(seed)
+        battle = self.scratch
+        battle.restore(snapshot)
+        battle.addPendingCombatants()
+        gag, target = move
+        battle.selectGag(gag)
+        if len(battle.cogs) > 1 and gag in Gag.TARGET_REQUIRED:
+            battle.selectTarget(target)
+        while (
+            not battle.isOver()
+            and battle.round <= snapshot.round + self.maxRounds
+        ):
+            self.rollout.play(battle)
+        if battle.state == CogBattleState.TOONS_WON:
+            return 1.0
+        if battle.state == CogBattleState.COGS_WON:
+            return 0.0
+        toonHealth = sum(toon.health for toon in battle.toons)
+        cogHealth = sum(cog.health for cog in battle.cogs)
+        return toonHealth / (toonHealth + cogHealth)
+
+    @staticmethod
+    def positionKey(battle: BattleEngine) -> tuple:
+        """Returns a key that is the same for battles in the same position.
+
+        Pending toons and cogs are part of the position, since they join
+        before the rest of the battle is played out.
+
+        Args:
+            battle (BattleEngine): The battle to build the key of.
+        """
+        return (
+            battle.selectedGagTurn,
+            tuple(
+                (
+                    toon.health,
+                    toon.selectedGag,
+                    battle.cogSlots.get(toon.selectedTarget),
+                )
+                for toon in battle.toons
+            ),
+            tuple((cog.cogType, cog.health) for cog in battle.cogs),
+            tuple(toon.health for toon in battle.pendingToons),
+            tuple((cog.cogType, cog.health) for cog in battle.pendingCogs),
+            type(battle.cogStrategy),
+        )
+
+
+def committedDamage(battle: BattleEngine) -> List[int]:
+    """Adds up the damage that toons have already selected against each cog
+    this round.
+
+    Args:
+        battle (BattleEngine): The battle, in gag select.
+
+    Returns:
+        list of int: The damage committed to each cog, in battle order.
+    """
+    committed = [0] * len(battle.cogs)
+    for toon in battle.toons[: battle.selectedGagTurn]:
+        if toon.selectedGag:
+            target = battle.cogSlots.get(toon.selectedTarget)
+            if target is not None:
+                committed[target] += Gag.DAMAGE[toon.selectedGag]
+    return committed
@@ -0,0 +1,111 @@
+"""Copyright 2021, James S. Wang, All rights reserved."""
+
+from cog import Cog
+from collections import deque
+from toon import Toon
+from typing import Deque, Dict, Optional, Union
+
+
+class JoinStats:
+    """Counts what happened to the join requests of one or more battles.
+
+    Attributes:
+        requested (int): How many toons and cogs asked to join.
+        admitted (int): How many were added to the pending combatants.
+        waited (int): How many had to wait because the battle was full.
+        rejected (int): How many were turned away because the battle and its
+            waiting line were both full.
+        batches (int): How many times pending combatants were added at once.
+        timerResets (int): How many times joins restarted gag select.
+        resetsSkipped (int): How many times joins didn't restart gag select
+            because the round had already been restarted too often.
+    """
+
+    def __init__(self) -> None:
+        self.requested: int = 0
+        self.admitted: int = 0
+        self.waited: int = 0
+        self.rejected: int = 0
+        self.batches: int = 0
+        self.timerResets: int = 0
+        self.resetsSkipped: int = 0
+
+    def asDict(self) -> Dict[str, int]:
+        """Returns every count by name."""
+        return dict(vars(self))
+
+
+class JoinQueue:
+    """Admission control for the toons and cogs that ask to join a battle.
+
+    Combatants that ask to join a full battle wait in line, and are admitted
+    at the start of a later gag select once defeated combatants make room.
+    Once the line is full too, further requests are rejected so callers can
+    back off.
+
+    Joins normally restart the gag select timer so newcomers have time to
+    pick a gag, but a steady stream of joins would then keep a battle in gag
+    select forever. Only the first few restarts of each round are granted.
+
+    Args:
+        maxWaiting (int): The most toons, and the most cogs, that can wait.
+        maxTimerResets (int): The most times joins may restart gag select in
+            one round.
+        stats (JoinStats): Where to count join requests. Several queues can
+            share one to count the joins of many battles.
+
+    Attributes:
+        maxWaiting (int): The most toons, and the most cogs, that can wait.
+        maxTimerResets (int): The most timer restarts per round.
+        waitingToons (deque of Toon): Toons waiting for room, oldest first.
+        waitingCogs (deque of Cog): Cogs waiting for room, oldest first.
+        timerResets (int): How many times joins restarted this round.
+        stats (JoinStats): Counts of the join requests.
+    """
+
+    def __init__(
+        self,
+        maxWaiting: int = 4,
+        maxTimerResets: int = 2,
+        stats: Optional[JoinStats] = None,
+    ) -> None:
+        self.maxWaiting: int = maxWaiting
+        self.maxTimerResets: int = maxTimerResets
+        self.waitingToons: Deque[Toon] = deque()
+        self.waitingCogs: Deque[Cog] = deque()
+        self.timerResets: int = 0
+        self.stats: JoinStats = JoinStats() if stats is None else stats
+
+    def wait(self, combatant: Union[Toon, Cog], waiting: deque) -> bool:
+        """Puts a toon or cog in line, if the line has room.
+
+        Args:
+            combatant (Toon or Cog): The toon or cog that asked to join.
+            waiting (deque): The line to wait in.
+
+        Returns:
+            bool: Whether the toon or cog is waiting, rather than rejected.
+        """
+        if len(waiting) >= self.maxWaiting:
+            self.stats.rejected += 1
+            return False
+        waiting.append(combatant)
+        self.stats.waited += 1
+        return True
+
+    def startRound(self) -> None:
+        """Lets joins restart gag select again in a new round."""
+        self.timerResets = 0
+
+    def requestTimerReset(self) -> bool:
+        """Asks to restart gag select because combatants joined.
+
+        Returns:
+            bool: Whether the timer should be restarted.
+        """
+        if self.timerResets >= self.maxTimerResets:
+            self.stats.resetsSkipped += 1
+            return False
+        self.timerResets += 1
+        self.stats.timerResets += 1
+        return True
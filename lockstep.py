@@ -0,0 +1,736 @@
+"""Copyright 2021, James S. Wang, All rights reserved."""
+
+from battleengine import (
+    BattleEngine,
+    BattleSnapshot,
+    CogBattleState,
+    SnapshotFormat,
+)
+from battleserver import DeadlineHeap
+from cog import Cog
+from gag import Gag
+from joinqueue import JoinQueue, JoinStats
+from toon import Toon
+from typing import Dict, List, Optional, Set, Tuple
+import argparse
+import asyncio
+import json
+import random
+import struct
+import time
+
+
+class MessageType:
+    """Namespace for the types of lockstep messages.
+
+    Clients send CREATE, SELECT_GAG, SELECT_TARGET, TOON_JOIN and COG_JOIN.
+    The server answers each of them with CREATED, ACK or REJECT, and sends
+    DELTA to every client watching a battle that changed.
+    """
+
+    CREATE: int = 1
+    SELECT_GAG: int = 2
+    SELECT_TARGET: int = 3
+    TOON_JOIN: int = 4
+    COG_JOIN: int = 5
+    CREATED: int = 16
+    ACK: int = 17
+    REJECT: int = 18
+    DELTA: int = 19
+
+
+class WireFormat:
+    """Namespace for the layouts of lockstep messages.
+
+    Every client message is an ACTION. The server sends one packet per
+    client per tick, holding every message for that client.
+
+    Attributes:
+        ACTION (Struct): The type, sequence number, battle ID and value of a
+            client message. CREATE ignores the battle ID and uses the value
+            as the number of cogs.
+        PACKET (Struct): The length of a packet of server messages.
+        CREATED (Struct): The type, sequence number and battle ID of a
+            battle that was created.
+        ACK (Struct): The type and sequence number of an applied message.
+        REJECT (Struct): The type and sequence number of a message that
+            wasn't applied.
+        DELTA (Struct): The type, battle ID, tick, state, round and turn of
+            a battle, how many toons and cogs it has, and how many of them
+            changed.
+        TOON (Struct): The index, laff, gag and target index of a toon.
+        COG (Struct): The index, cog type and health of a cog.
+    """
+
+    ACTION: struct.Struct = struct.Struct("<BHIB")
+    PACKET: struct.Struct = struct.Struct("<I")
+    CREATED: struct.Struct = struct.Struct("<BHI")
+    ACK: struct.Struct = struct.Struct("<BH")
+    REJECT: struct.Struct = struct.Struct("<BH")
+    DELTA: struct.Struct = struct.Struct("<BIIBHBBBBB")
+    TOON: struct.Struct = struct.Struct("<Bhbb")
+    COG: struct.Struct = struct.Struct("<BHh")
+
+
+class HostedBattle:
+    """A battle run by a LockstepServer, and the clients watching it.
+
+    Args:
+        battle (BattleEngine): The authoritative battle.
+
+    Attributes:
+        battle (BattleEngine): The authoritative battle.
+        subscribers (set of int): The connections that receive its deltas.
+        broadcast (BattleSnapshot): The state last sent to the subscribers.
+    """
+
+    def __init__(self, battle: BattleEngine) -> None:
+        self.battle: BattleEngine = battle
+        self.subscribers: Set[int] = set()
+        self.broadcast: Optional[BattleSnapshot] = None
+
+
+class LockstepServer:
+    """Runs battles for remote clients in fixed ticks.
+
+    Client messages are queued as they arrive and applied together at the
+    next tick, in the order they arrived. Each battle rolls its own random
+    number generator, so a battle's outcome only depends on its own inputs
+    and the ticks they arrived in. After applying a tick's messages, the
+    server sends every watching client a delta of each battle that changed,
+    holding only the toons and cogs whose state differs from the last delta.
+
+    The server doesn't own any sockets: connect(), receive() and step() take
+    and return bytes, so it can be driven in process or by start().
+
+    Args:
+        tickRate (float): How many ticks to run per second.
+        waitTime (float): How long gag select lasts, in seconds.
+        seed (int): Seed for the random number generators of the battles.
+
+    Attributes:
+        tickInterval (float): How long a tick lasts, in seconds.
+        waitTicks (int): How many ticks gag select lasts.
+        rng (random.Random): Seeds the random number generator of each
+            battle.
+        tick (int): How many ticks have run.
+        battles (dict of int to HostedBattle): The live battles by ID.
+        deadlines (DeadlineHeap): The tick that gag select ends in for each
+            battle.
+        joinStats (JoinStats): Counts of the join requests of every battle.
+        inbox (list of tuple): Messages waiting for the next tick, as the
+            connection followed by the fields of the message.
+        partial (dict of int to bytes): The start of an incomplete message
+            from each connection.
+        outboxes (dict of int to list): The messages to send to each
+            connection at the end of the tick.
+        nextConnectionId (int): The ID to give to the next connection.
+        nextBattleId (int): The ID to give to the next battle.
+        bytesReceived (int): How many bytes clients have sent.
+        bytesSent (int): How many bytes have been sent to clients.
+        server (AbstractServer): The listening server, once started.
+        ticker (Future): The task running ticks, once started.
+    """
+
+    def __init__(
+        self,
+        tickRate: float = 50.0,
+        waitTime: float = BattleEngine.GAG_SELECT_WAIT_TIME,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.tickInterval: float = 1 / tickRate
+        self.waitTicks: int = max(1, round(waitTime * tickRate))
+        self.rng: random.Random = random.Random(seed)
+        self.tick: int = 0
+        self.battles: Dict[int, HostedBattle] = {}
+        self.deadlines: DeadlineHeap = DeadlineHeap()
+        self.joinStats: JoinStats = JoinStats()
+        self.inbox: List[Tuple[int, int, int, int, int]] = []
+        self.partial: Dict[int, bytes] = {}
+        self.outboxes: Dict[int, List[bytes]] = {}
+        self.nextConnectionId: int = 0
+        self.nextBattleId: int = 0
+        self.bytesReceived: int = 0
+        self.bytesSent: int = 0
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.ticker: Optional[asyncio.Future] = None
+
+    def connect(self) -> int:
+        """Registers a new client connection and returns its ID."""
+        connection = self.nextConnectionId
+        self.nextConnectionId += 1
+        self.outboxes[connection] = []
+        return connection
+
+    def disconnect(self, connection: int) -> None:
+        """Forgets a client connection.
+
+        Args:
+            connection (int): The ID of the connection.
+        """
+        self.outboxes.pop(connection, None)
+        self.partial.pop(connection, None)
+        for hosted in self.battles.values():
+            hosted.subscribers.discard(connection)
+
+    def receive(self, connection: int, data: bytes) -> None:
+        """Queues the messages that a client sent for the next tick.
+
+        Args:
+            connection (int): The ID of the connection.
+            data (bytes): The bytes received, which may end partway through
+                a message.
+        """
+        self.bytesReceived += len(data)
+        data = self.partial.pop(connection, b"") + data
+        size = WireFormat.ACTION.size
+        end = len(data) - len(data) % size
+        for fields in WireFormat.ACTION.iter_unpack(data[:end]):
+            self.inbox.append((connection,) + fields)
+        if end < len(data):
+            self.partial[connection] = data[end:]
+
+    def step(self) -> Dict[int, bytes]:
+        """Runs one tick.
+
+        Returns:
+            dict of int to bytes: The packet to send to each connection that
+                has messages this tick.
+        """
+        self.tick += 1
+        rounds: Dict[int, int] = {}
+        for connection, messageType, sequence, battleId, value in self.inbox:
+            if messageType == MessageType.CREATE:
+                battleId = self.createBattle(value)
+                hosted = self.battles[battleId]
+                hosted.subscribers.add(connection)
+                rounds[battleId] = hosted.battle.round
+                self.send(
+                    connection,
+                    WireFormat.CREATED.pack(
+                        MessageType.CREATED, sequence, battleId
+                    ),
+                )
+                continue
+            hosted = self.battles.get(battleId)
+            if hosted is None:
+                accepted = False
+            else:
+                rounds.setdefault(battleId, hosted.battle.round)
+                accepted = self.applyAction(
+                    hosted, connection, messageType, value
+                )
+            if accepted:
+                self.send(
+                    connection, WireFormat.ACK.pack(MessageType.ACK, sequence)
+                )
+            else:
+                self.send(
+                    connection,
+                    WireFormat.REJECT.pack(MessageType.REJECT, sequence),
+                )
+        self.inbox.clear()
+
+        for battleId, startRound in rounds.items():
+            battle = self.battles[battleId].battle
+            reset = battle.round != startRound
+            if battle.state == CogBattleState.GAG_SELECT and (
+                battle.pendingToons or battle.pendingCogs
+            ):
+                battle.addPendingCombatants()
+                reset = reset or battle.joinQueue.requestTimerReset()
+            if reset:
+                self.deadlines.schedule(battleId, self.tick + self.waitTicks)
+        for battleId in self.deadlines.popExpired(self.tick):
+            battle = self.battles[battleId].battle
+            battle.timeOut()
+            rounds[battleId] = battle.round
+            if not battle.isOver():
+                self.deadlines.schedule(battleId, self.tick + self.waitTicks)
+
+        for battleId in rounds:
+            self.broadcastDelta(battleId)
+        return self.flush()
+
+    def createBattle(self, numCogs: int) -> int:
+        """Creates and starts a battle of one toon against some cogs.
+
+        Args:
+            numCogs (int): How many cogs start in the battle.
+
+        Returns:
+            int: The ID of the new battle.
+        """
+        numCogs = min(max(numCogs, 1), BattleEngine.MAX_COGS_IN_BATTLE)
+        battleId = self.nextBattleId
+        self.nextBattleId += 1
+        battle = BattleEngine(
+            [Toon()],
+            [Cog() for _ in range(numCogs)],
+            rng=random.Random(self.rng.getrandbits(64)),
+            joinQueue=JoinQueue(stats=self.joinStats),
+        )
+        battle.start()
+        self.battles[battleId] = HostedBattle(battle)
+        self.deadlines.schedule(battleId, self.tick + self.waitTicks)
+        return battleId
+
+    def applyAction(
+        self,
+        hosted: HostedBattle,
+        connection: int,
+        messageType: int,
+        value: int,
+    ) -> bool:
+        """Applies a client's message to a battle.
+
+        Joins are only added to the pending combatants here; the pending
+        combatants of a battle are added together at the end of the tick.
+
+        Args:
+            hosted (HostedBattle): The battle the message is for.
+            connection (int): The connection that sent the message.
+            messageType (int): One of the client constants in MessageType.
+            value (int): The gag or target of the message.
+
+        Returns:
+            bool: Whether the message was applied.
+        """
+        battle = hosted.battle
+        if messageType == MessageType.SELECT_GAG:
+            if (
+                battle.state != CogBattleState.GAG_SELECT
+                or not Gag.NONE < value < len(Gag.NAME)
+            ):
+                return False
+            battle.selectGag(value)
+        elif messageType == MessageType.SELECT_TARGET:
+            if battle.state != CogBattleState.GAG_SELECT or value >= len(
+                battle.cogs
+            ):
+                return False
+            battle.selectTarget(value)
+        elif messageType == MessageType.TOON_JOIN:
+            if not battle.requestToonJoin(Toon()):
+                return False
+            hosted.subscribers.add(connection)
+        elif messageType == MessageType.COG_JOIN:
+            if not battle.requestCogJoin(Cog()):
+                return False
+            hosted.subscribers.add(connection)
+        else:
+            return False
+        return True
+
+    def broadcastDelta(self, battleId: int) -> None:
+        """Sends the changes to a battle since the last delta to everyone
+        watching it, removing the battle if it is over.
+
+        Args:
+            battleId (int): The ID of the battle.
+        """
+        hosted = self.battles[battleId]
+        snapshot = hosted.battle.snapshot()
+        if snapshot != hosted.broadcast:
+            delta = encodeDelta(
+                battleId, self.tick, hosted.broadcast, snapshot
+            )
+            for connection in hosted.subscribers:
+                self.send(connection, delta)
+            hosted.broadcast = snapshot
+        if hosted.battle.isOver():
+            del self.battles[battleId]
+            self.deadlines.cancel(battleId)
+
+    def send(self, connection: int, message: bytes) -> None:
+        """Queues a message to a connection for the end of the tick.
+
+        Args:
+            connection (int): The ID of the connection.
+            message (bytes): The encoded message.
+        """
+        outbox = self.outboxes.get(connection)
+        if outbox is not None:
+            outbox.append(message)
+
+    def flush(self) -> Dict[int, bytes]:
+        """Packs every connection's queued messages into one packet each."""
+        packets = {}
+        for connection, outbox in self.outboxes.items():
+            if outbox:
+                payload = b"".join(outbox)
+                outbox.clear()
+                packets[connection] = (
+                    WireFormat.PACKET.pack(len(payload)) + payload
+                )
+                self.bytesSent += len(packets[connection])
+        return packets
+
+    async def start(self, host: str, port: int) -> asyncio.AbstractServer:
+        """Listens for clients over TCP and runs ticks until stop() is
+        called.
+
+        Args:
+            host (str): The address to listen on.
+            port (int): The port to listen on, or 0 for any free port.
+
+        Returns:
+            AbstractServer: The listening server.
+        """
+        writers: Dict[int, asyncio.StreamWriter] = {}
+
+        async def handleClient(
+            reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+        ) -> None:
+            connection = self.connect()
+            writers[connection] = writer
+            try:
+                while True:
+                    data = await reader.read(65536)
+                    if not data:
+                        break
+                    self.receive(connection, data)
+            finally:
+                del writers[connection]
+                self.disconnect(connection)
+                writer.close()
+
+        async def runTicks() -> None:
+            nextTick = time.monotonic()
+            while True:
+                nextTick += self.tickInterval
+                await asyncio.sleep(max(0.0, nextTick - time.monotonic()))
+                for connection, packet in self.step().items():
+                    writer = writers.get(connection)
+                    if writer is not None:
+                        writer.write(packet)
+
+        self.server = await asyncio.start_server(handleClient, host, port)
+        self.ticker = asyncio.ensure_future(runTicks())
+        return self.server
+
+    def stop(self) -> None:
+        """Stops the ticks and closes the server started by start()."""
+        if self.server is not None:
+            self.ticker.cancel()
+            self.server.close()
+            self.server = self.ticker = None
+
+
+def encodeAction(
+    messageType: int, sequence: int, battleId: int = 0, value: int = 0
+) -> bytes:
+    """Encodes a client message.
+
+    Args:
+        messageType (int): One of the client constants in MessageType.
+        sequence (int): Identifies the message in the server's answer.
+        battleId (int): The battle the message is for.
+        value (int): The gag, target or number of cogs.
+    """
+    return WireFormat.ACTION.pack(
+        messageType, sequence & 0xFFFF, battleId, value
+    )
+
+
+def encodeDelta(
+    battleId: int,
+    tick: int,
+    previous: Optional[BattleSnapshot],
+    current: BattleSnapshot,
+) -> bytes:
+    """Encodes the changes between two snapshots of a battle.
+
+    Snapshots share the states of combatants that didn't change, so most
+    comparisons are of identical tuples.
+
+    Args:
+        battleId (int): The ID of the battle.
+        tick (int): The tick the battle is in.
+        previous (BattleSnapshot): The state last sent, or None to send every
+            combatant.
+        current (BattleSnapshot): The state to send.
+    """
+    oldToons = () if previous is None else previous.toons
+    oldCogs = () if previous is None else previous.cogs
+    toons = [
+        WireFormat.TOON.pack(i, *toon)
+        for i, toon in enumerate(current.toons)
+        if i >= len(oldToons) or oldToons[i] != toon
+    ]
+    cogs = [
+        WireFormat.COG.pack(i, cog.cogType, cog.health)
+        for i, cog in enumerate(current.cogs)
+        if i >= len(oldCogs) or oldCogs[i][:2] != cog[:2]
+    ]
+    header = WireFormat.DELTA.pack(
+        MessageType.DELTA,
+        battleId,
+        tick,
+        SnapshotFormat.STATES.index(current.state),
+        current.round,
+        current.selectedGagTurn,
+        len(current.toons),
+        len(current.cogs),
+        len(toons),
+        len(cogs),
+    )
+    return b"".join([header] + toons + cogs)
+
+
+class BattleMirror:
+    """A client's copy of a battle, kept up to date by deltas.
+
+    Attributes:
+        tick (int): The tick of the last delta.
+        state (str): One of the constants in CogBattleState.
+        round (int): How many times the battle has entered gag select.
+        selectedGagTurn (int): The index of the toon to select a gag for.
+        toons (list of tuple): The laff, gag and target index of each toon.
+        cogs (list of tuple): The cog type and health of each cog.
+    """
+
+    def __init__(self) -> None:
+        self.tick: int = 0
+        self.state: str = CogBattleState.OFF
+        self.round: int = 0
+        self.selectedGagTurn: int = 0
+        self.toons: List[Tuple[int, int, int]] = []
+        self.cogs: List[Tuple[int, int]] = []
+
+    def applyDelta(self, data: bytes, offset: int) -> int:
+        """Applies a delta from a packet.
+
+        Args:
+            data (bytes): The packet.
+            offset (int): Where the delta starts.
+
+        Returns:
+            int: Where the delta ends.
+        """
+        (
+            _,
+            _,
+            self.tick,
+            state,
+            self.round,
+            self.selectedGagTurn,
+            numToons,
+            numCogs,
+            changedToons,
+            changedCogs,
+        ) = WireFormat.DELTA.unpack_from(data, offset)
+        self.state = SnapshotFormat.STATES[state]
+        offset += WireFormat.DELTA.size
+        del self.toons[numToons:]
+        del self.cogs[numCogs:]
+        for _ in range(changedToons):
+            i, *toon = WireFormat.TOON.unpack_from(data, offset)
+            offset += WireFormat.TOON.size
+            self.toons[i : i + 1] = [tuple(toon)]
+        for _ in range(changedCogs):
+            i, *cog = WireFormat.COG.unpack_from(data, offset)
+            offset += WireFormat.COG.size
+            self.cogs[i : i + 1] = [tuple(cog)]
+        return offset
+
+    def isOver(self) -> bool:
+        """Returns whether either the toons or the cogs have won."""
+        return self.state in (
+            CogBattleState.TOONS_WON,
+            CogBattleState.COGS_WON,
+        )
+
+
+def readMessages(packet: bytes, mirrors: Dict[int, BattleMirror]) -> list:
+    """Reads the messages of a server packet, applying its deltas.
+
+    Args:
+        packet (bytes): The payload of the packet, without its length.
+        mirrors (dict of int to BattleMirror): The client's copy of each
+            battle. Battles the client hasn't seen yet are added.
+
+    Returns:
+        list of tuple: The type of every message followed by its sequence
+            number and battle ID, or by the battle ID for deltas.
+    """
+    messages = []
+    offset = 0
+    while offset < len(packet):
+        messageType = packet[offset]
+        if messageType == MessageType.DELTA:
+            battleId = WireFormat.DELTA.unpack_from(packet, offset)[1]
+            mirror = mirrors.setdefault(battleId, BattleMirror())
+            offset = mirror.applyDelta(packet, offset)
+            messages.append((messageType, battleId))
+        elif messageType == MessageType.CREATED:
+            _, sequence, battleId = WireFormat.CREATED.unpack_from(
+                packet, offset
+            )
+            offset += WireFormat.CREATED.size
+            messages.append((messageType, sequence, battleId))
+        elif messageType in (MessageType.ACK, MessageType.REJECT):
+            _, sequence = WireFormat.ACK.unpack_from(packet, offset)
+            offset += WireFormat.ACK.size
+            messages.append((messageType, sequence, None))
+        else:
+            raise ValueError(f"Unknown message type: {messageType}")
+    return messages
+
+
+async def runLoad(
+    host: str,
+    port: int,
+    numClients: int = 1000,
+    numConnections: int = 10,
+    battlesPerClient: int = 1,
+    numCogs: int = 1,
+    seed: int = 0,
+) -> dict:
+    """Simulates many clients playing battles against a lockstep server.
+
+    Clients are spread over a few connections, as if they were behind the
+    same proxies, so thousands of them don't need thousands of sockets. Each
+    client creates a battle and throws at a random cog whenever the battle
+    waits on its toon, until it has finished its battles.
+
+    Args:
+        host (str): The address of the server.
+        port (int): The port of the server.
+        numClients (int): How many clients to simulate.
+        numConnections (int): How many connections to spread them over.
+        battlesPerClient (int): How many battles each client plays.
+        numCogs (int): How many cogs start in each battle.
+        seed (int): Seed for the clients' choice of targets.
+
+    Returns:
+        dict: The battles played, the bytes per battle in each direction and
+            the round-trip latency of actions.
+    """
+    rng = random.Random(seed)
+    latencies: List[float] = []
+    totals = {"battles": 0, "bytesSent": 0, "bytesReceived": 0}
+
+    async def connection(numLocal: int) -> None:
+        reader, writer = await asyncio.open_connection(host, port)
+        mirrors: Dict[int, BattleMirror] = {}
+        sentAt: Dict[int, float] = {}
+        creators: Dict[int, int] = {}
+        battlesLeft = [battlesPerClient] * numLocal
+        acted: Dict[int, Tuple[int, int]] = {}
+        sequence = 0
+
+        def send(messageType: int, battleId: int = 0, value: int = 0) -> int:
+            nonlocal sequence
+            sequence = (sequence + 1) & 0xFFFF
+            message = encodeAction(messageType, sequence, battleId, value)
+            writer.write(message)
+            totals["bytesSent"] += len(message)
+            sentAt[sequence] = time.perf_counter()
+            return sequence
+
+        for client in range(numLocal):
+            creators[send(MessageType.CREATE, value=numCogs)] = client
+        owners: Dict[int, int] = {}
+        while any(battlesLeft):
+            header = await reader.readexactly(WireFormat.PACKET.size)
+            (length,) = WireFormat.PACKET.unpack(header)
+            packet = await reader.readexactly(length)
+            totals["bytesReceived"] += len(header) + length
+            now = time.perf_counter()
+            for message in readMessages(packet, mirrors):
+                if message[0] != MessageType.DELTA:
+                    start = sentAt.pop(message[1], None)
+                    if start is not None:
+                        latencies.append(now - start)
+                    if message[0] == MessageType.CREATED:
+                        owners[message[2]] = creators.pop(message[1])
+                    continue
+                battleId = message[1]
+                mirror = mirrors[battleId]
+                client = owners[battleId]
+                if mirror.isOver():
+                    del mirrors[battleId]
+                    totals["battles"] += 1
+                    battlesLeft[client] -= 1
+                    if battlesLeft[client]:
+                        creators[send(MessageType.CREATE, value=numCogs)] = (
+                            client
+                        )
+                    continue
+                turn = (mirror.round, mirror.selectedGagTurn)
+                if (
+                    mirror.state == CogBattleState.GAG_SELECT
+                    and acted.get(battleId) != turn
+                ):
+                    acted[battleId] = turn
+                    send(MessageType.SELECT_GAG, battleId, Gag.THROW)
+                    if len(mirror.cogs) > 1:
+                        send(
+                            MessageType.SELECT_TARGET,
+                            battleId,
+                            rng.randrange(len(mirror.cogs)),
+                        )
+            await writer.drain()
+        writer.close()
+
+    numConnections = min(numConnections, numClients)
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            connection(
+                numClients // numConnections
+                + (i < numClients % numConnections)
+            )
+            for i in range(numConnections)
+        )
+    )
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "clients": numClients,
+        "battles": totals["battles"],
+        "seconds": elapsed,
+        "bytesSentPerBattle": totals["bytesSent"] / totals["battles"],
+        "bytesReceivedPerBattle": totals["bytesReceived"] / totals["battles"],
+        "actions": len(latencies),
+        "p50Ms": latencies[len(latencies) // 2] * 1000,
+        "p99Ms": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Runs cog battles in lockstep for remote clients."
+    )
+    parser.add_argument("command", choices=["serve", "load"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7199)
+    parser.add_argument("--tick-rate", type=float, default=50.0)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--connections", type=int, default=10)
+    parser.add_argument("--battles", type=int, default=1)
+    parser.add_argument("--cogs", type=int, default=1)
+    args = parser.parse_args()
+    if args.command == "serve":
+
+        async def serve() -> None:
+            server = await LockstepServer(args.tick_rate).start(
+                args.host, args.port
+            )
+            async with server:
+                await server.serve_forever()
+
+        asyncio.run(serve())
+    else:
+        result = asyncio.run(
+            runLoad(
+                args.host,
+                args.port,
+                args.clients,
+                args.connections,
+                args.battles,
+                args.cogs,
+            )
+        )
+        print(json.dumps(result, indent=2))
@@ -2,8 +2,10 @@
 
 from direct.showbase.ShowBase import ShowBase
 from direct.gui.OnscreenText import OnscreenText
+from battlehud import BattleHud
 from cogbattle import CogBattle
 from gag import Gag
+from gagpolicy import GagPolicy, MonteCarloPolicy
 from cog import Cog
 from toon import Toon
 from panda3d.core import TextNode
@@ -41,12 +43,22 @@ class CogBattleDemo(ShowBase):
     cogs are dead or are toons have been greened.
 
     Attributes:
+        hud (BattleHud): Shows the battle in the window; the battle reports
+            its events to it instead of printing them.
         cogBattle (CogBattle): The cog battle that the demo is running.
+        botPolicy (GagPolicy): Chooses gags for the toon whose turn it is
+            when asked to.
     """
 
     def __init__(self) -> None:
         super().__init__()
-        self.cogBattle: CogBattle = CogBattle([Toon()], [Cog()])
+        self.hud: BattleHud = BattleHud(self.a2dTopRight)
+        self.cogBattle: CogBattle = CogBattle(
+            [Toon()], [Cog()], eventSink=self.hud
+        )
+        self.hud.track(self.cogBattle)
+        self.hud.start()
+        self.botPolicy: GagPolicy = MonteCarloPolicy()
         self.generateInstructions()
         self.bindInput()
 
@@ -63,13 +75,22 @@ class CogBattleDemo(ShowBase):
         genText("8: Target Cog 2", 8)
         genText("9: Target Cog 3", 9)
         genText("0: Target Cog 4", 10)
+        genText("B: Let a Bot Choose", 11)
+
+    def addToon(self) -> None:
+        """Asks for a new toon to join the battle."""
+        self.cogBattle.requestToonJoin(Toon())
+
+    def addCog(self) -> None:
+        """Asks for a new cog to join the battle."""
+        self.cogBattle.requestCogJoin(Cog())
 
     def bindInput(self):
         """Binds possible actions to certain keys for player interaction."""
         self.accept("escape", sys.exit)
         self.accept("s", self.cogBattle.startCogBattle)
-        self.accept("t", self.cogBattle.requestToonJoin, [Toon()])
-        self.accept("c", self.cogBattle.requestCogJoin, [Cog()])
+        self.accept("t", self.addToon)
+        self.accept("c", self.addCog)
         self.accept("1", self.cogBattle.selectGag, [Gag.PASS])
         self.accept("2", self.cogBattle.selectGag, [Gag.SQUIRT])
         self.accept("3", self.cogBattle.selectGag, [Gag.THROW])
@@ -77,6 +98,7 @@ class CogBattleDemo(ShowBase):
         self.accept("8", self.cogBattle.selectTarget, [1])
         self.accept("9", self.cogBattle.selectTarget, [2])
         self.accept("0", self.cogBattle.selectTarget, [3])
+        self.accept("b", self.botPolicy.play, [self.cogBattle])
 
 
 if __name__ == "__main__":
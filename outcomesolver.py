@@ -0,0 +1,355 @@
+"""Copyright 2021, James S. Wang, All rights reserved."""
+
+from battletables import TABLES
+from cog import Cog
+from collections import OrderedDict
+from gag import Gag
+from toon import Toon
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import itertools
+import math
+
+
+class SolvedOutcome(NamedTuple):
+    """The exact outcome of a battle from some state onwards.
+
+    Attributes:
+        toonWinChance (float): The probability that the toons win.
+        cogWinChance (float): The probability that the cogs win.
+        expectedRounds (float): The expected number of rounds left, counting
+            the current one. Infinite if the battle might never end.
+    """
+
+    toonWinChance: float
+    cogWinChance: float
+    expectedRounds: float
+
+
+class OutcomeSolver:
+    """Computes exact battle outcomes by expanding every round's transitions.
+
+    A state is taken at the start of gag select and holds the (gag, health) of
+    every living toon and the (cog type, health) of every living cog. Each
+    round is expanded into the distribution of states that executeGags() and
+    attackToons() can lead to, following the same rules as BattleEngine:
+    toons with the same gag share a single hit roll capped at 95%, a gag
+    whose target has already been defeated does nothing, each cog hits with a
+    random attack, and cogs pick their targets from the toons that were alive
+    when they started attacking.
+
+    Toons that share a gag and health are interchangeable, so toons are kept
+    sorted. Cogs are kept in battle order when toons target the first cog,
+    and sorted when toons pick random targets. Solved states are memoized in
+    a cache that drops the least recently used states once it is full. A
+    cache much smaller than the number of reachable states makes states get
+    solved again and again, so it should only bound memory, not replace it.
+
+    Args:
+        toonGags (list of int): The gag that each toon selects every round.
+        cogs (list of Cog): The cogs that start in the battle.
+        toonLaff (int): Starting laff of each toon. Defaults to Toon's laff.
+        randomTargets (bool): Whether toons pick a random living cog as their
+            target instead of the first living cog.
+        cacheSize (int): The most states to keep memoized.
+
+    Attributes:
+        toonGags (list of int): The gag that each toon selects every round.
+        cogs (list of Cog): The cogs that start in the battle.
+        toonLaff (int): Starting laff of each toon.
+        randomTargets (bool): Whether toons pick random living cogs.
+        cacheSize (int): The most states to keep memoized.
+        cache (OrderedDict): Maps states to their SolvedOutcome, least
+            recently used first.
+        attackCache (OrderedDict): Maps toons and cog types to the outcomes
+            of the cogs' attacks, least recently used first.
+        attackTables (dict of int to tuple): The chance to hit of each cog
+            type, and the damage and chance of hitting with each attack.
+        hits (int): How many times a state was found in the cache.
+        misses (int): How many states had to be expanded.
+    """
+
+    def __init__(
+        self,
+        toonGags: List[int],
+        cogs: List[Cog],
+        toonLaff: Optional[int] = None,
+        randomTargets: bool = False,
+        cacheSize: int = 1000000,
+    ) -> None:
+        self.toonGags: List[int] = list(toonGags)
+        self.cogs: List[Cog] = list(cogs)
+        self.toonLaff: int = Toon().laff if toonLaff is None else toonLaff
+        self.randomTargets: bool = randomTargets
+        self.cacheSize: int = cacheSize
+        self.cache: OrderedDict = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.attackCache: OrderedDict = OrderedDict()
+        self.attackTables: Dict[int, Tuple[float, List[Tuple[int, float]]]] = (
+            {}
+        )
+
+    def solve(self) -> SolvedOutcome:
+        """Returns the exact outcome of the battle from its start."""
+        return self.solveState(
+            self.canonicalToons(
+                self.toonGags, [self.toonLaff] * len(self.toonGags)
+            ),
+            self.canonicalCogs(
+                [cog.cogType for cog in self.cogs],
+                [cog.health for cog in self.cogs],
+            ),
+        )
+
+    def solveState(self, toons: tuple, cogs: tuple) -> SolvedOutcome:
+        """Returns the exact outcome of the battle from a state.
+
+        Args:
+            toons (tuple): The canonical (gag, health) of every living toon.
+            cogs (tuple): The canonical (cog type, health) of every living
+                cog.
+        """
+        key = (toons, cogs)
+        outcome = self.cache.get(key)
+        if outcome is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return outcome
+        self.misses += 1
+
+        toonWin = cogWin = 0.0
+        rounds = 1.0
+        stay = 0.0
+        for cogHealth, gagChance in self.executeGags(toons, cogs).items():
+            nextCogs = self.canonicalCogs(
+                [cogType for cogType, _ in cogs], cogHealth
+            )
+            if not nextCogs:
+                toonWin += gagChance
+                continue
+            cogTypes = tuple(sorted(cogType for cogType, _ in nextCogs))
+            for nextToons, attackChance in self.attackToons(
+                toons, cogTypes
+            ).items():
+                chance = gagChance * attackChance
+                if not nextToons:
+                    cogWin += chance
+                elif (nextToons, nextCogs) == key:
+                    stay += chance
+                else:
+                    # Look up the cache here so that solved states don't
+                    # cost a call.
+                    nextKey = (nextToons, nextCogs)
+                    following = self.cache.get(nextKey)
+                    if following is None:
+                        following = self.solveState(nextToons, nextCogs)
+                    else:
+                        self.hits += 1
+                        self.cache.move_to_end(nextKey)
+                    toonWin += chance * following.toonWinChance
+                    cogWin += chance * following.cogWinChance
+                    rounds += chance * following.expectedRounds
+
+        # A round that changes nothing repeats until something happens.
+        if 1 - stay < 1e-12:
+            outcome = SolvedOutcome(0.0, 0.0, math.inf)
+        else:
+            outcome = SolvedOutcome(
+                toonWin / (1 - stay), cogWin / (1 - stay), rounds / (1 - stay)
+            )
+        self.remember(self.cache, key, outcome)
+        return outcome
+
+    def remember(self, cache: OrderedDict, key: tuple, value) -> None:
+        """Stores a value in a cache, dropping the least recently used value
+        if the cache is full.
+
+        Args:
+            cache (OrderedDict): The cache to store the value in.
+            key (tuple): The key of the value.
+            value (Any): The value to store.
+        """
+        cache[key] = value
+        if len(cache) > self.cacheSize:
+            cache.popitem(last=False)
+
+    def executeGags(self, toons: tuple, cogs: tuple) -> Dict[tuple, float]:
+        """Expands every way the toons' gags can play out in a round.
+
+        Targets are picked before any gag is executed, so the targets of each
+        group of toons sharing a gag are expanded along with that group's hit
+        roll.
+
+        Args:
+            toons (tuple): The canonical (gag, health) of every living toon.
+            cogs (tuple): The canonical (cog type, health) of every living
+                cog.
+
+        Returns:
+            dict of tuple to float: Maps the health of every cog, in the order
+                of cogs, to its probability.
+        """
+        healths = {tuple(health for _, health in cogs): 1.0}
+        for gag in Gag.EXECUTE_ORDER:
+            attackers = sum(1 for toonGag, _ in toons if toonGag == gag)
+            if not attackers:
+                continue
+            hitChance = min(0.95, Gag.CHANCE_TO_HIT[gag])
+            nextHealths: Dict[tuple, float] = {}
+            for targets, targetChance in self.targetings(attackers, len(cogs)):
+                for health, chance in healths.items():
+                    chance *= targetChance
+                    hit = list(health)
+                    for target in targets:
+                        if hit[target] > 0:
+                            hit[target] = max(0, hit[target] - Gag.DAMAGE[gag])
+                    addChance(nextHealths, health, chance * (1 - hitChance))
+                    addChance(nextHealths, tuple(hit), chance * hitChance)
+            healths = nextHealths
+        return healths
+
+    def targetings(self, numToons: int, numCogs: int) -> List[tuple]:
+        """Lists every way a group of toons sharing a gag can pick targets.
+
+        Toons in the same group are interchangeable, so only the number of
+        toons picking each cog matters.
+
+        Args:
+            numToons (int): How many toons are in the group.
+            numCogs (int): How many cogs are alive.
+
+        Returns:
+            list of tuple: Pairs of the targets of the toons and the
+                probability of the toons picking those targets.
+        """
+        if not self.randomTargets or numCogs == 1:
+            return [((0,) * numToons, 1.0)]
+        targetings = []
+        for targets in itertools.combinations_with_replacement(
+            range(numCogs), numToons
+        ):
+            orderings = math.factorial(numToons)
+            for cog in set(targets):
+                orderings //= math.factorial(targets.count(cog))
+            targetings.append((targets, orderings / numCogs**numToons))
+        return targetings
+
+    def attackToons(self, toons: tuple, cogTypes: tuple) -> Dict[tuple, float]:
+        """Expands every way the cogs' attacks can play out in a round.
+
+        The order that cogs attack in doesn't change the outcome, and neither
+        does which of several identical toons gets hit, so the expansion is
+        memoized on the toons and the sorted cog types.
+
+        Args:
+            toons (tuple): The canonical (gag, health) of every living toon.
+            cogTypes (tuple of int): The sorted types of every cog still alive
+                after the gags were executed.
+
+        Returns:
+            dict of tuple to float: Maps the canonical toons left after the
+                attacks to their probability.
+        """
+        key = (toons, cogTypes)
+        outcomes = self.attackCache.get(key)
+        if outcomes is not None:
+            self.attackCache.move_to_end(key)
+            return outcomes
+
+        numToons = len(toons)
+        states = {toons: 1.0}
+        for cogType in cogTypes:
+            hitChance, damages = self.attackTable(cogType)
+            nextStates: Dict[tuple, float] = {}
+            for state, chance in states.items():
+                addChance(nextStates, state, chance * (1 - hitChance))
+                for target, (gag, health) in enumerate(state):
+                    if target and state[target - 1] == (gag, health):
+                        continue
+                    copies = state.count((gag, health))
+                    for damage, damageChance in damages:
+                        hit = list(state)
+                        hit[target] = (gag, max(0, health - damage))
+                        addChance(
+                            nextStates,
+                            tuple(sorted(hit)),
+                            chance * damageChance * copies / numToons,
+                        )
+            states = nextStates
+
+        outcomes = {}
+        for state, chance in states.items():
+            addChance(
+                outcomes,
+                tuple(toon for toon in state if toon[1] > 0),
+                chance,
+            )
+        self.remember(self.attackCache, key, outcomes)
+        return outcomes
+
+    def attackTable(
+        self, cogType: int
+    ) -> Tuple[float, List[Tuple[int, float]]]:
+        """Returns the chance to hit of a cog type, and the damage of each of
+        its attacks along with the chance that the cog hits with it.
+
+        A cog picks one of its attacks at random and rolls it for a hit, so
+        its chance to hit is the average of its attacks' chances.
+
+        Args:
+            cogType (int): The ID of the cog type.
+        """
+        table = self.attackTables.get(cogType)
+        if table is None:
+            attacks = TABLES.cogAttacks[cogType]
+            damages = [
+                (
+                    TABLES.cogAttackDamage[a],
+                    TABLES.cogAttackChanceToHit[a] / len(attacks),
+                )
+                for a in attacks
+            ]
+            table = (sum(chance for _, chance in damages), damages)
+            self.attackTables[cogType] = table
+        return table
+
+    def canonicalToons(self, gags: List[int], healths: tuple) -> tuple:
+        """Builds the canonical toons of a state, dropping defeated toons.
+
+        Args:
+            gags (list of int): The gag of each toon.
+            healths (tuple of int): The laff of each toon.
+        """
+        return tuple(
+            sorted(
+                (gag, health)
+                for gag, health in zip(gags, healths)
+                if health > 0
+            )
+        )
+
+    def canonicalCogs(self, cogTypes: List[int], healths: tuple) -> tuple:
+        """Builds the canonical cogs of a state, dropping defeated cogs.
+
+        Args:
+            cogTypes (list of int): The type of each cog, in battle order.
+            healths (tuple of int): The health of each cog.
+        """
+        cogs = tuple(
+            (cogType, health)
+            for cogType, health in zip(cogTypes, healths)
+            if health > 0
+        )
+        return tuple(sorted(cogs)) if self.randomTargets else cogs
+
+
+def addChance(outcomes: Dict[tuple, float], key: tuple, chance: float) -> None:
+    """Adds to the probability of an outcome, ignoring impossible outcomes.
+
+    Args:
+        outcomes (dict of tuple to float): The distribution to add to.
+        key (tuple): The outcome.
+        chance (float): The probability to add.
+    """
+    if chance > 0:
+        outcomes[key] = outcomes.get(key, 0.0) + chance
@@ -0,0 +1,526 @@
+"""Copyright 2021, James S. Wang, All rights reserved."""
+
+from battleengine import BattleEngine, CogBattleState
+from battlerng import CounterRng
+from battlelog import BattleEventSink, BattleEventSubject, BattleEventType
+from battletables import TABLES
+from cog import Cog
+from collections import deque
+from toon import Toon
+from typing import (
+    Any,
+    BinaryIO,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+)
+import mmap
+import random
+import struct
+
+
+class ReplayRecordType:
+    """Namespace for the different records stored in a replay."""
+
+    BEGIN: int = 0
+    END: int = 1
+    ROSTER: int = 2
+    ROLL: int = 3
+    CHOICE: int = 4
+    START: int = 5
+    STATE: int = 6
+    JOIN: int = 7
+    SELECT_GAG: int = 8
+    SELECT_TARGET: int = 9
+    INVALID_TARGET: int = 10
+    HIT: int = 11
+    MISS: int = 12
+    DAMAGE: int = 13
+    TIMEOUT: int = 14
+    ADD_PENDING: int = 15
+
+
+class ReplayRecord(NamedTuple):
+    """A single fixed-width record in a replay.
+
+    Attributes:
+        recordType (int): One of the constants in ReplayRecordType.
+        subject (int): The index of the subject in SUBJECTS.
+        index (int): The index of the toon or cog, or -1 if there is none.
+        value (float): The encoded value of the record.
+    """
+
+    recordType: int
+    subject: int
+    index: int
+    value: float
+
+
+class ReplayError(Exception):
+    """Raised when a replay is malformed or doesn't match its battle."""
+
+
+MAGIC: bytes = b"CBR1"
+RECORD: struct.Struct = struct.Struct("<BBhd")
+CHUNK_HEADER: struct.Struct = struct.Struct("<I")
+SUBJECTS: List[str] = [
+    BattleEventSubject.BATTLE,
+    BattleEventSubject.TOON,
+    BattleEventSubject.COG,
+]
+STATES: List[str] = [
+    CogBattleState.OFF,
+    CogBattleState.GAG_SELECT,
+    CogBattleState.GAG_EXECUTE,
+    CogBattleState.COGS_ATTACK,
+    CogBattleState.TOONS_WON,
+    CogBattleState.COGS_WON,
+]
+EVENT_RECORD_TYPES: Dict[str, int] = {
+    BattleEventType.START: ReplayRecordType.START,
+    BattleEventType.STATE: ReplayRecordType.STATE,
+    BattleEventType.JOIN: ReplayRecordType.JOIN,
+    BattleEventType.SELECT_GAG: ReplayRecordType.SELECT_GAG,
+    BattleEventType.SELECT_TARGET: ReplayRecordType.SELECT_TARGET,
+    BattleEventType.INVALID_TARGET: ReplayRecordType.INVALID_TARGET,
+    BattleEventType.HIT: ReplayRecordType.HIT,
+    BattleEventType.MISS: ReplayRecordType.MISS,
+    BattleEventType.DAMAGE: ReplayRecordType.DAMAGE,
+    BattleEventType.TIMEOUT: ReplayRecordType.TIMEOUT,
+    BattleEventType.ADD_PENDING: ReplayRecordType.ADD_PENDING,
+}
+
+
+def encodeEvent(
+    eventType: str, subject: str, index: Optional[int], value: Any
+) -> Optional[ReplayRecord]:
+    """Encodes a battle event as a replay record.
+
+    Args:
+        eventType (str): One of the constants in BattleEventType.
+        subject (str): One of the constants in BattleEventSubject.
+        index (int): The index of the toon or cog the event is about.
+        value (Any): The value of the event.
+
+    Returns:
+        ReplayRecord: The record, or None if the event is only for display.
+    """
+    recordType = EVENT_RECORD_TYPES.get(eventType)
+    if recordType is None:
+        return None
+    if recordType == ReplayRecordType.STATE:
+        value = STATES.index(value)
+    elif value is None:
+        value = 0
+    return ReplayRecord(
+        recordType,
+        SUBJECTS.index(subject),
+        -1 if index is None else index,
+        float(value),
+    )
+
+
+class RecordingRandom:
+    """Wraps a random number generator and records every roll to a replay.
+
+    Only random() and choice() are used by combatants, so only those are
+    provided. choice() rolls with randrange(), which consumes the wrapped
+    generator exactly like choice() does.
+
+    Args:
+        rng (random.Random or RollStream): The generator to roll with.
+        writer (ReplayWriter): The replay to record the rolls to.
+    """
+
+    def __init__(self, rng: random.Random, writer: "ReplayWriter") -> None:
+        self.rng: random.Random = rng
+        self.writer: ReplayWriter = writer
+
+    def random(self) -> float:
+        roll = self.rng.random()
+        self.writer.write(ReplayRecord(ReplayRecordType.ROLL, 0, -1, roll))
+        return roll
+
+    def choice(self, seq: Sequence) -> Any:
+        index = self.rng.randrange(len(seq))
+        self.writer.write(ReplayRecord(ReplayRecordType.CHOICE, 0, -1, index))
+        return seq[index]
+
+
+class RecordingCounterRng(CounterRng):
+    """A CounterRng whose streams record every roll to a replay.
+
+    The battle still sees a CounterRng, so its rolls stay keyed by round and
+    combatant exactly as they would be without recording.
+
+    Args:
+        key (int): The key of the battle's stream.
+        writer (ReplayWriter): The replay to record the rolls to.
+
+    Attributes:
+        writer (ReplayWriter): The replay to record the rolls to.
+    """
+
+    def __init__(self, key: int, writer: "ReplayWriter") -> None:
+        super().__init__(key)
+        self.writer: ReplayWriter = writer
+
+    def stream(self, actor: int) -> RecordingRandom:
+        return RecordingRandom(super().stream(actor), self.writer)
+
+
+class ReplayWriter(BattleEventSink):
+    """An event sink that appends battles to a binary replay file.
+
+    The file starts with MAGIC and is followed by length-prefixed chunks of
+    fixed-width records. Each battle starts with a BEGIN record followed by
+    its roster, and ends with an END record. Roster and join records for cogs
+    keep the cog type in their index.
+
+    Args:
+        file (BinaryIO): The file to write to, positioned at its end.
+        forward (BattleEventSink): Another sink to pass every event on to.
+        chunkSize (int): How many records to buffer per chunk.
+
+    Attributes:
+        file (BinaryIO): The file to write to.
+        forward (BattleEventSink): Another sink to pass every event on to.
+        chunkSize (int): How many records to buffer per chunk.
+        buffer (bytearray): Records that haven't been written yet.
+        bufferedRecords (int): How many records are in the buffer.
+    """
+
+    def __init__(
+        self,
+        file: BinaryIO,
+        forward: Optional[BattleEventSink] = None,
+        chunkSize: int = 4096,
+    ) -> None:
+        self.file: BinaryIO = file
+        self.forward: Optional[BattleEventSink] = forward
+        self.chunkSize: int = chunkSize
+        self.buffer: bytearray = bytearray()
+        self.bufferedRecords: int = 0
+        if file.tell() == 0:
+            file.write(MAGIC)
+
+    @classmethod
+    def open(cls, path: str, **kwargs) -> "ReplayWriter":
+        """Creates a writer that appends to the replay at a path.
+
+        Args:
+            path (str): The path of the replay.
+        """
+        return cls(open(path, "ab"), **kwargs)
+
+    def recordBattle(
+        self,
+        toons: List[Toon],
+        cogs: List[Cog],
+        deterministic: bool = False,
+        rng: Optional[random.Random] = None,
+        battleClass: type = BattleEngine,
+    ) -> BattleEngine:
+        """Creates a battle whose events and rolls are recorded.
+
+        Args:
+            toons (list of Toon): The toons that initiated the battle.
+            cogs (list of Cog): The cogs that initiated the battle.
+            deterministic (bool): Whether the battle should be deterministic.
+            rng (random.Random or CounterRng): The generator to roll with.
+            battleClass (type): BattleEngine or a subclass like CogBattle.
+
+        Returns:
+            BattleEngine: The battle, which should be passed to endBattle()
+                once it is over.
+        """
+        self.write(
+            ReplayRecord(
+                ReplayRecordType.BEGIN,
+                0,
+                len(toons) + len(cogs),
+                float(deterministic),
+            )
+        )
+        for toon in toons:
+            self.write(ReplayRecord(ReplayRecordType.ROSTER, 1, -1, toon.laff))
+        for cog in cogs:
+            self.write(
+                ReplayRecord(
+                    ReplayRecordType.ROSTER, 2, cog.cogType, cog.health
+                )
+            )
+        if isinstance(rng, CounterRng):
+            recordingRng = RecordingCounterRng(rng.key, self)
+        else:
+            recordingRng = RecordingRandom(
+                random.Random() if rng is None else rng, self
+            )
+        return battleClass(toons, cogs, deterministic, recordingRng, self)
+
+    def endBattle(self) -> None:
+        """Marks the end of the battle that is being recorded."""
+        self.write(ReplayRecord(ReplayRecordType.END, 0, -1, 0.0))
+
+    def emit(
+        self,
+        eventType: str,
+        subject: str,
+        index: Optional[int] = None,
+        value: Any = None,
+    ) -> None:
+        record = encodeEvent(eventType, subject, index, value)
+        if record is not None:
+            self.write(record)
+        if self.forward is not None:
+            self.forward.emit(eventType, subject, index, value)
+
+    def write(self, record: ReplayRecord) -> None:
+        """Buffers a record, writing a chunk once the buffer is full.
+
+        Args:
+            record (ReplayRecord): The record to write.
+        """
+        self.buffer += RECORD.pack(*record)
+        self.bufferedRecords += 1
+        if self.bufferedRecords >= self.chunkSize:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.buffer:
+            self.file.write(CHUNK_HEADER.pack(len(self.buffer)))
+            self.file.write(self.buffer)
+            self.buffer = bytearray()
+            self.bufferedRecords = 0
+        self.file.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+
+class ReplayReader:
+    """Reads a replay file through a memory map.
+
+    Args:
+        path (str): The path of the replay.
+
+    Attributes:
+        file (BinaryIO): The open replay file.
+        data (mmap): The memory-mapped contents of the file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.file: BinaryIO = open(path, "rb")
+        self.data: mmap.mmap = mmap.mmap(
+            self.file.fileno(), 0, access=mmap.ACCESS_READ
+        )
+        if self.data[: len(MAGIC)] != MAGIC:
+            self.close()
+            raise ReplayError(f"{path} is not a replay")
+
+    def __enter__(self) -> "ReplayReader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Unmaps and closes the replay file."""
+        self.data.close()
+        self.file.close()
+
+    def records(self) -> Iterator[ReplayRecord]:
+        """Yields every record in the replay, in order."""
+        offset = len(MAGIC)
+        while offset < len(self.data):
+            (length,) = CHUNK_HEADER.unpack_from(self.data, offset)
+            offset += CHUNK_HEADER.size
+            chunk = self.data[offset : offset + length]
+            for fields in RECORD.iter_unpack(chunk):
+                yield ReplayRecord(*fields)
+            offset += length
+
+    def battles(self) -> Iterator[List[ReplayRecord]]:
+        """Yields the records of each battle in the replay, in order."""
+        battle: List[ReplayRecord] = []
+        for record in self.records():
+            battle.append(record)
+            if record.recordType == ReplayRecordType.END:
+                yield battle
+                battle = []
+
+
+class ReplayRecordSink(BattleEventSink):
+    """A sink that encodes the events of a replayed battle for comparison.
+
+    Attributes:
+        records (list of ReplayRecord): The encoded events.
+    """
+
+    def __init__(self) -> None:
+        self.records: List[ReplayRecord] = []
+
+    def emit(
+        self,
+        eventType: str,
+        subject: str,
+        index: Optional[int] = None,
+        value: Any = None,
+    ) -> None:
+        record = encodeEvent(eventType, subject, index, value)
+        if record is not None:
+            self.records.append(record)
+
+
+class BattleReplayer:
+    """Plays a recorded battle again and checks it happens identically.
+
+    The recorded inputs (starting, joins, selections, and timeouts) are
+    applied to a new battle, which rolls with the recorded rolls. Every event
+    that the new battle reports must match the next recorded event.
+
+    Args:
+        records (iterable of ReplayRecord): The records of a single battle.
+
+    Attributes:
+        records (iterator of ReplayRecord): The records left to replay.
+        lookahead (deque of ReplayRecord): Records that were skipped over
+            while searching for a roll.
+    """
+
+    def __init__(self, records: Iterable[ReplayRecord]) -> None:
+        self.records: Iterator[ReplayRecord] = iter(records)
+        self.lookahead: Deque[ReplayRecord] = deque()
+
+    def replay(self, battleClass: type = BattleEngine) -> BattleEngine:
+        """Replays the battle.
+
+        Args:
+            battleClass (type): BattleEngine or a subclass like CogBattle.
+
+        Returns:
+            BattleEngine: The replayed battle.
+
+        Raises:
+            ReplayError: If the battle doesn't happen the way it was recorded.
+        """
+        begin = self.nextRecord()
+        if begin.recordType != ReplayRecordType.BEGIN:
+            raise ReplayError(f"Expected a battle to begin, got {begin}")
+        toons, cogs = [], []
+        for _ in range(begin.index):
+            roster = self.nextRecord()
+            if roster.subject == 1:
+                toon = Toon()
+                toon.laff = int(roster.value)
+                toons.append(toon)
+            else:
+                cog = Cog(*TABLES.cogTypes[roster.index])
+                cog.health = int(roster.value)
+                cogs.append(cog)
+
+        sink = ReplayRecordSink()
+        battle = battleClass(
+            toons, cogs, bool(begin.value), ReplayRandom(self), sink
+        )
+        position = 0
+        while True:
+            record = self.nextRecord()
+            if record.recordType == ReplayRecordType.END:
+                break
+            if position == len(sink.records):
+                self.applyInput(battle, record)
+            if position == len(sink.records) or (
+                sink.records[position] != record
+            ):
+                raise ReplayError(f"Battle diverged at {record}")
+            position += 1
+        if position != len(sink.records):
+            raise ReplayError(f"Battle reported {sink.records[position]}")
+        return battle
+
+    def applyInput(self, battle: BattleEngine, record: ReplayRecord) -> None:
+        """Applies a recorded input to the battle.
+
+        Args:
+            battle (BattleEngine): The battle being replayed.
+            record (ReplayRecord): The input to apply.
+        """
+        recordType = record.recordType
+        if recordType == ReplayRecordType.START:
+            battle.start()
+        elif recordType == ReplayRecordType.SELECT_GAG:
+            battle.selectGag(int(record.value))
+        elif recordType in (
+            ReplayRecordType.SELECT_TARGET,
+            ReplayRecordType.INVALID_TARGET,
+        ):
+            battle.selectTarget(int(record.value))
+        elif recordType == ReplayRecordType.JOIN and record.subject == 1:
+            toon = Toon()
+            toon.laff = int(record.value)
+            battle.requestToonJoin(toon)
+        elif recordType == ReplayRecordType.JOIN:
+            cog = Cog(*TABLES.cogTypes[record.index])
+            cog.health = int(record.value)
+            battle.requestCogJoin(cog)
+        elif recordType == ReplayRecordType.ADD_PENDING:
+            battle.addPendingCombatants()
+        elif recordType == ReplayRecordType.TIMEOUT:
+            battle.timeOut()
+        else:
+            raise ReplayError(f"Battle didn't report {record}")
+
+    def nextRecord(self) -> ReplayRecord:
+        """Returns the next record that isn't a roll."""
+        if self.lookahead:
+            return self.lookahead.popleft()
+        record = next(self.records, None)
+        if record is None:
+            raise ReplayError("Replay ended in the middle of a battle")
+        if record.recordType in (
+            ReplayRecordType.ROLL,
+            ReplayRecordType.CHOICE,
+        ):
+            raise ReplayError(f"Battle didn't use {record}")
+        return record
+
+    def nextRoll(self, recordType: int) -> float:
+        """Returns the value of the next roll, skipping over other records.
+
+        Args:
+            recordType (int): ROLL or CHOICE.
+        """
+        for record in self.records:
+            if record.recordType == recordType:
+                return record.value
+            if record.recordType in (
+                ReplayRecordType.ROLL,
+                ReplayRecordType.CHOICE,
+            ):
+                raise ReplayError(f"Battle rolled differently than {record}")
+            self.lookahead.append(record)
+        raise ReplayError("Replay ran out of rolls")
+
+
+class ReplayRandom:
+    """A stand-in random number generator that returns recorded rolls.
+
+    Args:
+        replayer (BattleReplayer): The replayer to take rolls from.
+    """
+
+    def __init__(self, replayer: BattleReplayer) -> None:
+        self.replayer: BattleReplayer = replayer
+
+    def random(self) -> float:
+        return self.replayer.nextRoll(ReplayRecordType.ROLL)
+
+    def choice(self, seq: Sequence) -> Any:
+        return seq[int(self.replayer.nextRoll(ReplayRecordType.CHOICE))]
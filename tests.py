@@ -1,11 +1,77 @@
 """Copyright 2021, James S. Wang, All rights reserved."""
 
 from main import CogBattleDemo
-from cogbattle import CogBattle, CogBattleState
-from toon import Toon
+from battleengine import (
+    BattleAction,
+    BattleActionType,
+    BattleEngine,
+    BattleSnapshot,
+    CogBattleState,
+)
+from battleanalytics import (
+    BattleAnalytics,
+    QuantileDigest,
+    RunningStats,
+    analyzeFarm,
+    readEventLog,
+    readReplayEvents,
+)
+from battlefarm import BattleFarm
+from battleprofiler import BattleProfiler, LatencyHistogram
+from battlestore import BattleStore
+from battlehud import BattleHud
+from battlerng import CounterRng, roll, rollBlock
+from benchmarks import benchmarkImportTime, compareResults, runBenchmarks
+from battlelog import (
+    BattleEvent,
+    BattleEventSubject,
+    BattleEventType,
+    BufferedEventSink,
+    FileEventSink,
+)
+from replay import (
+    BattleReplayer,
+    ReplayError,
+    ReplayReader,
+    ReplayRecordType,
+    ReplayWriter,
+)
+from battletables import BattleTables, loadBattleTables
+from outcomesolver import OutcomeSolver
+from battleserver import BattleServer, DeadlineHeap
+from balancesweep import BalanceSweep, writeTable
+from batchsim import BatchBattleSimulator, BatchOutcome
+from cogbattle import CogBattle
+from toon import Toon, ToonCombatant
 from cog import Cog
+from cogstrategy import (
+    CogStrategy,
+    ExpectedDamageStrategy,
+    FocusFireStrategy,
+    LowestLaffStrategy,
+    RandomStrategy,
+    ThreatTable,
+)
 from gag import Gag
-from panda3d.core import loadPrcFileData
+from gagpolicy import GreedyPolicy, MonteCarloPolicy
+from joinqueue import JoinQueue
+from lockstep import (
+    LockstepServer,
+    MessageType,
+    WireFormat,
+    encodeAction,
+    readMessages,
+    runLoad,
+)
+from panda3d.core import NodePath, loadPrcFileData
+import asyncio
+import io
+import json
+import os
+import random
+import statistics
+import sqlite3
+import tempfile
 import unittest
 from direct.task.TaskManagerGlobal import taskMgr
 
@@ -21,6 +87,14 @@ class TestCogBattle(unittest.TestCase):
         self.cogBattleFSM = self.cogBattle.cogBattleFSM
         self.cogBattle.startCogBattle()
 
+    def test_demo_adds_a_new_toon_each_press(self):
+        battle = self.demo.cogBattle
+        for _ in range(2):
+            self.demo.messenger.send("t")
+        toons = [toon.toon for toon in battle.toons + battle.pendingToons]
+        self.assertEqual(len(toons), 3)
+        self.assertEqual(len(set(map(id, toons))), 3)
+
     def test_start_cog_battle_state(self):
         self.assertEqual(self.cogBattleFSM.state, CogBattleState.GAG_SELECT)
 
@@ -149,6 +223,1315 @@ class TestCogBattle(unittest.TestCase):
         self.cogBattle.selectTarget(2)
         self.assertEqual(self.cogBattleFSM.state, CogBattleState.GAG_SELECT)
 
+    def test_joins_in_one_frame_reset_timer_once(self):
+        self.cogBattle.requestToonJoin(Toon())
+        self.cogBattle.requestCogJoin(Cog())
+        addPendingTask = self.cogBattleFSM.addPendingTask
+        self.assertIsNotNone(addPendingTask)
+        self.cogBattle.requestToonJoin(Toon())
+        self.assertIs(self.cogBattleFSM.addPendingTask, addPendingTask)
+        taskMgr.step()
+        self.assertIsNone(self.cogBattleFSM.addPendingTask)
+        self.assertEqual(len(self.cogBattle.toons), 3)
+        self.assertEqual(len(self.cogBattle.cogs), 2)
+
+    def test_gag_select_deadline(self):
+        cogBattle = CogBattle([Toon()], [Cog()], deterministic=True)
+        cogBattle.GAG_SELECT_WAIT_TIME = 0
+        cogBattle.startCogBattle()
+        taskMgr.step()
+        taskMgr.step()
+        self.assertGreater(cogBattle.round, 1)
+        cogBattle.cogBattleFSM.stopGagSelectTimer()
+
+
+class TestCogBattleSnapshot(unittest.TestCase):
+    def test_restore_into_gag_select(self):
+        cogBattle = CogBattle([Toon()], [Cog()], deterministic=True)
+        cogBattle.startCogBattle()
+        snapshot = cogBattle.snapshot()
+        cogBattle.selectGag(Gag.THROW)
+        self.assertEqual(cogBattle.cogs[0].health, 6)
+
+        cogBattle.restore(snapshot)
+        self.assertEqual(
+            cogBattle.cogBattleFSM.state, CogBattleState.GAG_SELECT
+        )
+        self.assertEqual(cogBattle.cogs[0].health, 12)
+        cogBattle.selectGag(Gag.SQUIRT)
+        self.assertEqual(cogBattle.cogs[0].health, 8)
+        self.assertEqual(cogBattle.round, 2)
+        cogBattle.cogBattleFSM.stopGagSelectTimer()
+
+
+class TestBattleEngine(unittest.TestCase):
+    def setUp(self):
+        self.engine = BattleEngine([Toon()], [Cog()], deterministic=True)
+        self.engine.start()
+
+    def test_start_state(self):
+        self.assertEqual(self.engine.state, CogBattleState.GAG_SELECT)
+        self.assertEqual(self.engine.round, 1)
+
+    def test_step_executes_round(self):
+        squirt = BattleAction(BattleActionType.SELECT_GAG, Gag.SQUIRT)
+        self.assertEqual(self.engine.step([squirt]), CogBattleState.GAG_SELECT)
+        self.assertEqual(self.engine.round, 2)
+        self.assertEqual(self.engine.cogs[0].health, 8)
+        self.assertEqual(self.engine.toons[0].health, 13)
+
+    def test_step_timeout_skips_toons(self):
+        for _ in range(7):
+            self.engine.step(timedOut=True)
+        self.assertEqual(
+            self.engine.step(timedOut=True), CogBattleState.COGS_WON
+        )
+        self.assertTrue(self.engine.isOver())
+
+    def test_step_timeout_after_full_round_is_ignored(self):
+        sink = BufferedEventSink()
+        self.engine.eventSink = sink
+        squirt = BattleAction(BattleActionType.SELECT_GAG, Gag.SQUIRT)
+        self.engine.step([squirt], timedOut=True)
+        self.assertEqual(self.engine.round, 2)
+        self.assertEqual(self.engine.toons[0].health, 13)
+        self.assertNotIn(
+            BattleEventType.TIMEOUT, [event.eventType for event in sink.events]
+        )
+
+    def test_step_join_is_immediate(self):
+        self.engine.step(
+            [
+                BattleAction(BattleActionType.TOON_JOIN, Toon()),
+                BattleAction(BattleActionType.SELECT_GAG, Gag.THROW),
+                BattleAction(BattleActionType.SELECT_GAG, Gag.THROW),
+            ]
+        )
+        self.assertEqual(len(self.engine.toons), 2)
+        self.assertEqual(self.engine.state, CogBattleState.TOONS_WON)
+
+    def test_step_after_battle_does_nothing(self):
+        throw = BattleAction(BattleActionType.SELECT_GAG, Gag.THROW)
+        self.engine.step([throw, throw])
+        self.assertEqual(self.engine.step([throw]), CogBattleState.TOONS_WON)
+
+    def test_group_damage_skips_defeated_target(self):
+        engine = BattleEngine([Toon()] * 3, [Cog(), Cog()], deterministic=True)
+        engine.start()
+        engine.cogs[0].health = 4
+        for toon in engine.toons:
+            toon.selectedGag = Gag.THROW
+            toon.selectedTarget = engine.cogs[0].combatantId
+        engine.toons[2].selectedTarget = engine.cogs[1].combatantId
+        self.assertEqual(
+            engine.groupDamage(Gag.THROW, engine.toons),
+            {engine.cogs[0]: 6, engine.cogs[1]: 6},
+        )
+        cog = engine.cogs[1]
+        engine.executeGags()
+        self.assertEqual(engine.cogs, [cog])
+        self.assertEqual(cog.health, 6)
+
+    def test_combatants_are_slotted(self):
+        self.assertFalse(hasattr(self.engine.toons[0], "__dict__"))
+        self.assertFalse(hasattr(self.engine.cogs[0], "__dict__"))
+
+    def test_defeated_cogs_are_removed_in_place(self):
+        cogs = self.engine.cogs
+        self.engine.step(
+            [
+                BattleAction(BattleActionType.COG_JOIN, Cog()),
+                BattleAction(BattleActionType.SELECT_GAG, Gag.THROW),
+                BattleAction(BattleActionType.SELECT_TARGET, 1),
+            ]
+        )
+        self.engine.step(
+            [
+                BattleAction(BattleActionType.SELECT_GAG, Gag.THROW),
+                BattleAction(BattleActionType.SELECT_TARGET, 1),
+            ]
+        )
+        self.assertIs(self.engine.cogs, cogs)
+        self.assertEqual([cog.health for cog in cogs], [12])
+
+    def test_targets_follow_cogs_whose_index_shifts(self):
+        engine = BattleEngine(
+            [Toon(), Toon()], [Cog() for _ in range(3)], deterministic=True
+        )
+        engine.start()
+        engine.cogs[0].health = 1
+        last = engine.cogs[2]
+        engine.selectGag(Gag.THROW)
+        engine.selectTarget(0)
+        engine.selectGag(Gag.THROW)
+        engine.selectTargetById(last.combatantId)
+        self.assertEqual(engine.round, 2)
+        self.assertIs(engine.cogs[1], last)
+        self.assertIs(engine.cogById(last.combatantId), last)
+        self.assertEqual(last.health, Cog().health - Gag.DAMAGE[Gag.THROW])
+
+    def test_invalid_targets_are_ignored(self):
+        engine = BattleEngine([Toon()], [Cog(), Cog()], deterministic=True)
+        engine.start()
+        engine.selectGag(Gag.THROW)
+        engine.selectTarget(-1)
+        engine.selectTargetById(engine.nextCombatantId)
+        self.assertEqual(
+            engine.toons[0].selectedTarget, ToonCombatant.NO_TARGET
+        )
+        self.assertEqual(engine.round, 1)
+
+    def test_raid_battle_holds_larger_rosters(self):
+        engine = BattleEngine(
+            [Toon() for _ in range(4)],
+            [Cog() for _ in range(4)],
+            maxToons=32,
+            maxCogs=32,
+        )
+        engine.start()
+        for _ in range(28):
+            self.assertTrue(engine.requestCogJoin(Cog()))
+        engine.addPendingCombatants()
+        self.assertFalse(engine.canCogJoin())
+        self.assertEqual(len(engine.cogSlots), 32)
+        self.assertEqual(
+            len({cog.combatantId for cog in engine.cogs + engine.toons}), 36
+        )
+
+
+class TestBatchBattleSimulator(unittest.TestCase):
+    def test_passing_toon_always_loses(self):
+        simulator = BatchBattleSimulator([Gag.PASS], 1, seed=0)
+        result = simulator.simulate(1000)
+        self.assertEqual(result.cogWinRate(), 1.0)
+        self.assertGreaterEqual(min(result.roundsHistogram()), 5)
+
+    def test_double_throw_first_round_rate(self):
+        simulator = BatchBattleSimulator([Gag.THROW, Gag.THROW], 1, seed=0)
+        result = simulator.simulate(20000, chunkSize=5000)
+        firstRound = result.roundsHistogram(BatchOutcome.TOONS_WON)[1]
+        self.assertAlmostEqual(firstRound / len(result), 0.75, delta=0.02)
+
+    def test_same_seed_same_result(self):
+        gags = [Gag.SQUIRT, Gag.THROW]
+        first = BatchBattleSimulator(gags, 3, randomTargets=True, seed=7)
+        second = BatchBattleSimulator(gags, 3, randomTargets=True, seed=7)
+        self.assertTrue(
+            (first.simulate(500).rounds == second.simulate(500).rounds).all()
+        )
+
+
+class TestBattleFarm(unittest.TestCase):
+    def test_same_seed_any_worker_count(self):
+        farm = BattleFarm([Gag.SQUIRT, Gag.THROW], 2, seed=3, shardSize=50)
+        inProcess = farm.run(200, maxWorkers=1)
+        multiProcess = farm.run(200, maxWorkers=2)
+        self.assertEqual(inProcess.battles, 200)
+        self.assertEqual(inProcess, multiProcess)
+
+    def test_different_seeds_differ(self):
+        gags = [Gag.SQUIRT, Gag.THROW]
+        first = BattleFarm(gags, 2, seed=1).run(300, maxWorkers=1)
+        second = BattleFarm(gags, 2, seed=2).run(300, maxWorkers=1)
+        self.assertNotEqual(first, second)
+
+    def test_matches_outcome_solver(self):
+        stats = BattleFarm([Gag.SQUIRT], 2, seed=1).run(4000, maxWorkers=1)
+        solved = OutcomeSolver([Gag.SQUIRT], [Cog(), Cog()]).solve()
+        rounds = sum(r * n for r, n in stats.rounds.items()) / stats.battles
+        self.assertAlmostEqual(
+            stats.toonWinRate(), solved.toonWinChance, delta=0.03
+        )
+        self.assertAlmostEqual(rounds, solved.expectedRounds, delta=0.15)
+
+    def test_mixed_gags_match_outcome_solver(self):
+        cogs = [Cog() for _ in range(3)]
+        solved = OutcomeSolver([Gag.PASS, Gag.THROW], cogs).solve()
+        for toonGags in ([Gag.PASS, Gag.THROW], [Gag.THROW, Gag.PASS]):
+            stats = BattleFarm(toonGags, 3, seed=1).run(4000, maxWorkers=1)
+            self.assertAlmostEqual(
+                stats.toonWinRate(), solved.toonWinChance, delta=0.03
+            )
+
+
+class TestBattleServer(unittest.TestCase):
+    def test_deadline_heap_skips_rescheduled(self):
+        deadlines = DeadlineHeap()
+        deadlines.schedule(1, 5.0)
+        deadlines.schedule(2, 3.0)
+        deadlines.schedule(2, 10.0)
+        deadlines.cancel(3)
+        self.assertEqual(deadlines.nextDeadline(), 5.0)
+        self.assertEqual(deadlines.popExpired(6.0), [1])
+        self.assertEqual(deadlines.popExpired(20.0), [2])
+        self.assertEqual(len(deadlines), 0)
+
+    def test_requests_advance_battle(self):
+        server = BattleServer(seed=0)
+        battleId = server.handleRequest({"op": "createBattle"})["battle"]
+        server.handleRequest({"op": "requestToonJoin", "battle": battleId})
+        server.handleRequest(
+            {"op": "selectGag", "battle": battleId, "value": Gag.THROW}
+        )
+        response = server.handleRequest(
+            {"op": "selectGag", "battle": battleId, "value": Gag.THROW}
+        )
+        self.assertEqual(response["round"], 2)
+        self.assertIn("error", server.handleRequest({"op": "selectGag"}))
+
+    def test_joins_wait_for_batch_or_round(self):
+        server = BattleServer(seed=0)
+        battleId = server.createBattle(numToons=2)
+        battle = server.battles[battleId]
+        server.handleRequest({"op": "requestToonJoin", "battle": battleId})
+        server.handleRequest(
+            {"op": "selectGag", "battle": battleId, "value": Gag.THROW}
+        )
+        self.assertEqual((len(battle.toons), len(battle.pendingToons)), (2, 1))
+        self.assertIn(battleId, server.joinFlushes)
+        server.handleRequest(
+            {"op": "selectGag", "battle": battleId, "value": Gag.THROW}
+        )
+        self.assertEqual(battle.round, 2)
+        self.assertEqual((len(battle.toons), len(battle.pendingToons)), (3, 0))
+        self.assertNotIn(battleId, server.joinFlushes)
+
+    def test_invalid_requests_get_errors(self):
+        server = BattleServer(seed=0)
+        battleId = server.createBattle()
+        for request in (
+            [1],
+            "x",
+            {"op": "selectGag", "battle": battleId},
+            {"op": "selectGag", "battle": battleId, "value": Gag.NONE},
+            {"op": "selectGag", "battle": battleId, "value": 99},
+            {"op": "selectTarget", "battle": battleId, "value": 1},
+            {"op": "selectTarget", "battle": battleId, "value": True},
+        ):
+            self.assertIn("error", server.handleRequest(request))
+        self.assertEqual(server.battles[battleId].selectedGagTurn, 0)
+
+    def test_create_battle_validates_counts(self):
+        server = BattleServer(seed=0)
+        for toons in (0, -1, "2", 1.5, None):
+            response = server.handleRequest(
+                {"op": "createBattle", "toons": toons}
+            )
+            self.assertIn("error", response)
+        self.assertEqual(server.battles, {})
+        battleId = server.handleRequest(
+            {"op": "createBattle", "toons": 10, "cogs": 10}
+        )["battle"]
+        battle = server.battles[battleId]
+        self.assertEqual(
+            (len(battle.toons), len(battle.cogs)),
+            (
+                BattleEngine.MAX_TOONS_IN_BATTLE,
+                BattleEngine.MAX_COGS_IN_BATTLE,
+            ),
+        )
+
+    def test_deadline_times_out_gag_select(self):
+        server = BattleServer(waitTime=0.02, seed=0)
+        battleId = server.createBattle()
+
+        async def waitForTimeout():
+            timers = asyncio.ensure_future(server.runTimers())
+            await asyncio.sleep(0.05)
+            timers.cancel()
+
+        asyncio.run(waitForTimeout())
+        self.assertGreater(server.timeouts, 0)
+        self.assertGreater(server.battles[battleId].round, 1)
+
+
+class TestBattleLog(unittest.TestCase):
+    def setUp(self):
+        self.sink = BufferedEventSink()
+        self.engine = BattleEngine(
+            [Toon()], [Cog()], deterministic=True, eventSink=self.sink
+        )
+        self.engine.start()
+
+    def test_buffered_sink_records_round(self):
+        self.engine.selectGag(Gag.THROW)
+        eventTypes = [event.eventType for event in self.sink.events]
+        self.assertEqual(eventTypes[0], BattleEventType.START)
+        self.assertIn(BattleEventType.HIT, eventTypes)
+        self.assertIn(
+            BattleEvent(
+                BattleEventType.DAMAGE, BattleEventSubject.COG, None, 6
+            ),
+            self.sink.events,
+        )
+        self.assertEqual(
+            self.sink.events[-1],
+            BattleEvent(
+                BattleEventType.STATE,
+                BattleEventSubject.BATTLE,
+                None,
+                CogBattleState.GAG_SELECT,
+            ),
+        )
+
+    def test_file_sink_writes_in_batches(self):
+        file = io.StringIO()
+        sink = FileEventSink(file, batchSize=3)
+        for i in range(4):
+            sink.emit(
+                BattleEventType.TIMER, BattleEventSubject.BATTLE, value=i
+            )
+        self.assertEqual(len(file.getvalue().splitlines()), 3)
+        sink.flush()
+        lines = file.getvalue().splitlines()
+        self.assertEqual(json.loads(lines[3]), ["Timer", "Battle", None, 3])
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "battles.cbr")
+        self.finalStates = []
+        writer = ReplayWriter.open(self.path, chunkSize=64)
+        rng = random.Random(4)
+        for _ in range(20):
+            battle = writer.recordBattle([Toon()], [Cog(), Cog()], rng=rng)
+            battle.start()
+            while not battle.isOver():
+                battle.step(
+                    [
+                        BattleAction(BattleActionType.SELECT_GAG, Gag.SQUIRT),
+                        BattleAction(BattleActionType.SELECT_TARGET, 1),
+                    ],
+                    timedOut=True,
+                )
+            writer.endBattle()
+            self.finalStates.append((battle.state, battle.round))
+        writer.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_replay_matches_recording(self):
+        with ReplayReader(self.path) as reader:
+            replayed = [
+                BattleReplayer(records).replay()
+                for records in reader.battles()
+            ]
+        self.assertEqual(
+            [(battle.state, battle.round) for battle in replayed],
+            self.finalStates,
+        )
+
+    def test_record_with_counter_rng(self):
+        def play(battle):
+            battle.start()
+            while not battle.isOver():
+                battle.step(
+                    [BattleAction(BattleActionType.SELECT_GAG, Gag.SQUIRT)],
+                    timedOut=True,
+                )
+            return battle.state, battle.round, len(battle.defeatedCogs)
+
+        path = os.path.join(self.directory.name, "counter.cbr")
+        writer = ReplayWriter.open(path)
+        recorded = play(
+            writer.recordBattle([Toon()], [Cog(), Cog()], rng=CounterRng(9))
+        )
+        writer.endBattle()
+        writer.close()
+        self.assertEqual(
+            recorded,
+            play(BattleEngine([Toon()], [Cog(), Cog()], rng=CounterRng(9))),
+        )
+        with ReplayReader(path) as reader:
+            replayed = BattleReplayer(next(reader.battles())).replay()
+        self.assertEqual((replayed.state, replayed.round), recorded[:2])
+
+    def test_replay_detects_divergence(self):
+        with ReplayReader(self.path) as reader:
+            records = next(reader.battles())
+        tampered = [
+            (
+                record._replace(value=record.value + 1)
+                if record.recordType == ReplayRecordType.DAMAGE
+                else record
+            )
+            for record in records
+        ]
+        with self.assertRaises(ReplayError):
+            BattleReplayer(tampered).replay()
+
+
+class TestBattleTables(unittest.TestCase):
+    ROWS = {
+        "gags": [
+            {
+                "name": "Pass",
+                "track": "Pass",
+                "level": 0,
+                "damage": 0,
+                "chanceToHit": 0.0,
+                "targetRequired": 0,
+                "executeOrder": 0,
+            },
+            {
+                "name": "Pie",
+                "track": "Throw",
+                "level": 2,
+                "damage": 10,
+                "chanceToHit": 0.7,
+                "targetRequired": 1,
+                "executeOrder": 1,
+            },
+        ],
+        "cogs": [{"suit": "Flunky", "level": 2, "health": 20}],
+        "cogAttacks": [
+            {
+                "suit": "Flunky",
+                "level": 2,
+                "name": "Pound Key",
+                "damage": 4,
+                "chanceToHit": 0.5,
+            }
+        ],
+    }
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "tables.json")
+        with open(self.path, "w") as file:
+            json.dump(self.ROWS, file)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_default_tables_match_gags(self):
+        self.assertEqual((Gag.PASS, Gag.SQUIRT, Gag.THROW), (1, 2, 3))
+        self.assertEqual(Gag.DAMAGE[Gag.SQUIRT], 4)
+        self.assertEqual(Gag.DAMAGE[Gag.THROW], 6)
+        self.assertEqual(Gag.EXECUTE_ORDER, [Gag.SQUIRT, Gag.THROW])
+        self.assertEqual(Cog().health, 12)
+
+    def test_load_json_tables(self):
+        tables = loadBattleTables(self.path)
+        pie = tables.gagId("Pie")
+        self.assertEqual(tables.gagDamage[pie], 10)
+        self.assertEqual(tables.gagTargetRequired, [pie])
+        cogType = tables.cogType("Flunky", 2)
+        self.assertEqual(tables.cogHealth[cogType], 20)
+        attack = tables.cogAttackId(cogType, "Pound Key")
+        self.assertEqual(tables.cogAttackDamage[attack], 4)
+
+    def test_cache_is_invalidated_when_source_changes(self):
+        loadBattleTables(self.path)
+        self.assertTrue(os.path.exists(self.path + ".cache"))
+        self.assertEqual(
+            sorted(os.listdir(self.directory.name)),
+            ["tables.json", "tables.json.cache"],
+        )
+        rows = dict(
+            self.ROWS, cogs=[{"suit": "Flunky", "level": 2, "health": 200}]
+        )
+        with open(self.path, "w") as file:
+            json.dump(rows, file)
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        tables = loadBattleTables(self.path)
+        self.assertEqual(tables.cogHealth[0], 200)
+        self.assertIsInstance(tables, BattleTables)
+
+    def test_unreadable_cache_is_recompiled(self):
+        with open(self.path + ".cache", "wb") as file:
+            file.write(b"cbattletables\nNoSuchTables\n.")
+        tables = loadBattleTables(self.path)
+        self.assertEqual(tables.cogHealth[0], 20)
+        missing = os.path.join(self.directory.name, "missing", "tables.cache")
+        tables = loadBattleTables(self.path, cachePath=missing)
+        self.assertEqual(tables.cogHealth[0], 20)
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_results_are_json(self):
+        results = json.loads(json.dumps(runBenchmarks(scale=0.002)))
+        self.assertGreater(results["throughput"]["1v1"]["battlesPerSecond"], 0)
+        self.assertEqual(results["roundLatency"]["executeGags"]["count"], 10)
+        self.assertEqual(
+            [(m["toons"], m["cogs"]) for m in results["memory"]],
+            [(1, 1), (2, 2), (4, 4), (8, 8)],
+        )
+        self.assertEqual(
+            results["importTime"]["battleengine"]["import"]["count"], 1
+        )
+        self.assertEqual(len(results["rngRounds"]), 2)
+        self.assertEqual(len(results["cogStrategies"]), 5)
+        self.assertEqual(
+            [(r["toons"], r["cogs"]) for r in results["rosterScaling"]],
+            [(4, 4), (8, 8), (16, 16), (32, 32), (64, 64)],
+        )
+
+    def test_battle_core_imports_without_panda3d(self):
+        results = benchmarkImportTime(
+            1,
+            [
+                "battleengine",
+                "gagpolicy",
+                "battlefarm",
+                "benchmarks",
+                "cogbattle",
+            ],
+        )
+        for module in (
+            "battleengine",
+            "gagpolicy",
+            "battlefarm",
+            "benchmarks",
+        ):
+            self.assertFalse(results[module]["loadsPanda3D"], module)
+        self.assertTrue(results["cogbattle"]["loadsPanda3D"])
+
+    def test_compare_results(self):
+        baseline = {"throughput": {"1v1": {"battlesPerSecond": 1000}}}
+        results = {"throughput": {"1v1": {"battlesPerSecond": 700}}}
+        self.assertEqual(len(compareResults(baseline, results, 0.2)), 1)
+        self.assertEqual(compareResults(baseline, results, 0.5), [])
+
+
+class TestOutcomeSolver(unittest.TestCase):
+    def test_matches_simulation(self):
+        solved = OutcomeSolver([Gag.SQUIRT, Gag.THROW], [Cog(), Cog()]).solve()
+        result = BatchBattleSimulator(
+            [Gag.SQUIRT, Gag.THROW], 2, seed=3
+        ).simulate(100000)
+        self.assertAlmostEqual(solved.toonWinChance + solved.cogWinChance, 1.0)
+        self.assertAlmostEqual(
+            solved.toonWinChance, result.toonWinRate(), delta=0.005
+        )
+        self.assertAlmostEqual(
+            solved.expectedRounds, result.rounds.mean(), delta=0.05
+        )
+
+    def test_random_targets_match_simulation(self):
+        solved = OutcomeSolver(
+            [Gag.THROW], [Cog(), Cog()], randomTargets=True
+        ).solve()
+        result = BatchBattleSimulator(
+            [Gag.THROW], 2, randomTargets=True, seed=3
+        ).simulate(100000)
+        self.assertAlmostEqual(
+            solved.toonWinChance, result.toonWinRate(), delta=0.005
+        )
+
+    def test_passing_toon_always_loses(self):
+        solved = OutcomeSolver([Gag.PASS], [Cog()]).solve()
+        self.assertEqual(solved.toonWinChance, 0.0)
+        self.assertAlmostEqual(solved.cogWinChance, 1.0)
+
+    def test_cache_is_bounded(self):
+        solver = OutcomeSolver([Gag.THROW, Gag.THROW], [Cog(), Cog()])
+        unbounded = solver.solve()
+        solver = OutcomeSolver(
+            [Gag.THROW, Gag.THROW], [Cog(), Cog()], cacheSize=200
+        )
+        self.assertAlmostEqual(
+            solver.solve().toonWinChance, unbounded.toonWinChance
+        )
+        self.assertLessEqual(len(solver.cache), 200)
+
+
+class TestGagPolicy(unittest.TestCase):
+    def setUp(self):
+        self.engine = BattleEngine(
+            [Toon(), Toon()], [Cog(), Cog()], rng=random.Random(2)
+        )
+        self.engine.start()
+
+    def test_greedy_finishes_committed_cog(self):
+        self.engine.cogs[1].health = 4
+        GreedyPolicy().play(self.engine)
+        self.assertEqual(
+            self.engine.toons[0].selectedTarget,
+            self.engine.cogs[1].combatantId,
+        )
+        self.assertEqual(self.engine.toons[0].selectedGag, Gag.SQUIRT)
+
+    def test_bots_finish_battle(self):
+        policy = MonteCarloPolicy(timeBudget=0.001, seed=0)
+        while not self.engine.isOver():
+            policy.play(self.engine)
+        self.assertGreater(policy.playouts, 0)
+
+    def test_transposition_table_reuses_position(self):
+        policy = MonteCarloPolicy(timeBudget=0.001, seed=0)
+        policy.choose(self.engine)
+        playouts = policy.playouts
+        policy.choose(self.engine)
+        self.assertEqual(len(policy.table), 1)
+        stats = policy.table[policy.positionKey(self.engine)]
+        self.assertEqual(
+            sum(count for count, _ in stats.values()), policy.playouts
+        )
+        self.assertGreater(policy.playouts, playouts)
+
+    def test_playouts_use_battle_strategy_and_pending(self):
+        policy = MonteCarloPolicy(timeBudget=0.001, seed=0)
+        key = policy.positionKey(self.engine)
+        self.engine.cogStrategy = FocusFireStrategy()
+        self.assertNotEqual(policy.positionKey(self.engine), key)
+        policy.choose(self.engine)
+        self.assertIs(policy.scratch.cogStrategy, self.engine.cogStrategy)
+        key = policy.positionKey(self.engine)
+        self.engine.requestCogJoin(Cog())
+        self.assertNotEqual(policy.positionKey(self.engine), key)
+
+
+class TestBalanceSweep(unittest.TestCase):
+    SPEC = {
+        "toonGags": [["Throw"], ["Squirt", "Throw"]],
+        "numCogs": [1, 2],
+        "gagDamage": {"Throw": [5, 6]},
+        "battles": 500,
+    }
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_grid(self):
+        rows = BalanceSweep(self.SPEC).run()
+        self.assertEqual(len(rows), 8)
+        self.assertEqual(
+            set(rows[0]),
+            {
+                "toonGags",
+                "numCogs",
+                "gagDamage.Throw",
+                "toonWinRate",
+                "cogWinRate",
+                "meanRounds",
+            },
+        )
+        table = io.StringIO()
+        writeTable(rows, table)
+        self.assertEqual(len(table.getvalue().splitlines()), 9)
+
+    def test_only_changed_points_are_recomputed(self):
+        first = BalanceSweep(self.SPEC, self.directory.name)
+        rows = first.run()
+        self.assertEqual((first.computed, first.cached), (8, 0))
+
+        second = BalanceSweep(self.SPEC, self.directory.name)
+        self.assertEqual(second.run(), rows)
+        self.assertEqual((second.computed, second.cached), (0, 8))
+
+        changed = BalanceSweep(
+            dict(self.SPEC, gagDamage={"Throw": [6, 7]}), self.directory.name
+        )
+        changed.run()
+        self.assertEqual((changed.computed, changed.cached), (4, 4))
+
+
+class TestBattleSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.engine = BattleEngine(
+            [Toon(), Toon()], [Cog(), Cog(), Cog()], rng=random.Random(1)
+        )
+        self.engine.start()
+        self.engine.requestCogJoin(Cog())
+        self.engine.selectGag(Gag.THROW)
+        self.engine.selectTarget(2)
+
+    def playOut(self, engine, seed):
+        engine.rng.seed(seed)
+        while not engine.isOver():
+            engine.step(
+                [
+                    BattleAction(BattleActionType.SELECT_GAG, Gag.SQUIRT),
+                    BattleAction(BattleActionType.SELECT_TARGET, 0),
+                ],
+                timedOut=True,
+            )
+        return (
+            engine.state,
+            engine.round,
+            [toon.health for toon in engine.toons],
+            [cog.health for cog in engine.cogs],
+        )
+
+    def test_bytes_round_trip(self):
+        snapshot = self.engine.snapshot()
+        data = snapshot.toBytes()
+        self.assertEqual(BattleSnapshot.fromBytes(data), snapshot)
+        self.assertEqual(len(data), 19 + 2 * 8 + 4 * 8)
+        with self.assertRaises(ValueError):
+            BattleSnapshot.fromBytes(data[:-1])
+
+    def test_bytes_round_trip_large_rosters(self):
+        engine = BattleEngine(
+            [Toon() for _ in range(300)],
+            [Cog() for _ in range(200)],
+            maxToons=300,
+            maxCogs=200,
+        )
+        engine.start()
+        engine.selectGag(Gag.THROW)
+        engine.selectTarget(150)
+        snapshot = engine.snapshot()
+        self.assertEqual(snapshot.toons[0].selectedTarget, 150)
+        self.assertEqual(snapshot.toons[1].selectedTarget, -1)
+        self.assertEqual(
+            BattleSnapshot.fromBytes(snapshot.toBytes()), snapshot
+        )
+        farTarget = snapshot.toons[0]._replace(selectedTarget=65534)
+        snapshot = snapshot._replace(toons=(farTarget,) + snapshot.toons[1:])
+        self.assertEqual(
+            BattleSnapshot.fromBytes(snapshot.toBytes()), snapshot
+        )
+
+    def test_restore_resumes_identically(self):
+        snapshot = self.engine.snapshot()
+        first = self.playOut(self.engine, 9)
+        self.engine.restore(snapshot)
+        self.assertEqual(
+            self.engine.toons[0].selectedTarget,
+            self.engine.cogs[2].combatantId,
+        )
+        self.assertEqual(self.playOut(self.engine, 9), first)
+
+        branch = BattleEngine([], [], rng=random.Random())
+        branch.restore(BattleSnapshot.fromBytes(snapshot.toBytes()))
+        self.assertEqual(self.playOut(branch, 9), first)
+
+    def test_snapshots_share_unchanged_combatants(self):
+        first = self.engine.snapshot()
+        self.engine.cogs[1].health = 1
+        second = self.engine.snapshot()
+        self.assertIs(second.toons, first.toons)
+        self.assertIs(second.cogs[0], first.cogs[0])
+        self.assertIsNot(second.cogs[1], first.cogs[1])
+        self.assertIs(second.pendingCogs, first.pendingCogs)
+
+
+class TestBattleProfiler(unittest.TestCase):
+    def test_times_engine_phases(self):
+        profiler = BattleProfiler()
+        server = BattleServer(seed=1, profiler=profiler)
+        battle = server.battles[server.createBattle(2, 2)]
+        while not battle.isOver():
+            battle.step(
+                [BattleAction(BattleActionType.SELECT_GAG, Gag.THROW)] * 2,
+                timedOut=True,
+            )
+        snapshot = profiler.snapshot()
+        self.assertEqual(snapshot["executeGags"]["count"], battle.round)
+        self.assertEqual(snapshot["timeOut"]["count"], battle.round)
+        self.assertGreater(snapshot["attackToons"]["count"], 0)
+
+        dump = profiler.toPrometheus()
+        self.assertIn(
+            'cogbattle_phase_seconds_bucket{phase="executeGags",le="+Inf"} '
+            f"{battle.round}",
+            dump,
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "battles.prom")
+            profiler.writePrometheus(path)
+            with open(path) as file:
+                self.assertEqual(file.read(), dump)
+
+    def test_unattached_battle_is_untouched(self):
+        battle = BattleEngine([Toon()], [Cog()])
+        self.assertNotIn("executeGags", vars(battle))
+        BattleProfiler().attach(battle)
+        self.assertIn("executeGags", vars(battle))
+
+    def test_times_fsm_states(self):
+        profiler = BattleProfiler()
+        cogBattle = CogBattle([Toon()], [Cog()], deterministic=True)
+        profiler.attach(cogBattle)
+        cogBattle.startCogBattle()
+        cogBattle.selectGag(Gag.SQUIRT)
+        cogBattle.cogBattleFSM.stopGagSelectTimer()
+        snapshot = profiler.snapshot()
+        self.assertEqual(snapshot["fsm.enterGagSelect"]["count"], 2)
+        self.assertEqual(snapshot["fsm.inGagSelect"]["count"], 1)
+        self.assertEqual(snapshot["fsm.enterCogsAttack"]["count"], 1)
+        self.assertEqual(snapshot["fsm.startGagSelectTimer"]["count"], 2)
+
+    def test_histogram_buckets(self):
+        histogram = LatencyHistogram()
+        for latency in (500, 1000, 1001, 10**12):
+            histogram.record(latency)
+        self.assertEqual(
+            histogram.snapshot()["buckets"], [[1.0, 2], [2.0, 1], [None, 1]]
+        )
+
+
+class TestJoinQueue(unittest.TestCase):
+    def setUp(self):
+        self.engine = BattleEngine(
+            [Toon() for _ in range(4)],
+            [Cog() for _ in range(4)],
+            deterministic=True,
+            joinQueue=JoinQueue(maxWaiting=1),
+        )
+        self.engine.start()
+
+    def test_full_battle_queues_then_rejects(self):
+        self.assertTrue(self.engine.requestCogJoin(Cog()))
+        self.assertFalse(self.engine.requestCogJoin(Cog()))
+        self.assertEqual(len(self.engine.joinQueue.waitingCogs), 1)
+        self.assertEqual(self.engine.pendingCogs, [])
+        stats = self.engine.joinQueue.stats.asDict()
+        self.assertEqual(
+            (stats["requested"], stats["waited"], stats["rejected"]),
+            (2, 1, 1),
+        )
+
+    def test_waiting_cog_joins_once_there_is_room(self):
+        self.engine.requestCogJoin(Cog())
+        self.engine.cogs[0].health = 1
+        self.engine.step(
+            [
+                BattleAction(BattleActionType.SELECT_GAG, Gag.THROW),
+                BattleAction(BattleActionType.SELECT_TARGET, 0),
+            ]
+        )
+        self.engine.step(timedOut=True)
+        self.assertEqual(self.engine.round, 2)
+        self.assertEqual(len(self.engine.joinQueue.waitingCogs), 0)
+        self.assertEqual(len(self.engine.pendingCogs), 1)
+        self.engine.step()
+        self.assertEqual(len(self.engine.cogs), 4)
+        self.assertEqual(self.engine.joinQueue.stats.admitted, 1)
+
+    def test_joins_restart_gag_select_a_limited_number_of_times(self):
+        cogBattle = CogBattle(
+            [Toon()],
+            [Cog()],
+            deterministic=True,
+            joinQueue=JoinQueue(maxTimerResets=2),
+        )
+        cogBattle.startCogBattle()
+        for _ in range(3):
+            cogBattle.requestToonJoin(Toon())
+            taskMgr.step()
+        cogBattle.cogBattleFSM.stopGagSelectTimer()
+        stats = cogBattle.joinQueue.stats
+        self.assertEqual(len(cogBattle.toons), 4)
+        self.assertEqual((stats.timerResets, stats.resetsSkipped), (2, 1))
+
+    def test_server_batches_joins(self):
+        server = BattleServer(seed=0, joinWindow=10.0)
+        battleId = server.createBattle()
+        for _ in range(3):
+            server.handleRequest({"op": "requestToonJoin", "battle": battleId})
+        self.assertEqual(len(server.joinFlushes), 1)
+        server.flushJoins(battleId)
+        self.assertEqual(len(server.battles[battleId].toons), 4)
+        self.assertEqual(server.joinStats.batches, 1)
+        self.assertEqual(server.joinStats.timerResets, 1)
+        server.handleRequest({"op": "requestToonJoin", "battle": battleId})
+        for _ in range(4):
+            response = server.handleRequest(
+                {"op": "requestToonJoin", "battle": battleId}
+            )
+        self.assertEqual(response["error"], "Battle is full")
+
+
+class TestLockstep(unittest.TestCase):
+    def setUp(self):
+        self.server = LockstepServer(tickRate=10, waitTime=1, seed=0)
+        self.connection = self.server.connect()
+        self.mirrors = {}
+
+    def tick(self):
+        packet = self.server.step().get(self.connection)
+        if packet is None:
+            return []
+        self.assertEqual(
+            WireFormat.PACKET.unpack_from(packet)[0],
+            len(packet) - WireFormat.PACKET.size,
+        )
+        return readMessages(packet[WireFormat.PACKET.size :], self.mirrors)
+
+    def assertMirrorsServer(self, battleId):
+        snapshot = self.server.battles[battleId].battle.snapshot()
+        mirror = self.mirrors[battleId]
+        self.assertEqual(
+            (mirror.state, mirror.round, mirror.selectedGagTurn),
+            (snapshot.state, snapshot.round, snapshot.selectedGagTurn),
+        )
+        self.assertEqual(mirror.toons, [tuple(t) for t in snapshot.toons])
+        self.assertEqual(mirror.cogs, [tuple(c[:2]) for c in snapshot.cogs])
+
+    def test_actions_are_applied_on_the_next_tick(self):
+        message = encodeAction(MessageType.CREATE, 1, value=2)
+        self.server.receive(self.connection, message[:3])
+        self.assertEqual(self.tick(), [])
+        self.server.receive(self.connection, message[3:])
+        created, delta = self.tick()
+        self.assertEqual(created[:2], (MessageType.CREATED, 1))
+        battleId = created[2]
+        self.assertEqual(delta, (MessageType.DELTA, battleId))
+        self.assertMirrorsServer(battleId)
+
+        self.server.receive(
+            self.connection,
+            encodeAction(MessageType.SELECT_GAG, 2, battleId, Gag.THROW)
+            + encodeAction(MessageType.SELECT_TARGET, 3, battleId, 7)
+            + encodeAction(MessageType.TOON_JOIN, 4, battleId),
+        )
+        messages = self.tick()
+        self.assertEqual(
+            [message[0] for message in messages],
+            [
+                MessageType.ACK,
+                MessageType.REJECT,
+                MessageType.ACK,
+                MessageType.DELTA,
+            ],
+        )
+        self.assertEqual(len(self.server.battles[battleId].battle.toons), 2)
+        self.assertMirrorsServer(battleId)
+        self.assertEqual(self.tick(), [])
+
+    def test_deadline_times_out_gag_select(self):
+        self.server.receive(
+            self.connection, encodeAction(MessageType.CREATE, 1, value=1)
+        )
+        battleId = self.tick()[0][2]
+        for _ in range(self.server.waitTicks):
+            self.tick()
+        self.assertEqual(self.mirrors[battleId].round, 2)
+        self.assertMirrorsServer(battleId)
+
+    def test_load_over_loopback(self):
+        async def load():
+            await self.server.start("127.0.0.1", 0)
+            port = self.server.server.sockets[0].getsockname()[1]
+            try:
+                return await runLoad(
+                    "127.0.0.1", port, numClients=20, numConnections=2
+                )
+            finally:
+                self.server.stop()
+
+        self.server.tickInterval = 0.001
+        result = asyncio.run(load())
+        self.assertEqual(result["battles"], 20)
+        self.assertGreater(result["bytesReceivedPerBattle"], 0)
+        self.assertLessEqual(result["p50Ms"], result["p99Ms"])
+        self.assertEqual(self.server.battles, {})
+
+
+class TestBattleStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "battles.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def playBattle(self, toons, store=None, gag=Gag.THROW, seed=0):
+        engine = BattleEngine(
+            toons, [Cog()], rng=random.Random(seed), store=store
+        )
+        engine.start()
+        while not engine.isOver():
+            engine.step([BattleAction(BattleActionType.SELECT_GAG, gag)] * 2)
+        return engine
+
+    def test_laff_is_written_back_to_toons(self):
+        toons = [Toon(), Toon()]
+        toons[1].laff = 1
+        engine = self.playBattle(toons, seed=6)
+        self.assertEqual(engine.state, CogBattleState.TOONS_WON)
+        self.assertEqual(toons[0].laff, engine.toons[0].health)
+        self.assertEqual(toons[1].laff, 0)
+        self.assertEqual(len(engine.defeatedCogs), 1)
+
+    def test_battles_are_written_in_batches(self):
+        store = BattleStore(self.path, batchSize=4, flushInterval=60)
+        for _ in range(10):
+            self.playBattle([Toon(), Toon()], store)
+        store.flush()
+        self.assertEqual(store.written, 10)
+        self.assertEqual(store.transactions, 3)
+        store.close()
+
+        connection = sqlite3.connect(self.path)
+        rows = connection.execute(
+            "SELECT subject, COUNT(*) FROM combatants GROUP BY subject"
+        ).fetchall()
+        outcomes = connection.execute(
+            "SELECT DISTINCT outcome FROM battles"
+        ).fetchall()
+        connection.close()
+        self.assertEqual(dict(rows), {"Toon": 20, "Cog": 10})
+        self.assertEqual(outcomes, [(CogBattleState.TOONS_WON,)])
+
+    def test_write_errors_reach_the_caller(self):
+        store = BattleStore(self.directory.name)
+        self.playBattle([Toon()], store)
+        with self.assertRaises(sqlite3.Error):
+            store.close()
+
+    def test_bad_record_does_not_stop_the_writer(self):
+        store = BattleStore(self.path, flushInterval=60)
+        store.queue.put(object())
+        with self.assertLogs("battlestore"), self.assertRaises(TypeError):
+            store.flush()
+        self.playBattle([Toon()], store)
+        store.close()
+        self.assertEqual(store.written, 1)
+
+
+class TestCounterRng(unittest.TestCase):
+    def test_blocks_match_single_rolls(self):
+        block = rollBlock(42, 3, 40, CounterRng.DRAWS_PER_ROUND)
+        for actor in (0, 17, 39):
+            for draw in range(CounterRng.DRAWS_PER_ROUND):
+                self.assertEqual(block[actor][draw], roll(42, 3, actor, draw))
+
+        rng = CounterRng(42)
+        streams = [rng.stream(actor) for actor in range(40)]
+        rng.startRound(3)
+        rolls = [streams[5].random() for _ in range(6)]
+        self.assertEqual(rolls, [roll(42, 3, 5, draw) for draw in range(6)])
+
+    def test_rolls_do_not_depend_on_other_combatants(self):
+        first, second = CounterRng(7), CounterRng(7)
+        streams = [first.stream(actor) for actor in range(2)]
+        other, stream = second.stream(0), second.stream(1)
+        first.startRound(1)
+        second.startRound(1)
+        for _ in range(3):
+            other.random()
+        self.assertEqual(stream.random(), streams[1].random())
+        self.assertNotEqual(streams[0].random(), streams[1].random())
+
+    def test_restored_round_replays_without_saving_rng_state(self):
+        engine = BattleEngine(
+            [Toon(), Toon()], [Cog(), Cog()], rng=CounterRng(11)
+        )
+        engine.start()
+        snapshot = engine.snapshot()
+        throws = [
+            BattleAction(BattleActionType.SELECT_GAG, Gag.THROW),
+            BattleAction(BattleActionType.SELECT_TARGET, 1),
+        ]
+        engine.step(throws * 2)
+        first = engine.snapshot()
+        engine.restore(snapshot)
+        engine.step(throws * 2)
+        self.assertEqual(engine.snapshot(), first)
+
+
+class TestBattleHud(unittest.TestCase):
+    def setUp(self):
+        self.hud = BattleHud(NodePath("hud"))
+        self.engine = BattleEngine(
+            [Toon(), Toon()],
+            [Cog(), Cog()],
+            deterministic=True,
+            eventSink=self.hud,
+        )
+        self.hud.track(self.engine)
+        self.engine.start()
+
+    def test_only_changed_rows_are_redrawn(self):
+        self.hud.update(0.016)
+        self.assertEqual(self.hud.rowUpdates, 5)
+        self.assertEqual(self.hud.toonRows[0].getText(), "Toon 1: 15 laff")
+        self.hud.update(0.016)
+        self.assertEqual(self.hud.rowUpdates, 5)
+
+        self.engine.selectGag(Gag.SQUIRT)
+        self.engine.selectTarget(1)
+        self.hud.update(0.016)
+        self.assertEqual(self.hud.rowUpdates, 6)
+        self.assertEqual(
+            self.hud.toonRows[0].getText(), "Toon 1: 15 laff, Squirt on cog 2"
+        )
+
+    def test_rows_are_reused_as_rosters_change(self):
+        self.hud.update(0.016)
+        rows = list(self.hud.cogRows)
+        for _ in range(2):
+            self.engine.requestCogJoin(Cog())
+        self.engine.addPendingCombatants()
+        self.hud.update(0.016)
+        self.engine.cogs[0].takeDamage(self.engine.cogs[0].health)
+        self.engine.executeGags()
+        self.hud.update(0.016)
+        self.assertEqual(self.hud.cogRows[:2], rows)
+        self.assertEqual(len(self.hud.cogRows), 4)
+        self.assertEqual(self.hud.cogRows[3].getText(), "")
+
+    def test_frame_time_overlay(self):
+        for _ in range(5):
+            self.hud.update(0.1)
+        self.assertEqual(self.hud.frames, 5)
+        self.assertTrue(
+            self.hud.frameText.getText().startswith("100.0 ms/frame (10 fps)")
+        )
+
+
+class TestCogStrategy(unittest.TestCase):
+    class CountingStrategy(RandomStrategy):
+        def __init__(self, strategy):
+            self.strategy = strategy
+            self.USES_THREATS = strategy.USES_THREATS
+            self.choices = 0
+
+        def choose(self, cog, threats):
+            self.choices += 1
+            return self.strategy.choose(cog, threats)
+
+    class CountingTable(ThreatTable):
+        builds = 0
+
+        def build(self, battle):
+            self.builds += 1
+            super().build(battle)
+
+    def attack(self, strategy, laffs=(15, 3, 15), numCogs=3):
+        toons = [Toon() for _ in laffs]
+        for toon, laff in zip(toons, laffs):
+            toon.laff = laff
+        engine = BattleEngine(
+            toons,
+            [Cog() for _ in range(numCogs)],
+            deterministic=True,
+            cogStrategy=strategy,
+        )
+        engine.threats = self.CountingTable()
+        engine.start()
+        engine.toons[-1].selectedGag = Gag.THROW
+        engine.attackToons()
+        return engine
+
+    def test_strategies_choose_targets(self):
+        for strategy, targets in (
+            (LowestLaffStrategy(), [1, 1, 0]),
+            (FocusFireStrategy(), [2, 2, 2]),
+            (ExpectedDamageStrategy(), [0, 2, 0]),
+            (RandomStrategy(), [0, 0, 0]),
+        ):
+            engine = self.attack(strategy)
+            self.assertEqual(
+                [cog.selectedTarget for cog in engine.cogs], targets
+            )
+
+    def test_lowest_laff_knocks_out_weakest_toon(self):
+        engine = self.attack(LowestLaffStrategy())
+        self.assertEqual(len(engine.defeatedToons), 1)
+        self.assertLessEqual(engine.defeatedToons[0].health, 0)
+        self.assertEqual([toon.health for toon in engine.toons], [12, 15])
+
+    def test_strategy_without_choose_cannot_be_created(self):
+        class NoChoice(CogStrategy):
+            pass
+
+        with self.assertRaises(TypeError):
+            NoChoice()
+
+    def test_each_cog_chooses_once_per_round(self):
+        for strategy, builds in (
+            (ExpectedDamageStrategy(), 1),
+            (RandomStrategy(), 0),
+        ):
+            counting = self.CountingStrategy(strategy)
+            engine = self.attack(counting, laffs=(15,) * 8, numCogs=64)
+            self.assertEqual(counting.choices, 64)
+            self.assertEqual(engine.threats.builds, builds)
+
+
+class TestBattleAnalytics(unittest.TestCase):
+    def test_accumulators_merge(self):
+        rng = random.Random(2)
+        values = [rng.gauss(10, 3) for _ in range(20000)]
+        shards = [(RunningStats(), QuantileDigest()) for _ in range(4)]
+        for i, value in enumerate(values):
+            stats, digest = shards[i % 4]
+            stats.add(value)
+            digest.add(value)
+        stats, digest = shards[0]
+        for otherStats, otherDigest in shards[1:]:
+            stats.merge(otherStats)
+            digest.merge(otherDigest)
+        self.assertEqual(stats.count, len(values))
+        self.assertAlmostEqual(stats.mean, statistics.mean(values))
+        self.assertAlmostEqual(stats.variance(), statistics.variance(values))
+        self.assertLessEqual(len(digest.centroids), digest.compression)
+        values.sort()
+        for q in (0.01, 0.5, 0.99):
+            self.assertAlmostEqual(
+                digest.quantile(q), values[int(q * len(values))], delta=0.1
+            )
+
+    def test_sharded_analytics_match_farm(self):
+        farm = BattleFarm(
+            [Gag.THROW, Gag.SQUIRT], 2, seed=5, randomTargets=True
+        )
+        farm.shardSize = 50
+        stats = farm.run(200, maxWorkers=1)
+        analytics = analyzeFarm(farm, 200, maxWorkers=1)
+        self.assertEqual(analytics.battles, stats.battles)
+        self.assertEqual(analytics.toonWins, stats.toonWins)
+        rounds = {}
+        for histogram in analytics.roundsToWin.values():
+            for count, battles in histogram.toDict().items():
+                rounds[int(count)] = rounds.get(int(count), 0) + battles
+        self.assertEqual(rounds, stats.rounds)
+        summary = analytics.summary()
+        self.assertEqual(set(summary["gagTracks"]), {"Squirt", "Throw"})
+        self.assertAlmostEqual(
+            sum(track["share"] for track in summary["cogAttacks"].values()),
+            1.0,
+        )
+        self.assertAlmostEqual(
+            sum(a["damage"] for a in summary["cogAttacks"].values()),
+            analytics.laffLoss.mean * analytics.battles,
+        )
+
+    def test_mixed_gags_match_outcome_solver(self):
+        cogs = [Cog() for _ in range(3)]
+        solved = OutcomeSolver([Gag.PASS, Gag.THROW], cogs).solve()
+        for toonGags in ([Gag.PASS, Gag.THROW], [Gag.THROW, Gag.PASS]):
+            farm = BattleFarm(toonGags, 3, seed=2)
+            analytics = analyzeFarm(farm, 4000, maxWorkers=1)
+            self.assertAlmostEqual(
+                analytics.toonWinRate(), solved.toonWinChance, delta=0.03
+            )
+
+    def test_event_logs_and_replays_agree(self):
+        with tempfile.TemporaryDirectory() as directory:
+            replayPath = os.path.join(directory, "battles.cbr")
+            logPath = os.path.join(directory, "battles.log")
+            log = FileEventSink.open(logPath)
+            writer = ReplayWriter.open(replayPath, forward=log)
+            rng = random.Random(6)
+            for _ in range(20):
+                battle = writer.recordBattle([Toon()], [Cog(), Cog()], rng=rng)
+                battle.start()
+                while not battle.isOver():
+                    battle.step(
+                        [BattleAction(BattleActionType.SELECT_GAG, Gag.THROW)],
+                        timedOut=True,
+                    )
+                writer.endBattle()
+            writer.close()
+            log.close()
+            fromLog, fromReplay = BattleAnalytics(), BattleAnalytics()
+            fromLog.consume(readEventLog(logPath))
+            fromReplay.consume(readReplayEvents(replayPath))
+        self.assertEqual(fromLog.battles, 20)
+        self.assertEqual(fromLog.summary(), fromReplay.summary())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,5 +1,6 @@
 """Copyright 2021, James S. Wang, All rights reserved."""
 
+from battlelog import BattleEventSubject, BattleEventType
 from combatant import Combatant
 from gag import Gag
 from overrides import overrides
@@ -17,6 +18,8 @@ class Toon:
             would track the toon's laff, gag level, experience, etc.
     """
 
+    __slots__ = ("laff",)
+
     def __init__(self):
         self.laff = 15
 
@@ -29,33 +32,52 @@ class ToonCombatant(Combatant):
         toon (Toon): The toon to base this combatant off of.
         deterministic (bool): Whether the combatant's actions are
             deterministic. Used for unit testing.
+        rng (random.Random): The random number generator to roll with.
 
     Attributes:
+        NO_TARGET (int): The selectedTarget of a toon without a target.
         selectedGag (int): One of the constants in the Gag class; used to
             determine which gag is used when executing an attack.
-        selectedTarget (Combatant): A target for the selectedGag, if necessary.
+        selectedTarget (int): The combatantId of the cog to use the
+            selectedGag on, or NO_TARGET.
+        toon (Toon): The toon this combatant is based off of, whose laff is
+            updated when the battle ends.
     """
 
+    SUBJECT: str = BattleEventSubject.TOON
+    NO_TARGET: int = -1
+    __slots__ = ("selectedGag", "selectedTarget", "toon")
+
     def __init__(
-        self, battle: "CogBattle", toon: Toon, deterministic: bool = False
+        self,
+        battle: "CogBattle",
+        toon: Toon,
+        deterministic: bool = False,
+        rng: random.Random = None,
     ) -> None:
-        super().__init__(battle, deterministic)
+        super().__init__(battle, deterministic, rng)
         self.health = toon.laff
         self.selectedGag: int = Gag.NONE
-        self.selectedTarget: Combatant = None
+        self.selectedTarget: int = self.NO_TARGET
+        self.toon: Toon = toon
 
     @overrides
     def executeAttack(self) -> None:
-        if self.battle.cogs and self.selectedTarget.isAlive():
-            self.selectedTarget.takeDamage(Gag.DAMAGE[self.selectedGag])
+        target = self.battle.cogById(self.selectedTarget)
+        if target is not None and target.isAlive():
+            target.takeDamage(Gag.DAMAGE[self.selectedGag])
 
     @overrides
     def isAttackHit(self) -> bool:
-        rand = random.random()
+        rand = self.rng.random()
         isHit = (
             True
             if self.isDeterministic
             else rand < 0.95 and rand < Gag.CHANCE_TO_HIT[self.selectedGag]
         )
-        print(f"The toon {'hit' if isHit else 'missed'}")
+        self.battle.eventSink.emit(
+            BattleEventType.HIT if isHit else BattleEventType.MISS,
+            self.SUBJECT,
+            value=self.selectedGag,
+        )
         return isHit
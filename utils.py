@@ -1,28 +1,37 @@
 """Copyright 2021, James S. Wang, All rights reserved."""
 
+from battlelog import BattleEventSink, BattleEventSubject, BattleEventType
+
 
 class TimePrinter:
-    """A helper class used to print a timer countdown.
+    """A helper class used to report a timer countdown.
+
+    Args:
+        eventSink (BattleEventSink): Where to report the time left.
 
     Attributes:
+        eventSink (BattleEventSink): Where to report the time left.
         secondsDisplayed (set): A set of seconds that have already been
             displayed. Makes it so that multiple calls to printTime() will only
-            print each second once.
+            report each second once.
     """
 
-    def __init__(self):
+    def __init__(self, eventSink: BattleEventSink):
+        self.eventSink: BattleEventSink = eventSink
         self.secondsDisplayed: set = set()
 
     def printTime(self, time: int) -> None:
-        """Prints the time in seconds, ensuring no duplicates.
+        """Reports the time in seconds, ensuring no duplicates.
 
         Args:
-            time (int): The time in seconds to print.
+            time (int): The time in seconds to report.
         """
         if time not in self.secondsDisplayed:
             self.secondsDisplayed.add(time)
-            print(f"Time left: {time}")
+            self.eventSink.emit(
+                BattleEventType.TIMER, BattleEventSubject.BATTLE, value=time
+            )
 
     def clear(self) -> None:
-        """Resets the cache of seconds that have already been printed."""
+        """Resets the cache of seconds that have already been reported."""
         self.secondsDisplayed.clear()